@@ -18,6 +18,17 @@
 #define C_BORED    0xD69A
 #define C_DIM      0x03E0
 
+// --- BINARY FRAMES (reference: raspy/serial_protocol.py) ---
+// 0xA5 | type | seq | len | payload | CRC-16/CCITT-FALSE (big endian)
+#define FRAME_SYNC 0xA5
+#define FRAME_MOOD 0x01
+#define FRAME_ANIM 0x02
+#define FRAME_PING 0x03
+#define FRAME_ACK  0x80
+#define STATUS_OK           0
+#define STATUS_BAD_PAYLOAD  1
+#define STATUS_UNKNOWN_TYPE 2
+
 // Global Objects
 Arduino_DataBus *bus = new Arduino_HWSPI(DC_PIN, CS_PIN, SCK_PIN, MOSI_PIN, -1);
 Arduino_GFX *gfx = new Arduino_GC9A01(bus, RST_PIN, 0, true);
@@ -32,6 +43,13 @@ bool isBlinking = false;
 uint16_t currentMainColor = C_NEUTRAL;
 uint16_t currentDimColor = C_DIM;
 
+// Receive State
+uint8_t frameBuf[4 + 255 + 2];
+uint16_t frameLen = 0;
+String textLine = "";
+uint8_t animParams[8];
+unsigned long lastAnimMs = 0;
+
 // Emotion Functions
 void emotionNeutral() { currentMainColor = C_NEUTRAL; currentDimColor = 0x03E0; }
 void emotionHappy()   { currentMainColor = C_HAPPY;   currentDimColor = 0x780F; }
@@ -39,6 +57,102 @@ void emotionAngry()   { currentMainColor = C_ANGRY;   currentDimColor = 0x7800;
 void emotionFlirty()  { currentMainColor = C_FLIRTY;  currentDimColor = 0x7BE0; }
 void emotionBored()   { currentMainColor = C_BORED;   currentDimColor = 0x0210; }
 
+uint16_t crc16(const uint8_t *data, size_t len) {
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int b = 0; b < 8; b++) crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+  }
+  return crc;
+}
+
+void sendAck(uint8_t seq, uint8_t status) {
+  uint8_t f[8] = {FRAME_SYNC, FRAME_ACK, 0, 2, seq, status, 0, 0};
+  uint16_t crc = crc16(f + 1, 5);
+  f[6] = crc >> 8;
+  f[7] = crc & 0xFF;
+  uart.write(f, sizeof(f));
+}
+
+void handleTextCommand(String msg) {
+  msg.trim(); // Remove whitespace or \r
+  Serial.println("Command Received: " + msg);
+
+  if (msg == "MOOD:happy")        emotionHappy();
+  else if (msg == "MOOD:angry")   emotionAngry();
+  else if (msg == "MOOD:flirty")  emotionFlirty();
+  else if (msg == "MOOD:bored")   emotionBored();
+  else if (msg == "MOOD:neutral") emotionNeutral();
+}
+
+void handleFrame(uint8_t type, uint8_t seq, const uint8_t *payload, uint8_t len) {
+  switch (type) {
+    case FRAME_MOOD:
+      // Same order as MOODS in serial_protocol.py
+      if (len < 1 || payload[0] > 4) { sendAck(seq, STATUS_BAD_PAYLOAD); return; }
+      switch (payload[0]) {
+        case 0: emotionNeutral(); break;
+        case 1: emotionHappy();   break;
+        case 2: emotionFlirty();  break;
+        case 3: emotionAngry();   break;
+        case 4: emotionBored();   break;
+      }
+      sendAck(seq, STATUS_OK);
+      break;
+    case FRAME_ANIM:
+      // High-rate, never acknowledged
+      memcpy(animParams, payload, min((size_t)len, sizeof(animParams)));
+      lastAnimMs = millis();
+      break;
+    case FRAME_PING:
+      sendAck(seq, STATUS_OK);
+      break;
+    default:
+      sendAck(seq, STATUS_UNKNOWN_TYPE);
+  }
+}
+
+// Collect a text line (legacy MOOD:<name> commands)
+void handleTextByte(uint8_t b) {
+  if (b == '\n') {
+    handleTextCommand(textLine);
+    textLine = "";
+  } else if (textLine.length() < 64) {
+    textLine += (char)b;
+  }
+}
+
+// Feed one received byte; frames start with FRAME_SYNC, everything else is text
+void handleByte(uint8_t b) {
+  if (frameLen == 0 && b != FRAME_SYNC) {
+    handleTextByte(b);
+    return;
+  }
+
+  frameBuf[frameLen++] = b;
+  while (frameLen >= 4) {
+    uint16_t total = 4 + frameBuf[3] + 2;
+    if (frameLen < total) return;
+
+    uint16_t crc = (frameBuf[total - 2] << 8) | frameBuf[total - 1];
+    uint16_t next = total;
+    if (crc == crc16(frameBuf + 1, total - 3)) {
+      handleFrame(frameBuf[1], frameBuf[2], frameBuf + 4, frameBuf[3]);
+    } else {
+      // Bad CRC: drop the sync byte and rescan the rest (like FrameDecoder),
+      // so a corrupted length byte does not swallow the next good frame
+      next = 1;
+    }
+
+    // Bytes before the next sync byte are text again
+    while (next < frameLen && frameBuf[next] != FRAME_SYNC) {
+      handleTextByte(frameBuf[next++]);
+    }
+    memmove(frameBuf, frameBuf + next, frameLen - next);
+    frameLen -= next;
+  }
+}
+
 void setup() {
   // Initialize Serial
   Serial.begin(115200);
@@ -78,9 +192,13 @@ void drawEye() {
   eyeX += (targetX - eyeX) * 0.12;
   eyeY += (targetY - eyeY) * 0.12;
 
+  // Lip-sync: animParams[0] is the speech loudness (0-255); fall back to
+  // rest if the Pi stopped sending
+  int pulse = (millis() - lastAnimMs < 200) ? animParams[0] * 12 / 255 : 0;
+
   // Iris, Pupil, Shards
-  canvas->fillCircle((int)eyeX, (int)eyeY, 50, currentMainColor);
-  canvas->fillCircle((int)eyeX, (int)eyeY, 22, BLACK);
+  canvas->fillCircle((int)eyeX, (int)eyeY, 50 + pulse, currentMainColor);
+  canvas->fillCircle((int)eyeX, (int)eyeY, 22 - pulse / 2, BLACK);
   canvas->drawCircle(eyeX, eyeY, 12, currentDimColor);
 
   float shardAngle = rot1 * 2.5;
@@ -107,16 +225,8 @@ void drawEye() {
 
 void loop() {
   // 1. Check for commands from Raspberry Pi
-  if (uart.available()) {
-    String msg = uart.readStringUntil('\n');
-    msg.trim(); // Remove whitespace or \r
-    Serial.println("Command Received: " + msg);
-
-    if (msg == "MOOD:happy")        emotionHappy();
-    else if (msg == "MOOD:angry")   emotionAngry();
-    else if (msg == "MOOD:flirty")  emotionFlirty();
-    else if (msg == "MOOD:bored")   emotionBored();
-    else if (msg == "MOOD:neutral") emotionNeutral();
+  while (uart.available()) {
+    handleByte(uart.read());
   }
 
   // 2. Render the eye
@@ -1,40 +1,222 @@
 import os
-import shutil
+import time
+import queue
 import logging
+import threading
+import contextvars
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 
+import tracing
+
 logger = logging.getLogger(__name__)
 
 
 class Archiver:
-    """Handle archiving of files with timestamps."""
-    
-    @staticmethod
-    def archive_file(source_file, archive_dir):
+    """
+    Archive replaced files in a background worker.
+
+    Files are moved into the archive by rename (no copy), and the archive is
+    kept within a byte budget and a maximum age by deleting the oldest files.
+    """
+
+    def __init__(self, archive_dirs=(), max_bytes=None, max_age=None):
+        """
+        Args:
+            archive_dirs: Archive directories whose existing files count
+                towards the budget
+            max_bytes: Total size of all archives (None = unlimited)
+            max_age: Seconds an archived file is kept (None = forever)
+        """
+        self.archive_dirs = list(archive_dirs)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        # (archive time, size, path), oldest first
+        self.index = deque()
+        self.size_bytes = 0
+        # (st_dev, st_ino) of every indexed file, to recognize links into the archive
+        self.inodes = set()
+        self.archived_total = 0
+        self.evicted_total = 0
+        self.evicted_bytes = 0
+
+        self.jobs = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        """Start the worker; it first indexes the existing archives."""
+        self.thread = threading.Thread(target=self._run, name="archiver", daemon=True)
+        self.thread.start()
+
+    def submit(self, current_file, archive_dir, new_file=None, data=None, name=None):
+        """
+        Queue a replacement of current_file without blocking.
+
+        The worker archives current_file (if it exists), then moves new_file
+        or writes data into its place. Jobs run in submission order.
+
+        With a name, the new file is stored in the archive right away and
+        current_file becomes a hard link to it, so its final path is known
+        when the job is submitted.
+
+        Args:
+            current_file: File to archive and replace (e.g. photo.jpg)
+            archive_dir: Directory to archive to
+            new_file: File that becomes current_file (renamed into place)
+            data: Bytes that become current_file (instead of new_file)
+            name: Archive file name for the new file
+
+        Returns:
+            Archive path of the new file if a name was given, else None
         """
-        Archive a file with timestamp.
-        
+        if not self.thread:
+            self._replace(current_file, archive_dir, new_file, data, name)
+        else:
+            # The job runs in the submitter's context so it shows up in its trace
+            context = contextvars.copy_context()
+            self.jobs.put((context, (current_file, archive_dir, new_file, data, name)))
+        return os.path.join(archive_dir, name) if name else None
+
+    def stop(self):
+        """Finish queued jobs and stop the worker."""
+        if self.thread:
+            self.jobs.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        self._scan()
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            context, args = job
+            context.run(self._replace, *args)
+
+    def _scan(self):
+        """Index existing archive files and apply retention once."""
+        entries = []
+        for archive_dir in self.archive_dirs:
+            if not Path(archive_dir).is_dir():
+                continue
+            for path in Path(archive_dir).iterdir():
+                if path.is_file():
+                    stat = path.stat()
+                    entries.append((stat.st_mtime, stat.st_size, str(path)))
+                    self.inodes.add((stat.st_dev, stat.st_ino))
+        entries.sort()
+        self.index = deque(entries)
+        self.size_bytes = sum(size for _, size, _ in entries)
+        logger.info(f"Archive index: {len(entries)} files, {self.size_bytes / 1e6:.1f} MB")
+        self._enforce()
+
+    def _replace(self, current_file, archive_dir, new_file=None, data=None, name=None):
+        with tracing.span("archive.replace", file=current_file):
+            self._replace_file(current_file, archive_dir, new_file, data, name)
+        self._enforce()
+
+    def _is_archived(self, path):
+        """True if path is (a hard link to) a file in the archive."""
+        stat = os.stat(path)
+        return (stat.st_dev, stat.st_ino) in self.inodes
+
+    def _replace_file(self, current_file, archive_dir, new_file, data, name):
+        try:
+            # A current file that is a link into the archive is already archived
+            if Path(current_file).exists() and not self._is_archived(current_file):
+                self.archive_file(current_file, archive_dir)
+            target = os.path.join(archive_dir, name) if name else current_file
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = f"{current_file}.tmp"
+            if data is not None:
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, target)
+            elif new_file:
+                os.replace(new_file, target)
+            if name:
+                stat = Path(target).stat()
+                self.index.append((time.time(), stat.st_size, target))
+                self.size_bytes += stat.st_size
+                self.inodes.add((stat.st_dev, stat.st_ino))
+                self.archived_total += 1
+                if Path(tmp_path).exists():
+                    os.remove(tmp_path)
+                os.link(target, tmp_path)
+                os.replace(tmp_path, current_file)
+            logger.info(f"Saved {current_file}")
+        except Exception as e:
+            logger.error(f"Error replacing {current_file}: {e}")
+
+    def archive_file(self, source_file, archive_dir):
+        """
+        Move a file into the archive with a timestamp.
+
         Args:
             source_file: Path to the file to archive
             archive_dir: Directory to archive to
+
+        Returns:
+            Path of the archived file or None
         """
         if not Path(source_file).exists():
             logger.warning(f"File not found: {source_file}")
             return None
-        
+
         Path(archive_dir).mkdir(parents=True, exist_ok=True)
-        
+
         # Get file extension
         file_ext = Path(source_file).suffix
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         archived_name = f"{Path(source_file).stem}_{timestamp}{file_ext}"
         archived_path = os.path.join(archive_dir, archived_name)
-        
+        counter = 1
+        while Path(archived_path).exists():
+            archived_path = os.path.join(archive_dir, f"{Path(source_file).stem}_{timestamp}_{counter}{file_ext}")
+            counter += 1
+
         try:
-            shutil.copy2(source_file, archived_path)
+            # Same file system: a rename, no data is copied
+            stat = Path(source_file).stat()
+            size = stat.st_size
+            os.replace(source_file, archived_path)
+            self.index.append((time.time(), size, archived_path))
+            self.size_bytes += size
+            self.inodes.add((stat.st_dev, stat.st_ino))
+            self.archived_total += 1
             logger.info(f"File archived: {source_file} -> {archived_path}")
             return archived_path
         except Exception as e:
             logger.error(f"Error archiving file: {e}")
             return None
+
+    def _enforce(self):
+        """Delete the oldest archived files until age and byte limits hold."""
+        cutoff = time.time() - self.max_age if self.max_age is not None else None
+        while self.index:
+            archived_at, size, path = self.index[0]
+            too_old = cutoff is not None and archived_at < cutoff
+            too_big = self.max_bytes is not None and self.size_bytes > self.max_bytes
+            if not (too_old or too_big):
+                break
+            self.index.popleft()
+            self.size_bytes -= size
+            try:
+                stat = os.stat(path)
+                self.inodes.discard((stat.st_dev, stat.st_ino))
+                os.remove(path)
+                self.evicted_total += 1
+                self.evicted_bytes += size
+                logger.debug(f"Evicted from archive: {path}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Error evicting {path}: {e}")
+
+    def describe(self):
+        """Short summary line for the performance report."""
+        return (f"{len(self.index)} files, {self.size_bytes / 1e6:.1f} MB, "
+                f"{self.archived_total} archived, {self.evicted_total} evicted "
+                f"({self.evicted_bytes / 1e6:.1f} MB)")
@@ -0,0 +1,138 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class AudioCache:
+    """Content-addressed cache of generated MP3s with a byte budget and LRU eviction."""
+
+    def __init__(self, cache_dir="audio/cache", max_bytes=50 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: Directory the cached MP3s are stored in
+            max_bytes: Total size budget; least recently used files are evicted beyond it
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(text, voice_id, voice_config, model=""):
+        """
+        Build the cache key for an utterance.
+
+        Args:
+            text: Text that is spoken
+            voice_id: TTS voice
+            voice_config: Mood-specific voice settings (emotion, pitch, speed)
+            model: TTS model name
+
+        Returns:
+            Hex SHA-256 digest
+        """
+        payload = json.dumps({
+            "text": text.strip(),
+            "voice_id": voice_id,
+            "voice_config": voice_config,
+            "model": model,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.mp3"
+
+    @staticmethod
+    def _copy(source, destination):
+        """
+        Copy source to destination.
+
+        Not a hard link: cache entries must not share an inode with the
+        current/archived audio files, or touching an entry would refresh the
+        archive's mtimes and the archiver could not tell what it archived.
+        """
+        shutil.copyfile(source, destination)
+
+    def get(self, key, destination):
+        """
+        Materialize a cached utterance at destination.
+
+        Args:
+            key: Key from make_key()
+            destination: Path the audio file should appear at
+
+        Returns:
+            destination on a hit, None on a miss
+        """
+        path = self._path(key)
+        with self.lock:
+            if not path.exists():
+                self.misses += 1
+                logger.info(f"Audio cache miss ({self.describe()})")
+                return None
+            try:
+                # Touch the entry so eviction sees it as recently used
+                os.utime(path)
+                Path(destination).parent.mkdir(parents=True, exist_ok=True)
+                if Path(destination).exists():
+                    os.remove(destination)
+                self._copy(path, destination)
+            except Exception as e:
+                logger.error(f"Error reading audio cache: {e}")
+                self.misses += 1
+                return None
+            self.hits += 1
+            logger.info(f"Audio cache hit ({self.describe()})")
+            return str(destination)
+
+    def put(self, key, source):
+        """
+        Add a generated audio file to the cache and enforce the byte budget.
+
+        Args:
+            key: Key from make_key()
+            source: Path of the generated audio file
+        """
+        path = self._path(key)
+        with self.lock:
+            try:
+                if not path.exists():
+                    self._copy(source, path)
+                self._evict()
+            except Exception as e:
+                logger.error(f"Error writing audio cache: {e}")
+
+    def _evict(self):
+        """Delete least recently used files until the cache fits its budget."""
+        files = [(p, p.stat()) for p in self.cache_dir.glob("*.mp3")]
+        total = sum(st.st_size for _, st in files)
+        if total <= self.max_bytes:
+            return
+        for path, st in sorted(files, key=lambda item: item[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            path.unlink()
+            total -= st.st_size
+            logger.info(f"Evicted from audio cache: {path.name} ({st.st_size} bytes)")
+
+    def size_bytes(self):
+        """Current total size of the cache."""
+        return sum(p.stat().st_size for p in self.cache_dir.glob("*.mp3"))
+
+    @property
+    def hit_ratio(self):
+        """Fraction of lookups that were hits."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def describe(self):
+        """Short human-readable summary of the cache statistics."""
+        return f"hits={self.hits} misses={self.misses} ratio={self.hit_ratio:.0%}"
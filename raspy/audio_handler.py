@@ -1,16 +1,25 @@
 import os
+import asyncio
 import logging
+import platform
+import shutil
 import subprocess
-from datetime import datetime
+import time
 from pathlib import Path
 from dotenv import load_dotenv
-import replicate
-import requests
+
+import config
+import metrics
+import tracing
+from audio_cache import AudioCache
+from request_policy import RequestPolicy
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+TTS_MODEL = "minimax/speech-02-turbo"
+
 # Single voice used for all moods
 SINGLE_VOICE = "Deep_Voice_Man"
 
@@ -38,82 +47,321 @@ MOOD_VOICES = {
 }
 
 
+# Players that can decode MP3 from stdin, in order of preference
+STREAM_PLAYERS = [
+    ("mpg123", ["mpg123", "-q", "-"]),
+    ("play (sox)", ["play", "-q", "-t", "mp3", "-"]),
+    ("ffplay", ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", "-i", "-"]),
+    ("cvlc", ["cvlc", "--play-and-exit", "-"]),
+]
+
+audio_cache = AudioCache(
+    cache_dir=config.AUDIO_CACHE_DIR,
+    max_bytes=config.AUDIO_CACHE_MAX_BYTES,
+) if config.AUDIO_CACHE_ENABLED else None
+
+tts_policy = RequestPolicy(
+    "replicate",
+    budget=config.REPLICATE_BUDGET,
+    hedge_after=config.REPLICATE_HEDGE_AFTER,
+    hedge_model=config.REPLICATE_HEDGE_MODEL,
+    quantile=config.API_HEDGE_QUANTILE,
+    hedging=config.API_HEDGING,
+)
+
+
 class AudioHandler:
     """Generate and play audio using text-to-speech."""
     
+    # Player that worked last in play_audio; tried first next time
+    last_player = None
+    
     @staticmethod
-    def generate_audio(text: str, mood: str = "happy", timestamp: str = None) -> str:
+    def tts_input(text: str, mood: str = "happy") -> dict:
+        """Build the Replicate TTS input for a text and mood."""
+        voice_config = MOOD_VOICES.get(mood, MOOD_VOICES["happy"])
+        
+        logger.info(f"Generating audio with mood: {mood}")
+        logger.info(f"Voice: {SINGLE_VOICE}, Emotion: {voice_config['emotion']}")
+        logger.info(f"Pitch: {voice_config['pitch']}, Speed: {voice_config['speed']}")
+        logger.info(f"Text: {text[:100]}...")
+        
+        return {
+            "text": text,
+            "pitch": voice_config["pitch"],
+            "speed": voice_config["speed"],
+            "volume": 1,
+            "bitrate": 128000,
+            "channel": "mono",
+            "emotion": voice_config["emotion"],
+            "voice_id": SINGLE_VOICE,
+            "sample_rate": 32000,
+            "audio_format": "mp3",
+            "language_boost": "German",
+            "subtitle_enable": False,
+            "english_normalization": True
+        }
+    
+    @staticmethod
+    async def synthesize_async(text: str, mood: str, network, hedged: bool = True) -> tuple:
         """
-        Generate audio from text using Replicate.
+        Run the Replicate TTS model over the shared async connection pool,
+        within the TTS latency budget and hedged if it is slow.
+        
+        Args:
+            hedged: False to bypass tts_policy (startup renders must not
+                feed the latency stats that decide hedging at runtime)
+        
+        Returns:
+            (URL of the generated MP3, model that generated it)
+        """
+        model_input = AudioHandler.tts_input(text, mood)
+        
+        async def attempt(model):
+            # The hedge may run another model, so the winner reports its own
+            return await network.create_prediction(model, model_input), model
+        
+        if hedged:
+            output, model = await tts_policy.run(attempt, TTS_MODEL)
+        else:
+            output, model = await attempt(TTS_MODEL)
+        if isinstance(output, list):
+            output = output[0]
+        return output, model
+    
+    @staticmethod
+    def cache_key(text: str, mood: str, model: str = TTS_MODEL) -> str:
+        """Cache key for an utterance: text, voice, mood-specific voice settings and model."""
+        voice_config = MOOD_VOICES.get(mood, MOOD_VOICES["happy"])
+        return AudioCache.make_key(text, SINGLE_VOICE, voice_config, model)
+    
+    @staticmethod
+    def find_stream_player():
+        """
+        Find a player that can decode MP3 from stdin.
+        
+        Returns:
+            (player_name, command) tuple or None
+        """
+        for player_name, cmd in STREAM_PLAYERS:
+            if shutil.which(cmd[0]):
+                return player_name, cmd
+        return None
+    
+    @staticmethod
+    async def generate_audio_async(text: str, mood: str, timestamp: str, network,
+                                   hedged: bool = True) -> str:
+        """
+        Generate audio from text with Replicate over the shared connection pools.
         
         Args:
             text: Text to convert to speech
             mood: Mood to use for voice generation
-            timestamp: Optional timestamp for naming
+            timestamp: Timestamp for naming
+            network: NetworkClients instance
+            hedged: Run the prediction under tts_policy (see synthesize_async)
         
         Returns:
             Path to generated audio file
         """
-        if timestamp is None:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        audio_path = f"audio/audio_{timestamp}.mp3"
+        if audio_cache:
+            cache_key = AudioHandler.cache_key(text, mood)
+            with tracing.span("tts.cache_lookup", segment=timestamp):
+                cached = await asyncio.to_thread(audio_cache.get, cache_key, audio_path)
+            if cached:
+                return audio_path
         
         try:
-            voice_config = MOOD_VOICES.get(mood, MOOD_VOICES["happy"])
+            with tracing.span("replicate.prediction", segment=timestamp):
+                url, model = await AudioHandler.synthesize_async(text, mood, network, hedged)
+            logger.info(f"Downloading audio from Replicate...")
+            with tracing.span("tts.download", segment=timestamp):
+                data = await network.download(url)
             
-            logger.info(f"Generating audio with mood: {mood}")
-            logger.info(f"Voice: {SINGLE_VOICE}, Emotion: {voice_config['emotion']}")
-            logger.info(f"Pitch: {voice_config['pitch']}, Speed: {voice_config['speed']}")
-            logger.info(f"Text: {text[:100]}...")
+            Path("audio").mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(Path(audio_path).write_bytes, data)
+            logger.info(f"Audio file downloaded: {audio_path} ({len(data)} bytes, 128kbps @ 32kHz)")
             
-            output = replicate.run(
-                "minimax/speech-02-turbo",
-                input={
-                    "text": text,
-                    "pitch": voice_config["pitch"],
-                    "speed": voice_config["speed"],
-                    "volume": 1,
-                    "bitrate": 128000,
-                    "channel": "mono",
-                    "emotion": voice_config["emotion"],
-                    "voice_id": SINGLE_VOICE,
-                    "sample_rate": 32000,
-                    "audio_format": "mp3",
-                    "language_boost": "German",
-                    "subtitle_enable": False,
-                    "english_normalization": True
-                }
+            if audio_cache:
+                await asyncio.to_thread(audio_cache.put, AudioHandler.cache_key(text, mood, model), audio_path)
+            return audio_path
+        
+        except Exception as e:
+            logger.error(f"Error generating audio: {e}")
+            metrics.API_ERRORS.inc(api="replicate")
+            return None
+    
+    @staticmethod
+    async def stream_audio_async(text: str, mood: str, timestamp: str, network,
+                                 chunk_size: int = 4096, wait_for=None, output=None,
+                                 on_queued=None) -> str:
+        """
+        Generate audio and play it while it is still downloading.
+        
+        The pooled download is piped chunk by chunk into a player process
+        (or the persistent AudioOutput) and written to the audio directory at
+        the same time, so playback starts with the first chunks instead of
+        the full file.
+        
+        Args:
+            text: Text to convert to speech
+            mood: Mood to use for voice generation
+            timestamp: Timestamp for naming
+            network: NetworkClients instance
+            chunk_size: Download chunk size in bytes
+            wait_for: Optional awaitable (e.g. a clip still playing) that playback
+                queues behind; synthesis already runs while it is pending
+            output: Optional started AudioOutput; the download is decoded into
+                it (queued behind earlier clips) instead of a new player process
+            on_queued: Optional callback called once the clip has its place on
+                the output or its player has started
+        
+        Returns:
+            Path to the saved audio file
+        """
+        on_queued = on_queued or (lambda: None)
+        if output is not None and output.available:
+            # Clips play in queue order, so the lead-in does not have to finish first
+            audio_path = await AudioHandler._stream_to_output(
+                text, mood, timestamp, network, chunk_size, output, on_queued
             )
-            
-            # Create audio directory
+            if wait_for is not None:
+                await wait_for
+            return audio_path
+        
+        player = AudioHandler.find_stream_player()
+        if player is None:
+            logger.warning("No streaming-capable player found, falling back to download + play")
+            audio_path = await AudioHandler.generate_audio_async(text, mood, timestamp, network)
+            if wait_for is not None:
+                await wait_for
+            if audio_path:
+                on_queued()
+                await asyncio.to_thread(AudioHandler.play_audio, audio_path)
+            return audio_path
+        
+        audio_path = f"audio/audio_{timestamp}.mp3"
+        if audio_cache:
+            cache_key = AudioHandler.cache_key(text, mood)
+            if await asyncio.to_thread(audio_cache.get, cache_key, audio_path):
+                if wait_for is not None:
+                    await wait_for
+                on_queued()
+                await asyncio.to_thread(AudioHandler.play_audio, audio_path)
+                return audio_path
+        
+        try:
+            with tracing.span("replicate.prediction"):
+                url, model = await AudioHandler.synthesize_async(text, mood, network)
             Path("audio").mkdir(parents=True, exist_ok=True)
+            if wait_for is not None:
+                with tracing.span("tts.wait_for_lead_in"):
+                    await wait_for
             
-            # Save audio file
-            audio_path = f"audio/audio_{timestamp}.mp3"
+            player_name, cmd = player
+            logger.info(f"Streaming audio from Replicate into {player_name}...")
+            start = time.perf_counter()
+            with tracing.span("player.spawn", player=player_name):
+                process = await asyncio.create_subprocess_exec(
+                    *cmd, stdin=subprocess.PIPE,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+            on_queued()
             
-            # Handle the output - Replicate returns a URL string
-            if isinstance(output, str):
-                logger.info(f"Downloading audio from Replicate...")
-                response = requests.get(output, timeout=30)
-                response.raise_for_status()
-                
+            total_bytes = 0
+            player_alive = True
+            try:
                 with open(audio_path, "wb") as f:
-                    f.write(response.content)
-                    
-                file_size = Path(audio_path).stat().st_size
-                logger.info(f"Audio file downloaded: {audio_path} ({file_size} bytes, 128kbps @ 32kHz)")
-            else:
-                # Fallback: if it's a file-like object
-                logger.warning("Output is not a URL, attempting direct write")
+                    async for chunk in network.stream(url, chunk_size):
+                        if total_bytes == 0:
+                            tracing.mark("tts.first_bytes")
+                            logger.info(f"First audio bytes after {time.perf_counter() - start:.2f}s")
+                        total_bytes += len(chunk)
+                        f.write(chunk)
+                        if player_alive:
+                            try:
+                                process.stdin.write(chunk)
+                                # Back-pressure from the player without blocking the loop
+                                await process.stdin.drain()
+                            except (BrokenPipeError, ConnectionResetError):
+                                # Keep downloading so the archive copy is complete
+                                logger.error(f"{player_name} exited during streaming")
+                                player_alive = False
+            except BaseException:
+                # Download failed or was cancelled: stop the half-fed player
+                if process.returncode is None:
+                    process.kill()
+                await process.wait()
+                raise
+            finally:
+                try:
+                    process.stdin.close()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            
+            logger.info(f"Audio downloaded: {audio_path} ({total_bytes} bytes in {time.perf_counter() - start:.2f}s)")
+            with tracing.span("player.drain", player=player_name):
+                await process.wait()
+            logger.info(f"Streamed playback finished after {time.perf_counter() - start:.2f}s")
+            if audio_cache and total_bytes:
+                await asyncio.to_thread(audio_cache.put, AudioHandler.cache_key(text, mood, model), audio_path)
+            return audio_path
+        
+        except Exception as e:
+            logger.error(f"Error streaming audio: {e}")
+            metrics.API_ERRORS.inc(api="replicate")
+            return None
+    
+    @staticmethod
+    async def _stream_to_output(text, mood, timestamp, network, chunk_size, output, on_queued):
+        """stream_audio_async on the persistent AudioOutput."""
+        audio_path = f"audio/audio_{timestamp}.mp3"
+        if audio_cache:
+            cache_key = AudioHandler.cache_key(text, mood)
+            if await asyncio.to_thread(audio_cache.get, cache_key, audio_path):
+                clip = output.enqueue(audio_path)
+                on_queued()
+                await clip.wait()
+                return audio_path
+        
+        try:
+            with tracing.span("replicate.prediction"):
+                url, model = await AudioHandler.synthesize_async(text, mood, network)
+            Path("audio").mkdir(parents=True, exist_ok=True)
+            
+            logger.info(f"Streaming audio from Replicate into the audio output...")
+            start = time.perf_counter()
+            clip = output.open_stream(audio_path)
+            on_queued()
+            total_bytes = 0
+            decoding = True
+            try:
                 with open(audio_path, "wb") as f:
-                    if hasattr(output, 'read'):
-                        f.write(output.read())
-                    else:
-                        f.write(output)
+                    async for chunk in network.stream(url, chunk_size):
+                        if total_bytes == 0:
+                            tracing.mark("tts.first_bytes")
+                            logger.info(f"First audio bytes after {time.perf_counter() - start:.2f}s")
+                        total_bytes += len(chunk)
+                        f.write(chunk)
+                        if decoding and not await clip.feed(chunk):
+                            # Keep downloading so the archive copy is complete
+                            logger.error("Decoder exited during streaming")
+                            decoding = False
+            finally:
+                await clip.close()
             
+            logger.info(f"Audio downloaded: {audio_path} ({total_bytes} bytes in {time.perf_counter() - start:.2f}s)")
+            with tracing.span("player.drain", player="audio output"):
+                await clip.wait()
+            logger.info(f"Streamed playback finished after {time.perf_counter() - start:.2f}s")
+            if audio_cache and total_bytes:
+                await asyncio.to_thread(audio_cache.put, AudioHandler.cache_key(text, mood, model), audio_path)
             return audio_path
         
         except Exception as e:
-            logger.error(f"Error generating audio: {e}")
+            logger.error(f"Error streaming audio: {e}")
+            metrics.API_ERRORS.inc(api="replicate")
             return None
     
     @staticmethod
@@ -137,13 +385,13 @@ class AudioHandler:
             return False
         
         try:
-            import platform
             system = platform.system()
             
             # macOS
             if system == "Darwin":
                 logger.info("Using afplay (macOS)")
-                result = subprocess.run(["afplay", audio_path], check=False)
+                with tracing.span("audio.play", player="afplay", file=audio_path):
+                    result = subprocess.run(["afplay", audio_path], check=False)
                 if result.returncode == 0:
                     logger.info("Audio playback finished successfully")
                     return True
@@ -161,15 +409,18 @@ class AudioHandler:
                     ("ffplay", ["ffplay", "-nodisp", "-autoexit", audio_path]),
                     ("paplay", ["paplay", audio_path])  # PulseAudio
                 ]
+                players.sort(key=lambda player: player[0] != AudioHandler.last_player)
                 
                 for player_name, cmd in players:
                     try:
                         logger.info(f"Trying {player_name}...")
-                        result = subprocess.run(cmd, check=False,
-                                              stdout=subprocess.PIPE,
-                                              stderr=subprocess.PIPE)
+                        with tracing.span("audio.play", player=player_name, file=audio_path):
+                            result = subprocess.run(cmd, check=False,
+                                                  stdout=subprocess.PIPE,
+                                                  stderr=subprocess.PIPE)
                         if result.returncode == 0:
                             logger.info(f"Audio playback finished successfully with {player_name}")
+                            AudioHandler.last_player = player_name
                             return True
                         else:
                             logger.debug(f"{player_name} returned code {result.returncode}")
@@ -0,0 +1,354 @@
+import os
+import time
+import queue
+import shutil
+import asyncio
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Commands that decode an MP3 (a path, or "-" for stdin) to raw mono 16-bit PCM on stdout
+DECODERS = [
+    ("ffmpeg", lambda path, rate: ["ffmpeg", "-v", "quiet", "-i", path,
+                                   "-f", "s16le", "-ac", "1", "-ar", str(rate), "-"]),
+    ("mpg123", lambda path, rate: ["mpg123", "-q", "-s", "-m", "-r", str(rate), path]),
+]
+
+# Long-running players that take raw mono 16-bit PCM on stdin, in order of preference
+SINKS = [
+    ("play (sox)", lambda rate: ["play", "-q", "-t", "raw", "-r", str(rate), "-e", "signed",
+                                 "-b", "16", "-c", "1", "-"]),
+    ("pacat", lambda rate: ["pacat", "--raw", "--format=s16le", f"--rate={rate}", "--channels=1"]),
+    ("aplay", lambda rate: ["aplay", "-q", "-t", "raw", "-f", "S16_LE", "-r", str(rate), "-c", "1"]),
+]
+
+# Silence is written in chunks this long, decoded clips in chunks of 5x that
+CHUNK_SECONDS = 0.02
+# While idle, silence is kept at most this far ahead of the output
+IDLE_LEAD = 0.05
+
+
+class Clip:
+    """A clip queued on the AudioOutput."""
+
+    def __init__(self, name, chunks):
+        """
+        Args:
+            name: Name for logs (usually the file path)
+            chunks: Callable returning an iterator of PCM chunks
+        """
+        self.name = name
+        self.chunks = chunks
+        self.submitted = time.perf_counter()
+        self.started_at = None
+        self.ends_at = None
+        self.ok = False
+        self.written = threading.Event()
+        try:
+            self._loop = asyncio.get_running_loop()
+            self.started = self._loop.create_future()
+            self.finished = self._loop.create_future()
+        except RuntimeError:
+            self._loop, self.started, self.finished = None, None, None
+
+    def _call(self, callback, *args):
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(callback, *args)
+            except RuntimeError:
+                # Event loop already closed
+                pass
+
+    def _set_started(self, started_at):
+        self.started_at = started_at
+        self._call(_resolve, self.started, started_at)
+
+    def _set_finished(self, ok, ends_at):
+        self.ok = ok
+        self.ends_at = ends_at
+        self.written.set()
+        self._call(self._finish_later)
+
+    def _finish_later(self):
+        delay = max(0.0, self.ends_at - time.perf_counter()) if self.ok else 0.0
+        self._loop.call_later(delay, _resolve, self.finished, self.ok)
+        if not self.started.done():
+            self.started.set_result(None)
+
+    def join(self, timeout=None):
+        """Block until the clip has played; True on success."""
+        if not self.written.wait(timeout):
+            return False
+        if self.ok:
+            time.sleep(max(0.0, self.ends_at - time.perf_counter()))
+        return self.ok
+
+    async def wait(self):
+        """Wait until the clip has played without blocking the event loop; True on success."""
+        if self.finished is None:
+            return await asyncio.to_thread(self.join)
+        return await asyncio.shield(self.finished)
+
+
+class StreamClip(Clip):
+    """Clip decoded while its MP3 bytes are still arriving."""
+
+    def __init__(self, name, decoder):
+        self.decoder = decoder
+        super().__init__(name, self._read)
+
+    def _read(self):
+        try:
+            while True:
+                data = self.decoder.stdout.read(4096)
+                if not data:
+                    break
+                yield data
+        finally:
+            self.decoder.stdout.close()
+            try:
+                self.decoder.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self.decoder.kill()
+
+    async def feed(self, data):
+        """Pass MP3 bytes to the decoder; False once the decoder is gone."""
+        try:
+            await asyncio.to_thread(self._write, data)
+            return True
+        except (BrokenPipeError, ConnectionResetError, ValueError):
+            return False
+
+    def _write(self, data):
+        self.decoder.stdin.write(data)
+        self.decoder.stdin.flush()
+
+    async def close(self):
+        """Signal the end of the MP3 data."""
+        try:
+            await asyncio.to_thread(self.decoder.stdin.close)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def _resolve(future, value):
+    if future is not None and not future.done():
+        future.set_result(value)
+
+
+class AudioOutput:
+    """
+    One long-running audio output process fed with PCM through a queue.
+
+    The decoder and the player are detected once. Clips are decoded ahead
+    of time and written back to back into the open player, so sequential
+    clips play without gaps and without spawning a player per clip. The
+    time each clip reaches the output is estimated from a playhead model:
+    written PCM is assumed to play at the sample rate right after what was
+    written before it. Pipe and device buffering are not measured, so the
+    real output lags the estimate by the sink's buffer latency.
+    """
+
+    def __init__(self, sample_rate=32000, keep_warm=True, cache_entries=16):
+        """
+        Args:
+            sample_rate: PCM sample rate of the output
+            keep_warm: Feed silence while idle so the sink (e.g. a Bluetooth
+                speaker) does not suspend between clips
+            cache_entries: Number of decoded clips kept in memory (thinking clips repeat)
+        """
+        self.sample_rate = sample_rate
+        self.bytes_per_second = sample_rate * 2
+        self.keep_warm = keep_warm
+        self.cache_entries = cache_entries
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+        self.decoder = None
+        self.sink = None
+        self.process = None
+        self.thread = None
+        self.clips = queue.Queue()
+        self.decode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-decode")
+        self.available = False
+
+        # Estimated time (perf_counter) at which everything written so far has
+        # been played, and at which the last clip (not counting idle silence) ends
+        self.playhead = 0.0
+        self.clip_end = 0.0
+        self.clips_total = 0
+        self.first_sample_estimates = []
+        self.gaps = []
+
+    def start(self):
+        """
+        Detect decoder and player and open the output.
+
+        Returns:
+            True if the persistent output is available
+        """
+        self.decoder = next(((name, build) for name, build in DECODERS if shutil.which(name)), None)
+        self.sink = next(((name, build) for name, build in SINKS if shutil.which(name.split()[0])), None)
+        if not self.decoder or not self.sink:
+            logger.warning("No PCM decoder (ffmpeg/mpg123) or player (sox/pacat/aplay) found - "
+                           "playing every clip with its own player process")
+            return False
+        try:
+            self.process = subprocess.Popen(
+                self.sink[1](self.sample_rate), stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except OSError as e:
+            logger.error(f"Could not start {self.sink[0]}: {e}")
+            return False
+        self.available = True
+        self.playhead = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, name="audio-output", daemon=True)
+        self.thread.start()
+        logger.info(f"Audio output: {self.sink[0]} at {self.sample_rate} Hz, decoding with {self.decoder[0]}")
+        return True
+
+    def enqueue(self, audio_path):
+        """
+        Queue a file for playback after everything queued before it.
+
+        Returns:
+            Clip (await clip.wait() or clip.join())
+        """
+        decoded = self.decode_executor.submit(self._decode, audio_path)
+        clip = Clip(audio_path, lambda: self._split(decoded.result()))
+        self.clips.put(clip)
+        return clip
+
+    def open_stream(self, name):
+        """
+        Queue a clip whose MP3 data is fed while it downloads.
+
+        Returns:
+            StreamClip (feed(), close(), wait())
+        """
+        decoder = subprocess.Popen(
+            self.decoder[1]("-", self.sample_rate),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        clip = StreamClip(name, decoder)
+        self.clips.put(clip)
+        return clip
+
+    def play_file(self, audio_path):
+        """Blocking playback of one file (queued behind other clips)."""
+        return self.enqueue(audio_path).join()
+
+    def _decode(self, audio_path):
+        stat = os.stat(audio_path)
+        key = (audio_path, stat.st_mtime_ns, stat.st_size)
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        result = subprocess.run(
+            self.decoder[1](audio_path, self.sample_rate),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False
+        )
+        if result.returncode != 0 or not result.stdout:
+            raise RuntimeError(f"{self.decoder[0]} could not decode {audio_path}")
+        with self.cache_lock:
+            self.cache[key] = result.stdout
+            while len(self.cache) > self.cache_entries:
+                self.cache.popitem(last=False)
+        return result.stdout
+
+    def _split(self, pcm):
+        size = int(self.bytes_per_second * CHUNK_SECONDS) * 5
+        return (pcm[offset:offset + size] for offset in range(0, len(pcm), size))
+
+    def _write(self, pcm):
+        """Write PCM to the player; returns the estimated output time of its first sample."""
+        start = max(time.perf_counter(), self.playhead)
+        self.process.stdin.write(pcm)
+        self.process.stdin.flush()
+        self.playhead = start + len(pcm) / self.bytes_per_second
+        return start
+
+    def _run(self):
+        silence = bytes(int(self.bytes_per_second * CHUNK_SECONDS) & ~1)
+        while True:
+            try:
+                clip = self.clips.get(timeout=CHUNK_SECONDS / 2)
+            except queue.Empty:
+                if self.keep_warm and self.available and self.playhead - time.perf_counter() < IDLE_LEAD:
+                    self._guarded_write(silence)
+                continue
+            if clip is None:
+                break
+            self._play(clip)
+
+    def _guarded_write(self, pcm):
+        try:
+            return self._write(pcm)
+        except (BrokenPipeError, ConnectionResetError, ValueError) as e:
+            if self.available:
+                logger.error(f"Audio output {self.sink[0]} exited: {e}")
+            self.available = False
+            return None
+
+    def _play(self, clip):
+        previous_end = self.clip_end
+        ok = False
+        try:
+            for chunk in clip.chunks():
+                if not self.available:
+                    break
+                start = self._guarded_write(chunk)
+                if start is None:
+                    break
+                if clip.started_at is None:
+                    clip._set_started(start)
+                    # Latency added by the output itself (estimated): from the moment the
+                    # clip could have started (submitted, previous clip over) to its first sample
+                    ready = max(clip.submitted, previous_end)
+                    self.first_sample_estimates.append(start - ready)
+                    if clip.submitted < previous_end:
+                        self.gaps.append(max(0.0, start - previous_end))
+            ok = clip.started_at is not None
+        except Exception as e:
+            logger.error(f"Error playing {clip.name}: {e}")
+        self.clips_total += 1
+        self.clip_end = self.playhead
+        clip._set_finished(ok, self.playhead)
+        if ok:
+            logger.debug(f"Queued {clip.name} for output, ends in {self.playhead - time.perf_counter():.2f}s")
+
+    def stop(self):
+        """Finish queued clips and close the output."""
+        if self.thread:
+            self.clips.put(None)
+            self.thread.join(timeout=max(1.0, self.playhead - time.perf_counter() + 1.0))
+            self.thread = None
+        self.decode_executor.shutdown(wait=False, cancel_futures=True)
+        if self.process:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=max(0.5, self.playhead - time.perf_counter() + 0.5))
+            except Exception:
+                self.process.terminate()
+            self.process = None
+        self.available = False
+
+    def describe(self):
+        """Short summary line for the performance report."""
+        if not self.sink:
+            return "per-clip players"
+        if not self.first_sample_estimates:
+            return f"{self.sink[0]}, no clips yet"
+        latencies_ms = sorted(value * 1000 for value in self.first_sample_estimates)
+        p95 = latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))]
+        gapless = sum(1 for gap in self.gaps if gap < CHUNK_SECONDS)
+        self.first_sample_estimates = self.first_sample_estimates[-1000:]
+        return (f"{self.sink[0]}, {self.clips_total} clips, first sample (estimated) p50 "
+                f"{latencies_ms[len(latencies_ms) // 2]:.0f}ms p95 {p95:.0f}ms, "
+                f"{gapless}/{len(self.gaps)} back-to-back clips gapless")
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end latency benchmark.
+
+Starts a local stand-in for the OpenAI chat-completions API (streaming and
+non-streaming) and the Replicate prediction/file endpoints, points the
+pipeline at it and runs main.process_trigger N times. No API credits or
+network are needed; the stand-in adds latency, jitter, limited bandwidth
+and errors according to a profile.
+
+    python benchmark.py --runs 20 --profile venue --output results.json
+    python benchmark.py --runs 20 --profile venue --compare results.json
+
+Per-stage p50/p95/p99 are printed and written to a JSON file; --compare
+prints the difference to an earlier results file (e.g. from another build).
+"""
+
+import os
+import sys
+import ast
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+from collections import namedtuple
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# latency:    seconds until the first response byte
+# jitter:     standard deviation added to every latency
+# upload:     request body bytes per second (None = unlimited)
+# download:   response bytes per second for audio files (None = unlimited)
+# token_rate: streamed LLM tokens per second
+# tts_time:   seconds a TTS prediction takes
+# error_rate: fraction of API requests answered with HTTP 503
+Profile = namedtuple("Profile", "latency jitter upload download token_rate tts_time error_rate")
+
+# Rough numbers; "venue" is what the bot sees on crowded event Wi-Fi
+PROFILES = {
+    "ideal": Profile(0.0, 0.0, None, None, 1000, 0.0, 0.0),
+    "lan": Profile(0.05, 0.01, 2_000_000, 5_000_000, 80, 1.0, 0.0),
+    "wifi": Profile(0.15, 0.05, 250_000, 1_000_000, 50, 1.5, 0.0),
+    "venue": Profile(0.4, 0.2, 60_000, 300_000, 30, 2.5, 0.02),
+    "flaky": Profile(0.4, 0.3, 60_000, 300_000, 30, 2.5, 0.15),
+}
+
+RESPONSE_TEXT = ("Wow, was für ein Outfit! Die Farben passen perfekt zusammen. "
+                 "Und diese Schuhe sind einfach der Hammer.")
+
+# Silent MPEG-1 Layer III frame (128 kbit/s, 44.1 kHz, 26 ms): header plus zeroed
+# side info and main data, which decoders play as silence
+MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+MP3_FRAME_SECONDS = 1152 / 44100
+
+
+class StubAPI:
+    """Local HTTP server that answers like the OpenAI and Replicate APIs."""
+
+    def __init__(self, profile, audio_seconds=2.0, seed=None):
+        """
+        Args:
+            profile: Profile applied to every request
+            audio_seconds: Duration of the (silent) MP3 returned by TTS
+            seed: Seed for jitter and error injection (None = random)
+        """
+        self.profile = profile
+        self.audio = MP3_FRAME * max(1, round(audio_seconds / MP3_FRAME_SECONDS))
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.server = None
+        # Prediction id -> [time the output is ready, cancelled]
+        self.predictions = {}
+        self.cancelled = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        """Serve on a free local port in a background thread."""
+        stub = self
+
+        class Handler(StubHandler):
+            api = stub
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="stub-api", daemon=True).start()
+        logger.info(f"Stub API on {self.url}")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def delay(self, seconds=0.0):
+        """Sleep for the profile latency (with jitter) plus `seconds`."""
+        with self.lock:
+            jitter = self.random.gauss(0, self.profile.jitter) if self.profile.jitter else 0.0
+        time.sleep(max(0.0, self.profile.latency + jitter + seconds))
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            fail = self.random.random() < self.profile.error_rate
+            if fail:
+                self.errors += 1
+        return fail
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    api = None
+
+    def log_message(self, format, *args):
+        logger.debug(f"Stub: {format % args}")
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the request (e.g. a cancelled hedge)
+            pass
+
+    def _send(self, code, body, content_type="application/json"):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, obj, code=200):
+        self._send(code, json.dumps(obj).encode())
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _read_body(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # Limited upload bandwidth: the request only "arrives" after this long
+        if self.api.profile.upload:
+            time.sleep(len(body) / self.api.profile.upload)
+        return json.loads(body or b"{}")
+
+    def do_HEAD(self):
+        # Connection warm-up
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.startswith("/files/"):
+            self._send_audio()
+        elif self.path.startswith("/v1/predictions/"):
+            self._json(self._prediction(self.path.rstrip("/").split("/")[-1]))
+        else:
+            self._send(404, b"{}")
+
+    def do_POST(self):
+        request = self._read_body()
+        if self.path.startswith("/v1/predictions/") and self.path.endswith("/cancel"):
+            self._json(self._cancel_prediction(self.path.split("/")[-2]))
+        elif self.api.should_fail():
+            self.api.delay()
+            self._json({"error": {"message": "Injected error", "type": "server_error"}}, code=503)
+        elif self.path.endswith("/chat/completions"):
+            if request.get("stream"):
+                self._stream_completion(request)
+            else:
+                self.api.delay()
+                self._json(self._completion())
+        elif self.path.endswith("/predictions"):
+            self.api.delay()
+            self._json(self._create_prediction())
+        else:
+            self._send(404, b"{}")
+
+    def _prefer_wait(self):
+        """Seconds the client asked the create request to block (Prefer: wait[=N])."""
+        prefer = self.headers.get("Prefer", "")
+        if not prefer.startswith("wait"):
+            return 0.0
+        _, _, seconds = prefer.partition("=")
+        return float(seconds) if seconds else 60.0
+
+    def _create_prediction(self):
+        ready_at = time.perf_counter() + self.api.profile.tts_time
+        with self.api.lock:
+            prediction_id = f"bench{len(self.api.predictions)}"
+            self.api.predictions[prediction_id] = [ready_at, False]
+        # Like Replicate, block until the output is ready or the wait is over
+        time.sleep(max(0.0, min(ready_at - time.perf_counter(), self._prefer_wait())))
+        return self._prediction(prediction_id)
+
+    def _cancel_prediction(self, prediction_id):
+        with self.api.lock:
+            entry = self.api.predictions.get(prediction_id)
+            if entry and not entry[1] and time.perf_counter() < entry[0]:
+                entry[1] = True
+                self.api.cancelled += 1
+        return self._prediction(prediction_id)
+
+    def _completion(self):
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+            "model": "stub", "choices": [{"index": 0, "finish_reason": "stop",
+                                          "message": {"role": "assistant", "content": RESPONSE_TEXT}}],
+            "usage": {"prompt_tokens": 300, "completion_tokens": len(RESPONSE_TEXT.split()),
+                      "total_tokens": 300 + len(RESPONSE_TEXT.split())},
+        }
+
+    def _stream_completion(self, request):
+        self.api.delay()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        tokens = [word + " " for word in RESPONSE_TEXT.split()]
+        for token in tokens:
+            self._event({"choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+            time.sleep(1 / self.api.profile.token_rate)
+        self._event({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if request.get("stream_options", {}).get("include_usage"):
+            self._event({"choices": [], "usage": {"prompt_tokens": 300, "completion_tokens": len(tokens),
+                                                  "total_tokens": 300 + len(tokens)}})
+        self._chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _event(self, fields):
+        chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk",
+                 "created": int(time.time()), "model": "stub", **fields}
+        self._chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    def _prediction(self, prediction_id):
+        with self.api.lock:
+            ready_at, cancelled = self.api.predictions.get(prediction_id, (0.0, False))
+        if cancelled:
+            status, output = "canceled", None
+        elif time.perf_counter() >= ready_at:
+            status, output = "succeeded", f"{self.api.url}/files/{prediction_id}.mp3"
+        else:
+            status, output = "processing", None
+        return {"id": prediction_id, "status": status, "error": None, "output": output,
+                "urls": {"get": f"{self.api.url}/v1/predictions/{prediction_id}",
+                         "cancel": f"{self.api.url}/v1/predictions/{prediction_id}/cancel"}}
+
+    def _send_audio(self):
+        self.api.delay()
+        audio = self.api.audio
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(audio)))
+        self.end_headers()
+        chunk_size = 4096
+        for offset in range(0, len(audio), chunk_size):
+            self.wfile.write(audio[offset:offset + chunk_size])
+            if self.api.profile.download:
+                time.sleep(chunk_size / self.api.profile.download)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list (q in 0..100)."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(runs):
+    """Per-stage count, mean, p50, p95, p99 and max over all successful runs."""
+    stages = {}
+    for run in runs:
+        for stage, value in run["stages"].items():
+            stages.setdefault(stage, []).append(value)
+    return {
+        stage: {
+            "count": len(values),
+            "mean": sum(values) / len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values),
+        }
+        for stage, values in sorted(stages.items())
+    }
+
+
+def print_summary(stages, baseline=None):
+    print(f"{'stage':16s} {'n':>4s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s}")
+    for stage, stats in stages.items():
+        line = (f"{stage:16s} {stats['count']:4d} {stats['p50']:7.3f}s {stats['p95']:7.3f}s "
+                f"{stats['p99']:7.3f}s {stats['max']:7.3f}s")
+        old = (baseline or {}).get(stage)
+        if old:
+            line += f"   p50 {stats['p50'] - old['p50']:+.3f}s  p95 {stats['p95'] - old['p95']:+.3f}s"
+        print(line)
+
+
+async def run_benchmark(main, stub, runs):
+    """Run process_trigger `runs` times and return the stage times of each run."""
+    main.network = main.NetworkClients(
+        replicate_url=f"{stub.url}/v1",
+        warmup_urls=[stub.url],
+        max_connections=main.config.HTTP_MAX_CONNECTIONS,
+        keepalive_expiry=main.config.HTTP_KEEPALIVE_EXPIRY,
+    )
+    if main.audio_output:
+        await asyncio.to_thread(main.audio_output.start)
+    main.speech_pipeline = main.SpeechPipeline(
+        main.runner, main.audio_handler, main.network, None, main.audio_output,
+        audio_streaming=main.config.AUDIO_STREAMING, chunk_size=main.config.AUDIO_STREAM_CHUNK_SIZE
+    )
+    results = []
+    try:
+        await main.network.warm_up()
+        if main.thinking_clips:
+            await main.thinking_clips.prepare(main.audio_handler, main.network)
+        for index in range(runs):
+            errors_before = stub.errors
+            stage_times = await main.process_trigger(cooldown=False)
+            failed = stage_times is None
+            results.append({"run": index, "failed": failed, "stages": stage_times or {},
+                            "injected_errors": stub.errors - errors_before})
+            total = f"{stage_times['total']:.2f}s" if stage_times else "failed"
+            print(f"run {index + 1}/{runs}: {total}", file=sys.stderr)
+    finally:
+        await main.network.close()
+        if main.audio_output:
+            main.audio_output.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency benchmark of the trigger pipeline")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="wifi")
+    parser.add_argument("--latency", type=float, help="Override the profile latency (s)")
+    parser.add_argument("--jitter", type=float, help="Override the profile jitter (s)")
+    parser.add_argument("--error-rate", type=float, help="Override the profile error rate (0..1)")
+    parser.add_argument("--audio-seconds", type=float, default=2.0, help="Length of the generated speech")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--caches", action="store_true", help="Keep the response and audio caches enabled")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="Override a config.py value, e.g. --set LLM_SENTENCE_STREAMING=False")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--label", default="", help="Free-form label stored in the results (e.g. a git hash)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    overrides = {key: value for key, value in (
+        ("latency", args.latency), ("jitter", args.jitter), ("error_rate", args.error_rate)
+    ) if value is not None}
+    profile = PROFILES[args.profile]._replace(**overrides)
+    stub = StubAPI(profile, audio_seconds=args.audio_seconds, seed=args.seed)
+    stub.start()
+
+    # The API clients read their endpoints and keys at import time
+    os.environ["OPENAI_BASE_URL"] = f"{stub.url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("REPLICATE_API_TOKEN", "benchmark")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import config
+    settings = {}
+    for item in args.set:
+        name, value = item.split("=", 1)
+        try:
+            settings[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            settings[name] = value
+    if not args.caches:
+        settings.setdefault("RESPONSE_CACHE_ENABLED", False)
+        settings.setdefault("AUDIO_CACHE_ENABLED", False)
+    settings.setdefault("TRACE_DIR", None)
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+    # Photos, audio and archives go to a scratch directory
+    workdir = tempfile.mkdtemp(prefix="andi_benchmark_")
+    os.chdir(workdir)
+
+    import main as andi
+    from sensor_controller import SensorController
+
+    # Without a Pi the camera is simulated (SIM_PHOTO_DIR, SIM_CAPTURE_LATENCY)
+    andi.sensor_controller = SensorController()
+    andi.image_analyzer = andi.ImageAnalyzer()
+    andi.audio_handler = andi.AudioHandler()
+    andi.serial_handler = andi.SerialHandler(config.SERIAL_PORT, config.SERIAL_BAUDRATE, config.SERIAL_TIMEOUT)
+    andi.archiver = andi.Archiver()
+    andi.runner = andi.StageRunner(io_workers=config.IO_WORKERS)
+    andi.interaction_store = None
+    andi.thinking_clips = andi.ThinkingClips(config.THINKING_CLIP_DIR) if config.THINKING_CLIPS_ENABLED else None
+    andi.lip_sync = None
+    andi.audio_output = andi.AudioOutput(
+        config.AUDIO_SAMPLE_RATE, keep_warm=config.AUDIO_OUTPUT_KEEP_WARM
+    ) if config.AUDIO_OUTPUT_PERSISTENT else None
+    andi.initialize_directories()
+    andi.archiver.start()
+
+    try:
+        runs = asyncio.run(run_benchmark(andi, stub, args.runs))
+    finally:
+        andi.archiver.stop()
+        andi.runner.shutdown(wait=False)
+        stub.stop()
+
+    stages = summarize([run for run in runs if not run["failed"]])
+    results = {
+        "label": args.label,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": f"{platform.node()} {platform.machine()} Python {platform.python_version()}",
+        "profile": {"name": args.profile, **profile._asdict()},
+        "settings": settings,
+        "runs": len(runs),
+        "failed": sum(run["failed"] for run in runs),
+        "stub_requests": stub.requests,
+        "stub_errors": stub.errors,
+        "stub_predictions_cancelled": stub.cancelled,
+        "stages": stages,
+        "raw": runs,
+    }
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n{len(runs)} runs, profile {args.profile}, {results['failed']} failed, "
+          f"{stub.errors}/{stub.requests} API requests failed by injection, "
+          f"{stub.cancelled} abandoned predictions cancelled")
+    print_summary(stages, baseline["stages"] if baseline else None)
+    print(f"\nResults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
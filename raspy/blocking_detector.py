@@ -0,0 +1,131 @@
+"""
+Debug detector for code that blocks the event loop.
+
+Enabled with BLOCKING_DETECTOR in config.py: every stall longer than
+BLOCKING_THRESHOLD is logged with the loop thread's stack, and main.py
+prints the worst offenders on shutdown.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Offenders are named after the innermost frame from this directory
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class BlockingDetector:
+    """
+    Debug watchdog that catches code blocking the event loop.
+
+    A heartbeat coroutine ticks on the loop; a watchdog thread notices when
+    the ticks stop for longer than `threshold` and captures the loop
+    thread's stack at that moment. Stalls are grouped by the innermost
+    project frame and ranked by total blocked time.
+    """
+
+    def __init__(self, threshold=0.1, tick_interval=None):
+        """
+        Args:
+            threshold: Seconds without a tick that count as a stall
+            tick_interval: Heartbeat interval (default threshold / 4)
+        """
+        self.threshold = threshold
+        self.tick_interval = tick_interval or threshold / 4
+        self.last_tick = time.perf_counter()
+        self.loop_thread_id = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+        # Stack captured for the ongoing stall, attributed once it ends
+        self.pending = None
+        # offender -> {"count", "total", "max", "stack"}
+        self.offenders = {}
+
+    async def run(self):
+        """Tick on the event loop and start the watchdog thread; runs until cancelled."""
+        self.loop_thread_id = threading.get_ident()
+        self.thread = threading.Thread(target=self._watch, name="blocking-detector", daemon=True)
+        self.thread.start()
+        logger.info(f"Blocking-call detector active (threshold {self.threshold * 1000:.0f}ms)")
+        try:
+            while True:
+                self.last_tick = time.perf_counter()
+                await asyncio.sleep(self.tick_interval)
+                stall = time.perf_counter() - self.last_tick - self.tick_interval
+                if stall > self.threshold:
+                    self._record(stall)
+                else:
+                    with self.lock:
+                        self.pending = None
+        finally:
+            self.stop()
+
+    def _watch(self):
+        while not self.stopped.wait(self.tick_interval):
+            if time.perf_counter() - self.last_tick <= self.threshold + self.tick_interval:
+                continue
+            with self.lock:
+                if self.pending is not None:
+                    continue
+                frame = sys._current_frames().get(self.loop_thread_id)
+                if frame is None:
+                    continue
+                self.pending = traceback.extract_stack(frame)
+            logger.warning(
+                "Event loop blocked for more than "
+                f"{self.threshold * 1000:.0f}ms, loop thread is at:\n"
+                + "".join(traceback.format_list(self.pending[-8:]))
+            )
+
+    @staticmethod
+    def offender(stack):
+        """Innermost frame from project code (else the innermost frame) as 'file:line function'."""
+        chosen = stack[-1]
+        for frame in reversed(stack):
+            if frame.filename.startswith(PROJECT_DIR) and frame.filename != __file__:
+                chosen = frame
+                break
+        return f"{os.path.basename(chosen.filename)}:{chosen.lineno} {chosen.name}"
+
+    def _record(self, stall):
+        with self.lock:
+            stack, self.pending = self.pending, None
+        if stack is None:
+            # Too short for the watchdog to catch the stack
+            key = "(stack not captured)"
+        else:
+            key = self.offender(stack)
+        entry = self.offenders.setdefault(key, {"count": 0, "total": 0.0, "max": 0.0, "stack": stack})
+        entry["count"] += 1
+        entry["total"] += stall
+        entry["max"] = max(entry["max"], stall)
+        logger.warning(f"Event loop was blocked for {stall * 1000:.0f}ms by {key}")
+
+    def report(self, top=10):
+        """Ranked report of the worst offenders (by total blocked time)."""
+        if not self.offenders:
+            return "Blocking-call detector: no stalls recorded"
+        ranked = sorted(self.offenders.items(), key=lambda item: item[1]["total"], reverse=True)
+        lines = [f"Blocking-call detector: {sum(e['count'] for e in self.offenders.values())} stalls "
+                 f"over {self.threshold * 1000:.0f}ms"]
+        for rank, (key, entry) in enumerate(ranked[:top], 1):
+            lines.append(f"  {rank:2d}. {key}: {entry['count']}x, total {entry['total']:.2f}s, "
+                         f"max {entry['max'] * 1000:.0f}ms")
+            if entry["stack"]:
+                for frame in entry["stack"][-4:]:
+                    lines.append(f"        {os.path.basename(frame.filename)}:{frame.lineno} {frame.name}")
+        return "\n".join(lines)
+
+    def stop(self):
+        """Stop the watchdog thread."""
+        self.stopped.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
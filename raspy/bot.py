@@ -4,6 +4,9 @@ from dotenv import load_dotenv
 from telegram import ReplyKeyboardMarkup, Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 
+import config
+from mood_channel import write_mood_file, send_mood
+
 load_dotenv()
 
 BOT_TOKEN = os.getenv("TELEGRAM_TOKEN")
@@ -19,11 +22,16 @@ keyboard = [
 reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
-def write_mood(new_mood):
-    """Write mood to file for other processes to read."""
-    with open("mood.txt", "w") as file:
-        file.write(new_mood)
-    logger.info(f"Mood written to mood.txt: {new_mood}")
+async def write_mood(new_mood):
+    """
+    Persist the mood and push it to the running main process.
+
+    Returns:
+        True if main.py acknowledged the change
+    """
+    write_mood_file(new_mood, config.MOOD_FILE)
+    logger.info(f"Mood written to {config.MOOD_FILE}: {new_mood}")
+    return await send_mood(new_mood, config.MOOD_SOCKET_PATH)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -59,8 +67,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Bitte benutze die Tasten unten, um den Modus zu wählen.")
         return
 
-    # Write mood to file
-    write_mood(mood)
+    # Save mood and notify main.py
+    acknowledged = await write_mood(mood)
+    if not acknowledged:
+        message += "\n(ANDI ist gerade nicht aktiv – der Modus gilt ab dem nächsten Start.)"
     
     await update.message.reply_text(f"{emoji_response} {message}")
     logger.info(f"Mood changed to: {mood}")
@@ -5,23 +5,79 @@ Adjust these parameters to customize system behavior
 
 # ==================== SENSOR CONFIGURATION ====================
 
-# Distance threshold for sensor trigger (in cm)
+# Distance threshold for sensor trigger (in cm), applied to the filtered distance
 DISTANCE_TRIGGER_THRESHOLD = 5
 
+# The filtered distance must rise above this (in cm) before the next trigger
+DISTANCE_RELEASE_THRESHOLD = 10
+
+# Filtered distance must stay below the trigger threshold this long (in seconds)
+TRIGGER_MIN_DWELL = 0.3
+
+# Distance filter over the last N readings: "median" or "ewma"
+DISTANCE_FILTER_MODE = "median"
+DISTANCE_FILTER_WINDOW = 5
+DISTANCE_FILTER_ALPHA = 0.4  # EWMA only
+
+# Record raw readings to this CSV for replay_distances.py (None = off)
+DISTANCE_TRACE_FILE = None
+
 # Sensor polling interval (in seconds)
-SENSOR_POLL_INTERVAL = 0.2
+SENSOR_POLL_INTERVAL = 0.1
+
+# Maximum wait for a complete echo; longer means "no echo" (~500 cm range)
+ULTRASONIC_ECHO_TIMEOUT = 0.03
 
 # Delay after trigger to prevent multiple triggers (in seconds)
 TRIGGER_DEBOUNCE_DELAY = 3
 
+# Simulation mode (no Raspberry Pi hardware). Distances are replayed from a
+# trace with its original timing: SIM_DISTANCE_TRACE is a CSV (as written by
+# DISTANCE_TRACE_FILE), or SIM_DISTANCE_SCRIPT a list of (distance cm, seconds)
+# segments such as [(150, 10), (3, 2)]. Neither = random distances.
+SIM_DISTANCE_TRACE = None
+SIM_DISTANCE_SCRIPT = None
+SIM_DISTANCE_NOISE = 1.0  # cm, scripted traces only
+SIM_LOOP = True
+# Captures cycle through the *.jpg files in SIM_PHOTO_DIR (None = a synthetic
+# full-resolution photo) and take SIM_CAPTURE_LATENCY +- SIM_CAPTURE_JITTER seconds
+SIM_PHOTO_DIR = None
+SIM_CAPTURE_LATENCY = 0.35
+SIM_CAPTURE_JITTER = 0.05
+SIM_SEED = 0
+
+# ==================== PIPELINE CONFIGURATION ====================
+
+# Worker threads for blocking I/O stages (API calls, downloads, file moves).
+# Camera captures run on one dedicated hardware thread; the ultrasonic pins
+# belong to the ranging thread and the LED pins to the LED animator thread.
+IO_WORKERS = 4
+
+# ==================== NETWORK CONFIGURATION ====================
+
+# All API calls share keep-alive connection pools created once at startup
+REPLICATE_API_URL = "https://api.replicate.com/v1"
+HTTP_MAX_CONNECTIONS = 10
+HTTP_KEEPALIVE_EXPIRY = 120  # seconds an idle connection stays open
+
+# Hosts pre-connected at startup besides the OpenAI and Replicate APIs
+# (Replicate serves generated files from its delivery CDN)
+HTTP_WARMUP_URLS = ["https://replicate.delivery/"]
+
+# Re-touch all hosts this often so the pools stay warm between triggers
+HTTP_KEEPALIVE_INTERVAL = 45
+
 # ==================== LED CONFIGURATION ====================
 
-# LED warning sequence colors (R, G, B)
+# LED colors as (R, G, B) pin levels. The RGB LED is inverted (common
+# anode): 0 switches a channel on, 1 switches it off
 LED_COLORS = {
-    "green": (0, 1, 0),
-    "yellow": (1, 1, 0),
-    "red": (1, 0, 0),
-    "off": (0, 0, 0)
+    "green": (1, 0, 1),
+    "yellow": (0, 0, 1),
+    "red": (0, 1, 1),
+    "blue": (1, 1, 0),
+    "white": (0, 0, 0),
+    "off": (1, 1, 1)
 }
 
 # LED blink timing (in seconds)
@@ -29,6 +85,20 @@ LED_ON_TIME = 0.3
 LED_OFF_TIME = 0.1
 LED_BLINKS = 5  # Total blinks in sequence
 
+# LED animations as (color, seconds) keyframes. They run on their own thread,
+# so the pipeline keeps working while they play.
+LED_ANIMATIONS = {
+    # Countdown before the photo, getting faster
+    "warning": 2 * [("green", 0.2), ("yellow", 0.2), ("red", 0.2)]
+               + 2 * [("green", 0.1), ("yellow", 0.1), ("red", 0.1)]
+               + 3 * [("green", 0.05), ("yellow", 0.05), ("green", 0.05)]
+               + [("red", 0.5), ("off", 0)],
+    # Repeats while the photo is analyzed and the response is generated
+    "thinking": [("yellow", LED_ON_TIME), ("off", LED_OFF_TIME)],
+    "error": LED_BLINKS * [("red", LED_ON_TIME), ("off", LED_OFF_TIME)],
+    "idle": [("off", 0)],
+}
+
 # ==================== HARDWARE PINS ====================
 
 # Ultrasonic sensor GPIO pins
@@ -45,6 +115,25 @@ SERIAL_PORT = '/dev/serial0'
 SERIAL_BAUDRATE = 115200
 SERIAL_TIMEOUT = 1
 
+# Send moods as binary frames (serial_protocol.py) that the display acknowledges,
+# instead of MOOD:<name> lines. Needs the current Arduino firmware.
+SERIAL_BINARY_PROTOCOL = True
+# Seconds to wait for an ACK before retransmitting, and retransmissions per frame
+SERIAL_ACK_TIMEOUT = 0.2
+SERIAL_RETRIES = 2
+# Maximum rate (frames per second per type) of high-rate frames such as animation
+# parameters; 115200 baud carries ~11.5 KB/s. Keep it above LIP_SYNC_FPS so
+# timing jitter does not hold envelope frames back.
+SERIAL_STREAM_RATE = 50
+
+# Stream the loudness envelope of the speech to the eye display while audio
+# plays (needs numpy, ffmpeg or mpg123 and SERIAL_BINARY_PROTOCOL).
+# 7-byte frames at 30 fps use ~2% of the UART.
+LIP_SYNC_ENABLED = True
+LIP_SYNC_FPS = 30
+# Seconds between starting the player and audible output
+LIP_SYNC_LATENCY = 0.1
+
 # Camera
 CAMERA_RESOLUTION = (1920, 1080)
 
@@ -58,11 +147,48 @@ AUDIO_ARCHIVE_DIR = "audio/archive"
 CURRENT_PHOTO_FILE = "photo.jpg"
 CURRENT_AUDIO_FILE = "audio.mp3"
 
+# Archive retention: the oldest archived photos/audio files are deleted once
+# both archives together exceed ARCHIVE_MAX_BYTES or are older than
+# ARCHIVE_MAX_AGE seconds (None disables a limit)
+ARCHIVE_MAX_BYTES = 500 * 1024 * 1024
+ARCHIVE_MAX_AGE = 30 * 24 * 3600
+
+# SQLite index with one row per interaction (paths, text, latencies, token
+# usage, cache hits); query it with `python interaction_store.py`.
+# Rows are written in batches of up to INTERACTION_BATCH_SIZE, at the latest
+# after INTERACTION_FLUSH_INTERVAL seconds. None disables the index.
+INTERACTION_DB = "interactions.db"
+INTERACTION_BATCH_SIZE = 20
+INTERACTION_FLUSH_INTERVAL = 5.0
+
+# Write a Chrome trace-event JSON per trigger (open in chrome://tracing or
+# https://ui.perfetto.dev). Only the newest TRACE_KEEP files are kept.
+# None disables tracing.
+TRACE_DIR = "traces"
+TRACE_KEEP = 50
+
+# Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics (None = off).
+# Event-loop lag is sampled every LOOP_LAG_INTERVAL seconds.
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+LOOP_LAG_INTERVAL = 0.5
+
+# Debug: a watchdog thread logs the event-loop stack whenever the loop does
+# not tick for more than BLOCKING_THRESHOLD seconds, and the worst offenders
+# are reported on shutdown. Leave off in normal operation.
+BLOCKING_DETECTOR = False
+BLOCKING_THRESHOLD = 0.1
+
 # ==================== MOODS ====================
 
 AVAILABLE_MOODS = ["happy", "flirty", "angry", "bored"]
 DEFAULT_MOOD = "happy"
 
+# bot.py pushes mood changes to main.py over this Unix domain socket.
+# mood.txt is still written (atomically) so the mood survives restarts.
+MOOD_FILE = "mood.txt"
+MOOD_SOCKET_PATH = "mood.sock"
+
 # ==================== LLM CONFIGURATION ====================
 
 # OpenAI model for image analysis
@@ -71,6 +197,41 @@ LLM_MODEL = "gpt-4o-mini"
 # Temperature for responses (0.0 = deterministic, 1.0 = random)
 LLM_TEMPERATURE = 0.8
 
+# Stream the LLM response and send every finished sentence to TTS right
+# away, so text and audio generation overlap instead of adding up
+LLM_SENTENCE_STREAMING = True
+
+# Sentences shorter than this are merged with the next one before TTS
+TTS_MIN_SENTENCE_CHARS = 20
+
+# Image preprocessing before upload: the still is downscaled so its long
+# edge is at most IMAGE_MAX_EDGE pixels and re-encoded as JPEG
+IMAGE_MAX_EDGE = 1024
+IMAGE_JPEG_QUALITY = 80
+
+# OpenAI image detail level ("low", "high", "auto" or None to omit).
+# "low" makes the API work on a 512px image, so pair it with IMAGE_MAX_EDGE = 512.
+IMAGE_DETAIL = None
+
+# Perceptual-hash response cache: a photo within MAX_DISTANCE bits (of 64)
+# of a cached photo in the same mood reuses the cached response
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_FILE = "cache/responses.json"
+RESPONSE_CACHE_MAX_DISTANCE = 5
+RESPONSE_CACHE_TTL = 600  # seconds
+RESPONSE_CACHE_MAX_ENTRIES = 100
+
+# Latency budget and hedging for API calls. A call that has not answered
+# within its budget fails and the usual fallback is used. A call that has
+# not answered after the observed p90 latency (HEDGE_AFTER seconds until
+# enough calls were seen) is raced by a second request, optionally to a
+# fallback model; the first answer wins and the other request is cancelled
+API_HEDGING = True
+API_HEDGE_QUANTILE = 0.9
+OPENAI_BUDGET = 10.0  # seconds until the answer (or the end of the stream)
+OPENAI_HEDGE_AFTER = 3.0
+OPENAI_HEDGE_MODEL = None  # e.g. "gpt-4o-mini"; None = same model
+
 # ==================== AUDIO CONFIGURATION ====================
 
 # Text-to-speech service
@@ -82,6 +243,35 @@ AUDIO_SAMPLE_RATE = 32000
 AUDIO_FORMAT = "mp3"
 AUDIO_CHANNEL = "mono"
 
+# Latency budget and hedging for the TTS prediction (see API_HEDGING)
+REPLICATE_BUDGET = 15.0
+REPLICATE_HEDGE_AFTER = 6.0
+REPLICATE_HEDGE_MODEL = None  # e.g. "minimax/speech-02-hd"; None = same model
+
+# Pipe the TTS download straight into a player instead of waiting for the
+# whole file (needs mpg123, sox, ffplay or cvlc). With LLM_SENTENCE_STREAMING
+# only the first segment is streamed; later ones download while it plays.
+AUDIO_STREAMING = True
+AUDIO_STREAM_CHUNK_SIZE = 4096  # bytes per chunk fed to the player
+
+# Keep one player process (sox, pacat or aplay) open for the whole run and
+# feed it decoded PCM (ffmpeg or mpg123), instead of starting a player per
+# clip. Queued clips play back to back. With KEEP_WARM, silence is fed while
+# idle so Bluetooth speakers do not suspend between triggers.
+AUDIO_OUTPUT_PERSISTENT = True
+AUDIO_OUTPUT_KEEP_WARM = True
+
+# Short pre-rendered "thinking" clips per mood, played the moment the photo
+# is taken while the analysis runs (rendered once via TTS, kept on disk)
+THINKING_CLIPS_ENABLED = True
+THINKING_CLIP_DIR = "audio/thinking"
+
+# Content-addressed TTS cache (text + voice + mood voice settings). Repeated
+# utterances play from disk without a Replicate call.
+AUDIO_CACHE_ENABLED = True
+AUDIO_CACHE_DIR = "audio/cache"
+AUDIO_CACHE_MAX_BYTES = 50 * 1024 * 1024  # least recently used files evicted beyond this
+
 # Default audio settings per mood
 AUDIO_SETTINGS = {
     "happy": {
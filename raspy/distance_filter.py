@@ -0,0 +1,148 @@
+import csv
+import logging
+import statistics
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class DistanceFilter:
+    """Smooth noisy distance readings over a ring buffer of the last N samples."""
+
+    def __init__(self, window=5, mode="median", alpha=0.4):
+        """
+        Args:
+            window: Number of readings kept in the ring buffer
+            mode: "median" (robust against single outliers) or "ewma"
+            alpha: EWMA smoothing factor (0..1, higher follows faster)
+        """
+        if mode not in ("median", "ewma"):
+            raise ValueError(f"Unknown filter mode: {mode}")
+        self.mode = mode
+        self.alpha = alpha
+        self.samples = deque(maxlen=window)
+        self.ewma = None
+
+    def update(self, distance):
+        """
+        Add a reading and return the filtered distance.
+
+        Args:
+            distance: Distance in cm
+
+        Returns:
+            Filtered distance in cm
+        """
+        self.samples.append(distance)
+        if self.mode == "median":
+            return statistics.median(self.samples)
+        if self.ewma is None:
+            self.ewma = distance
+        else:
+            self.ewma = self.alpha * distance + (1 - self.alpha) * self.ewma
+        return self.ewma
+
+    def reset(self):
+        """Forget all buffered readings."""
+        self.samples.clear()
+        self.ewma = None
+
+
+class TriggerDetector:
+    """Hysteresis trigger on the filtered distance with a minimum dwell time."""
+
+    def __init__(self, arm_threshold=5, disarm_threshold=10, min_dwell=0.3, distance_filter=None):
+        """
+        Args:
+            arm_threshold: Filtered distance (cm) below which a trigger can fire
+            disarm_threshold: Filtered distance (cm) the reading must rise above before the next trigger
+            min_dwell: Seconds the filtered distance must stay below arm_threshold
+            distance_filter: DistanceFilter instance (defaults to a 5-sample median)
+        """
+        if disarm_threshold < arm_threshold:
+            raise ValueError("disarm_threshold must be >= arm_threshold")
+        self.arm_threshold = arm_threshold
+        self.disarm_threshold = disarm_threshold
+        self.min_dwell = min_dwell
+        self.filter = distance_filter or DistanceFilter()
+        self.below_since = None
+        self.triggered = False
+        self.last_filtered = None
+
+    def update(self, distance, timestamp):
+        """
+        Feed one reading.
+
+        Args:
+            distance: Distance in cm; None or negative values (no echo, errors) are ignored
+            timestamp: Reading time in seconds (any monotonic clock)
+
+        Returns:
+            True exactly once per approach, when the trigger fires
+        """
+        if distance is None or distance < 0:
+            return False
+
+        filtered = self.filter.update(distance)
+        self.last_filtered = filtered
+
+        if self.triggered:
+            # Re-arm only after the object has clearly moved away
+            if filtered > self.disarm_threshold:
+                self.triggered = False
+                self.below_since = None
+            return False
+
+        if filtered >= self.arm_threshold:
+            self.below_since = None
+            return False
+
+        if self.below_since is None:
+            self.below_since = timestamp
+        if timestamp - self.below_since >= self.min_dwell:
+            self.triggered = True
+            return True
+        return False
+
+
+class TraceRecorder:
+    """Append raw distance readings to a CSV trace for offline replay."""
+
+    FIELDS = ["time", "distance", "status"]
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        if self.file.tell() == 0:
+            self.writer.writerow(self.FIELDS)
+        logger.info(f"Recording distance trace to {path}")
+
+    def record(self, timestamp, distance, status):
+        self.writer.writerow([f"{timestamp:.4f}", "" if distance is None else distance, status])
+
+    def close(self):
+        self.file.close()
+
+
+def load_trace(path):
+    """
+    Load a distance trace CSV.
+
+    Columns: time (s), distance (cm, empty for no echo), optional status,
+    optional present (1/0 ground truth: someone is actually covering the sensor).
+
+    Returns:
+        List of dicts with time, distance and present (None if unlabeled)
+    """
+    rows = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            distance = row.get("distance", "")
+            present = row.get("present", "")
+            rows.append({
+                "time": float(row["time"]),
+                "distance": float(distance) if distance not in ("", None) else None,
+                "present": int(present) if present not in ("", None) else None,
+            })
+    return rows
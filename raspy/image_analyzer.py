@@ -1,14 +1,41 @@
-import os
+import io
+import asyncio
+import re
+import time
 import base64
 import logging
-from dotenv import load_dotenv
-from openai import OpenAI
 
-load_dotenv()
+import config
+import metrics
+import tracing
+from network import upload_timing as async_upload_timing
+from request_policy import RequestPolicy
+from response_cache import ResponseCache
 
 logger = logging.getLogger(__name__)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    logger.warning("Pillow not available - images are uploaded without downscaling")
+    PIL_AVAILABLE = False
+
+openai_policy = RequestPolicy(
+    "openai",
+    budget=config.OPENAI_BUDGET,
+    hedge_after=config.OPENAI_HEDGE_AFTER,
+    hedge_model=config.OPENAI_HEDGE_MODEL,
+    quantile=config.API_HEDGE_QUANTILE,
+    hedging=config.API_HEDGING,
+)
+
+response_cache = ResponseCache(
+    cache_file=config.RESPONSE_CACHE_FILE,
+    max_distance=config.RESPONSE_CACHE_MAX_DISTANCE,
+    ttl=config.RESPONSE_CACHE_TTL,
+    max_entries=config.RESPONSE_CACHE_MAX_ENTRIES,
+) if config.RESPONSE_CACHE_ENABLED else None
 
 MOOD_PROMPTS = {
     "happy": "Gib mir ein kurzes, freundliches und kreatives Mode-Kompliment zu dem oder den Outfits auf dem Bild. Ein einziger, charmanter Satz genügt. Sei dabei so freundlich und entzückend wie möglich gegenüber dem Kleidungsstil, nach dem Motto: 'Das ist das stilvollste, was ich je gesehen habe'.",
@@ -21,33 +48,196 @@ MOOD_PROMPTS = {
 }
 
 
+VISION_MODEL = "gpt-4.1-nano"
+
+# Sentence boundary: terminating punctuation (optionally followed by closing
+# quotes) and whitespace
+SENTENCE_END = re.compile(r'[.!?…]+["\'“”‘’»«]*\s+')
+
+
 class ImageAnalyzer:
     """Analyze images using OpenAI Vision API."""
     
     @staticmethod
-    def encode_image(path: str) -> str:
-        """Encode image to base64."""
+    def read_image(image) -> bytes:
+        """Return the encoded image bytes for a path or for bytes passed directly."""
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return bytes(image)
+        with open(image, "rb") as f:
+            return f.read()
+    
+    @staticmethod
+    def encode_image(image) -> str:
+        """Encode image (path or JPEG bytes) to base64."""
         try:
-            with open(path, "rb") as f:
-                return base64.b64encode(f.read()).decode("utf-8")
+            return base64.b64encode(ImageAnalyzer.read_image(image)).decode("utf-8")
         except Exception as e:
             logger.error(f"Error encoding image: {e}")
             return None
     
     @staticmethod
-    def analyze_image(image_path: str, mood: str = "happy") -> str:
+    def prepare_image(image) -> str:
         """
-        Analyze image using OpenAI Vision API based on mood.
+        Downscale and re-encode an image for upload, then encode it to base64.
+        
+        The long edge is limited to config.IMAGE_MAX_EDGE and the JPEG is
+        re-encoded at config.IMAGE_JPEG_QUALITY. Falls back to the original
+        file if Pillow is missing or the image cannot be processed.
         
         Args:
-            image_path: Path to the image file
+            image: Path to the image file or JPEG bytes
+        
+        Returns:
+            Base64 encoded JPEG or None
+        """
+        if not PIL_AVAILABLE:
+            return ImageAnalyzer.encode_image(image)
+        
+        try:
+            start = time.perf_counter()
+            data = ImageAnalyzer.read_image(image)
+            original_size = len(data)
+            max_edge = config.IMAGE_MAX_EDGE
+            with Image.open(io.BytesIO(data)) as img:
+                # Let the JPEG decoder do most of the downscaling (DCT scaling)
+                img.draft("RGB", (max_edge, max_edge))
+                img = img.convert("RGB")
+                img.thumbnail((max_edge, max_edge))
+                buffer = io.BytesIO()
+                img.save(buffer, format="JPEG", quality=config.IMAGE_JPEG_QUALITY, optimize=True)
+            
+            encoded = buffer.getvalue()
+            saved = original_size - len(encoded)
+            logger.info(
+                f"Image prepared in {time.perf_counter() - start:.2f}s: {img.size[0]}x{img.size[1]}, "
+                f"{original_size / 1024:.0f} KB -> {len(encoded) / 1024:.0f} KB "
+                f"(saved {saved / 1024:.0f} KB, {saved / max(original_size, 1):.0%})"
+            )
+            return base64.b64encode(encoded).decode("utf-8")
+        except Exception as e:
+            logger.warning(f"Could not downscale image, uploading original: {e}")
+            return ImageAnalyzer.encode_image(image)
+    
+    @staticmethod
+    def log_upload_time(timing):
+        """
+        Log how long sending the request body took.
+        
+        Args:
+            timing: Timing dict of the request (see network.upload_timing)
+        """
+        duration = timing.get("upload")
+        if duration is not None:
+            logger.info(f"Image upload took {duration:.2f}s")
+    
+    @staticmethod
+    def record_usage(info, usage):
+        """Copy token usage from an API response (object or dict) into info."""
+        if info is None or not usage:
+            return
+        for field in ("prompt_tokens", "completion_tokens"):
+            value = usage.get(field) if isinstance(usage, dict) else getattr(usage, field, None)
+            if value is not None:
+                info[field] = value
+    
+    @staticmethod
+    def build_messages(prompt: str, base64_image: str) -> list:
+        """Build the chat messages for a prompt and a base64 encoded JPEG."""
+        image_url = {
+            "url": f"data:image/jpeg;base64,{base64_image}",
+        }
+        if config.IMAGE_DETAIL:
+            image_url["detail"] = config.IMAGE_DETAIL
+        return [
+        #     {
+        #     "role": "developer",
+        #     "content": "Sprich wie ein übertrieben homosexueller affektierter Modeschöpfer aus Paris"
+        # },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt,
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": image_url,
+                    },
+                ],
+            }
+        ]
+    
+    @staticmethod
+    def cache_lookup(image, mood: str):
+        """
+        Look up a cached response for a similar photo in the same mood.
+        
+        Returns:
+            (image hash or None, cached text or None)
+        """
+        if response_cache is None:
+            return None, None
+        image_hash = ResponseCache.image_hash(image)
+        return image_hash, response_cache.lookup(image_hash, mood)
+    
+    @staticmethod
+    def split_sentences(buffer: str, min_chars: int = 0):
+        """
+        Split complete sentences off the front of a text buffer.
+        
+        Args:
+            buffer: Text received so far
+            min_chars: Sentences shorter than this are merged with the next one
+        
+        Returns:
+            (list of complete sentences, remaining buffer)
+        """
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(buffer):
+            sentence = buffer[start:match.end()].strip()
+            if len(sentence) >= min_chars:
+                sentences.append(sentence)
+                start = match.end()
+        return sentences, buffer[start:]
+    
+    @staticmethod
+    async def _prepare_async(image, mood: str):
+        """
+        Cache lookup and image preprocessing (both CPU-bound) in a worker thread.
+        
+        Returns:
+            (image hash, cached text or None, base64 image or None)
+        """
+        with tracing.span("image.cache_lookup"):
+            image_hash, cached = await asyncio.to_thread(ImageAnalyzer.cache_lookup, image, mood)
+        if cached:
+            return image_hash, cached, None
+        with tracing.span("image.prepare"):
+            base64_image = await asyncio.to_thread(ImageAnalyzer.prepare_image, image)
+        return image_hash, None, base64_image
+    
+    @staticmethod
+    async def analyze_image_async(image, mood: str, network, info: dict = None) -> str:
+        """
+        Analyze image over the shared async OpenAI client.
+        
+        Args:
+            image: Path to the image file or JPEG bytes
             mood: Mood to use for analysis (happy, flirty, angry, bored)
+            network: NetworkClients instance
+            info: Optional dict that receives cache_hit, token usage and upload time
         
         Returns:
             Analysis text
         """
+        info = {} if info is None else info
         try:
-            base64_image = ImageAnalyzer.encode_image(image_path)
+            image_hash, cached, base64_image = await ImageAnalyzer._prepare_async(image, mood)
+            info["cache_hit"] = bool(cached)
+            if cached:
+                return cached
             if not base64_image:
                 return "Konnte das Bild nicht verarbeiten."
             
@@ -55,35 +245,156 @@ class ImageAnalyzer:
             
             logger.info(f"Sending image to OpenAI for analysis with mood: {mood}")
             
-            response = client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[
-        #             {
-        #     "role": "developer",
-        #     "content": "Sprich wie ein übertrieben homosexueller affektierter Modeschöpfer aus Paris"
-        # },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt,
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                },
-                            },
-                        ],
-                    }
-                ],
-            )
+            timing = {}
+            async_upload_timing.set(timing)
+            messages = ImageAnalyzer.build_messages(prompt, base64_image)
+            
+            async def attempt(model):
+                return await network.openai.chat.completions.create(model=model, messages=messages)
+            
+            with tracing.span("openai.request", model=VISION_MODEL):
+                response = await openai_policy.run(attempt, VISION_MODEL)
+            ImageAnalyzer.log_upload_time(timing)
+            info["upload"] = timing.get("upload")
+            ImageAnalyzer.record_usage(info, response.usage)
             
             analysis = response.choices[0].message.content
             logger.info(f"Analysis completed: {analysis[:100]}...")
+            if response_cache:
+                await asyncio.to_thread(response_cache.store, image_hash, mood, analysis)
             return analysis
             
         except Exception as e:
             logger.error(f"Error analyzing image: {e}")
+            metrics.API_ERRORS.inc(api="openai")
             return "Es gab einen Fehler bei der Bildanalyse."
+    
+    @staticmethod
+    async def stream_sentences_async(image, mood: str, network, min_chars: int = 20, info: dict = None):
+        """
+        Analyze an image over the shared async OpenAI client and yield the
+        response sentence by sentence.
+        
+        The response is streamed and every finished sentence is yielded as
+        soon as its terminating punctuation arrives, so TTS can start before
+        the full response is generated.
+        
+        Args:
+            image: Path to the image file or JPEG bytes
+            mood: Mood to use for analysis (happy, flirty, angry, bored)
+            network: NetworkClients instance
+            min_chars: Minimum sentence length before it is yielded on its own
+            info: Optional dict that receives cache_hit, token usage and upload time
+        
+        Yields:
+            Sentences of the analysis text
+        """
+        info = {} if info is None else info
+        yielded = False
+        try:
+            image_hash, cached, base64_image = await ImageAnalyzer._prepare_async(image, mood)
+            info["cache_hit"] = bool(cached)
+            if cached:
+                sentences, rest = ImageAnalyzer.split_sentences(cached + " ", min_chars)
+                for sentence in sentences + ([rest.strip()] if rest.strip() else []):
+                    yielded = True
+                    yield sentence
+                return
+            if not base64_image:
+                yielded = True
+                yield "Konnte das Bild nicht verarbeiten."
+                return
+            
+            prompt = MOOD_PROMPTS.get(mood, MOOD_PROMPTS["happy"])
+            
+            logger.info(f"Streaming image analysis from OpenAI with mood: {mood}")
+            
+            timing = {}
+            async_upload_timing.set(timing)
+            messages = ImageAnalyzer.build_messages(prompt, base64_image)
+            
+            async def attempt(model):
+                # An attempt lasts until the first token, so the hedge applies
+                # to the time to first token; the rest of the budget then
+                # bounds the remaining stream
+                stream = await network.openai.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    # The last chunk then carries the token usage
+                    extra_body={"stream_options": {"include_usage": True}},
+                )
+                head = []
+                try:
+                    while (chunk := await anext(stream, None)) is not None:
+                        head.append(chunk)
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            break
+                except BaseException:
+                    await stream.response.aclose()
+                    raise
+                return stream, head
+            
+            async def discard(result):
+                await result[0].response.aclose()
+            
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + openai_policy.budget if openai_policy.budget else None
+            with tracing.span("openai.request", model=VISION_MODEL, stream=True):
+                stream, head = await openai_policy.run(attempt, VISION_MODEL, discard)
+            ImageAnalyzer.log_upload_time(timing)
+            info["upload"] = timing.get("upload")
+            
+            async def chunks():
+                for chunk in head:
+                    yield chunk
+                async for chunk in stream:
+                    yield chunk
+            
+            buffer = ""
+            full_text = ""
+            pending = chunks()
+            try:
+                while True:
+                    # Only the wait for the next chunk is timed, not the
+                    # consumer while a sentence is yielded
+                    try:
+                        async with asyncio.timeout_at(deadline):
+                            chunk = await anext(pending, None)
+                    except TimeoutError:
+                        openai_policy.record_timeout()
+                        raise TimeoutError(f"openai stream exceeded its {openai_policy.budget:.1f}s budget")
+                    if chunk is None:
+                        break
+                    ImageAnalyzer.record_usage(info, getattr(chunk, "usage", None))
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if not full_text:
+                        tracing.mark("openai.first_token")
+                    buffer += delta
+                    full_text += delta
+                    sentences, buffer = ImageAnalyzer.split_sentences(buffer, min_chars)
+                    for sentence in sentences:
+                        logger.debug(f"Sentence ready: {sentence}")
+                        yielded = True
+                        yield sentence
+            finally:
+                # Also ends the HTTP response when the budget ran out or the
+                # consumer stopped early
+                await stream.response.aclose()
+            
+            if buffer.strip():
+                yielded = True
+                yield buffer.strip()
+            
+            if response_cache and full_text.strip():
+                await asyncio.to_thread(response_cache.store, image_hash, mood, full_text.strip())
+            
+        except Exception as e:
+            logger.error(f"Error streaming image analysis: {e}")
+            metrics.API_ERRORS.inc(api="openai")
+            if not yielded:
+                yield "Es gab einen Fehler bei der Bildanalyse."
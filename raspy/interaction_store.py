@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+SQLite index of all interactions (one row per trigger).
+
+Rows are queued by the event loop and written in batches by a background
+thread. Run this module to print latency percentiles per mood and the
+slowest interactions:
+    python interaction_store.py [interactions.db] [--stage total_time] [--slowest 10]
+"""
+
+import json
+import time
+import queue
+import sqlite3
+import logging
+import argparse
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    trigger_id TEXT NOT NULL,
+    mood TEXT NOT NULL,
+    photo_path TEXT,
+    audio_path TEXT,
+    response_text TEXT,
+    photo_time REAL,
+    llm_time REAL,
+    tts_time REAL,
+    first_sentence_time REAL,
+    first_audio_time REAL,
+    upload_time REAL,
+    total_time REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    response_cache_hit INTEGER,
+    audio_cache_hit INTEGER,
+    timings TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_created ON interactions (created);
+CREATE INDEX IF NOT EXISTS idx_interactions_mood ON interactions (mood, created);
+"""
+
+COLUMNS = [
+    "created", "trigger_id", "mood", "photo_path", "audio_path", "response_text",
+    "photo_time", "llm_time", "tts_time", "first_sentence_time", "first_audio_time",
+    "upload_time", "total_time", "prompt_tokens", "completion_tokens",
+    "response_cache_hit", "audio_cache_hit", "timings",
+]
+
+# Stage columns that can be queried with percentiles()
+STAGES = [
+    "photo_time", "llm_time", "tts_time", "first_sentence_time",
+    "first_audio_time", "upload_time", "total_time",
+]
+
+
+class InteractionStore:
+    """Batched, non-blocking writer for the interaction index."""
+
+    def __init__(self, db_path="interactions.db", batch_size=20, flush_interval=5.0):
+        """
+        Args:
+            db_path: SQLite database file
+            batch_size: Rows written per transaction at most
+            flush_interval: Seconds a queued row waits at most before it is written
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows = queue.Queue()
+        self.thread = None
+        self.written_total = 0
+
+    def start(self):
+        """Create the schema and start the writer thread."""
+        self.thread = threading.Thread(target=self._run, name="interaction-store", daemon=True)
+        self.thread.start()
+
+    def record(self, **fields):
+        """
+        Queue one interaction without blocking.
+
+        Args:
+            **fields: Values for COLUMNS; missing ones are stored as NULL.
+                `timings` may be a dict (stored as JSON).
+        """
+        fields.setdefault("created", time.time())
+        if isinstance(fields.get("timings"), dict):
+            fields["timings"] = json.dumps(fields["timings"])
+        self.rows.put(tuple(fields.get(column) for column in COLUMNS))
+
+    def stop(self):
+        """Write all queued rows and stop the writer."""
+        if self.thread:
+            self.rows.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        connection = sqlite3.connect(self.db_path)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            running = True
+            while running:
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        row = self.rows.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if row is None:
+                        running = False
+                        break
+                    batch.append(row)
+                if batch:
+                    self._write(connection, batch)
+        except Exception as e:
+            logger.error(f"Interaction store failed: {e}")
+        finally:
+            connection.close()
+
+    def _write(self, connection, batch):
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        try:
+            with connection:
+                connection.executemany(
+                    f"INSERT INTO interactions ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                    batch,
+                )
+            self.written_total += len(batch)
+            logger.debug(f"Wrote {len(batch)} interactions to {self.db_path}")
+        except Exception as e:
+            logger.error(f"Error writing interactions: {e}")
+
+
+def percentiles(connection, stage="total_time", mood=None, since=None):
+    """
+    Latency percentiles of one stage.
+
+    Args:
+        connection: sqlite3 connection
+        stage: Column from STAGES
+        mood: Only this mood (None = all)
+        since: Only rows created after this Unix time
+
+    Returns:
+        Dict with count, p50, p95 and max (None values if there are no rows)
+    """
+    if stage not in STAGES:
+        raise ValueError(f"Unknown stage: {stage}")
+    query = f"SELECT {stage} FROM interactions WHERE {stage} IS NOT NULL"
+    params = []
+    if mood:
+        query += " AND mood = ?"
+        params.append(mood)
+    if since:
+        query += " AND created >= ?"
+        params.append(since)
+    values = sorted(row[0] for row in connection.execute(query, params))
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "max": None}
+    return {
+        "count": len(values),
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+        "max": values[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the interaction index")
+    parser.add_argument("db", nargs="?", default="interactions.db")
+    parser.add_argument("--stage", choices=STAGES, default="total_time")
+    parser.add_argument("--slowest", type=int, default=10, help="List the N slowest interactions")
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db)
+    moods = [row[0] for row in connection.execute("SELECT DISTINCT mood FROM interactions ORDER BY mood")]
+    print(f"{args.stage} per mood:")
+    for mood in moods + [None]:
+        stats = percentiles(connection, args.stage, mood)
+        if stats["count"]:
+            print(f"  {mood or 'all':8s} n={stats['count']:4d}  p50={stats['p50']:6.2f}s  "
+                  f"p95={stats['p95']:6.2f}s  max={stats['max']:6.2f}s")
+
+    print(f"\nSlowest {args.slowest} by {args.stage}:")
+    rows = connection.execute(
+        f"SELECT trigger_id, mood, {args.stage}, response_cache_hit, audio_path FROM interactions "
+        f"WHERE {args.stage} IS NOT NULL ORDER BY {args.stage} DESC LIMIT ?",
+        (args.slowest,),
+    )
+    for trigger_id, mood, value, cache_hit, audio_path in rows:
+        print(f"  {trigger_id}  {mood:7s} {value:6.2f}s  cache={'hit' if cache_hit else 'miss'}  {audio_path}")
+    connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,181 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class Animation:
+    """Handle of a started or queued LED animation."""
+
+    def __init__(self, name, frames, loop=False):
+        self.name = name
+        self.frames = frames
+        self.loop = loop
+        self.cancelled = False
+        self.done = threading.Event()
+        try:
+            event_loop = asyncio.get_running_loop()
+            self._future = event_loop.create_future()
+        except RuntimeError:
+            event_loop, self._future = None, None
+        self._event_loop = event_loop
+
+    def _finish(self, cancelled=False):
+        self.cancelled = self.cancelled or cancelled
+        self.done.set()
+        if self._future is not None:
+            try:
+                self._event_loop.call_soon_threadsafe(self._resolve)
+            except RuntimeError:
+                # Event loop already closed
+                pass
+
+    def _resolve(self):
+        if not self._future.done():
+            self._future.set_result(not self.cancelled)
+
+    def join(self, timeout=None):
+        """Block until the animation ended; True if it ran to completion."""
+        self.done.wait(timeout)
+        return self.done.is_set() and not self.cancelled
+
+    async def wait(self):
+        """Wait without blocking the event loop; True if it ran to completion."""
+        if self._future is None:
+            return await asyncio.to_thread(self.join)
+        return await asyncio.shield(self._future)
+
+
+class LedAnimator:
+    """
+    Keyframe LED animations on a dedicated thread.
+
+    An animation is a list of (color, seconds) keyframes; a color is a name
+    from `colors` or an (r, g, b) tuple. Frames are scheduled against a
+    deadline so timing does not drift, and a new animation interrupts the
+    current one immediately.
+    """
+
+    def __init__(self, set_color, colors=None, animations=None):
+        """
+        Args:
+            set_color: Callable(r, g, b) that drives the LED pins
+            colors: Color name -> (r, g, b)
+            animations: Animation name -> keyframe list
+        """
+        self.set_color = set_color
+        self.colors = dict(colors or {})
+        self.animations = dict(animations or {})
+        self.condition = threading.Condition()
+        self.queue = deque()
+        self.current = None
+        self.stopped = False
+        self.thread = None
+        self.played_total = 0
+
+    def _create(self, animation, loop):
+        if isinstance(animation, str):
+            if animation not in self.animations:
+                raise ValueError(f"Unknown LED animation: {animation}")
+            return Animation(animation, self.animations[animation], loop)
+        return Animation("custom", list(animation), loop)
+
+    def _ensure_thread(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="led-animator", daemon=True)
+            self.thread.start()
+
+    def play(self, animation, loop=False):
+        """
+        Start an animation now, interrupting the current one and dropping queued ones.
+
+        Args:
+            animation: Name from `animations` or a keyframe list
+            loop: Repeat until interrupted
+
+        Returns:
+            Animation handle (join() / await wait()); after stop() it is
+            already finished as cancelled
+        """
+        handle = self._create(animation, loop)
+        with self.condition:
+            if self.stopped:
+                handle._finish(cancelled=True)
+                return handle
+            self._cancel_locked()
+            self.queue.append(handle)
+            self._ensure_thread()
+            self.condition.notify_all()
+        return handle
+
+    def chain(self, animation, loop=False):
+        """Queue an animation to start when the current and queued ones end."""
+        handle = self._create(animation, loop)
+        with self.condition:
+            if self.stopped:
+                handle._finish(cancelled=True)
+                return handle
+            self.queue.append(handle)
+            self._ensure_thread()
+            self.condition.notify_all()
+        return handle
+
+    def cancel(self):
+        """Stop the current and queued animations; the LED keeps its last color."""
+        with self.condition:
+            self._cancel_locked()
+            self.condition.notify_all()
+
+    def _cancel_locked(self):
+        if self.current is not None:
+            self.current.cancelled = True
+        while self.queue:
+            self.queue.popleft()._finish(cancelled=True)
+
+    def stop(self):
+        """Cancel everything and end the animation thread."""
+        with self.condition:
+            self._cancel_locked()
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
+        self.thread = None
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                self.current = self.queue.popleft()
+            completed = self._animate(self.current)
+            with self.condition:
+                self.current._finish(cancelled=not completed)
+                self.current = None
+            self.played_total += 1
+
+    def _animate(self, animation):
+        """Run the keyframes; False if interrupted."""
+        deadline = time.perf_counter()
+        while True:
+            for color, seconds in animation.frames:
+                if animation.cancelled:
+                    return False
+                rgb = self.colors[color] if isinstance(color, str) else color
+                try:
+                    self.set_color(*rgb)
+                except Exception as e:
+                    logger.error(f"Error setting LED color: {e}")
+                deadline += seconds
+                with self.condition:
+                    self.condition.wait_for(
+                        lambda: animation.cancelled,
+                        timeout=max(0.0, deadline - time.perf_counter())
+                    )
+            if not animation.loop or not animation.frames:
+                return not animation.cancelled
@@ -0,0 +1,133 @@
+import time
+import shutil
+import asyncio
+import logging
+import subprocess
+
+import serial_protocol as protocol
+from audio_output import DECODERS
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    logger.warning("numpy not available - lip-sync disabled")
+    NUMPY_AVAILABLE = False
+
+
+def compute_envelope(samples, sample_rate, fps=30):
+    """
+    Downsample PCM to one loudness value per animation frame.
+
+    The RMS of each frame is normalized to the clip's 95th percentile, so
+    quiet and loud voices use the full range.
+
+    Args:
+        samples: Mono int16 NumPy array
+        sample_rate: Samples per second
+        fps: Envelope frames per second
+
+    Returns:
+        uint8 array with one level (0-255) per frame
+    """
+    frame_len = max(1, sample_rate // fps)
+    frames = len(samples) // frame_len
+    if frames == 0:
+        return np.zeros(0, dtype=np.uint8)
+    blocks = samples[:frames * frame_len].astype(np.float32).reshape(frames, frame_len)
+    rms = np.sqrt(np.mean(blocks * blocks, axis=1))
+    reference = np.percentile(rms, 95)
+    if reference <= 0:
+        return np.zeros(frames, dtype=np.uint8)
+    return (np.clip(rms / reference, 0.0, 1.0) * 255).astype(np.uint8)
+
+
+class LipSync:
+    """Stream the loudness envelope of playing audio to the eye display."""
+
+    def __init__(self, serial_handler, fps=30, latency=0.1, sample_rate=8000):
+        """
+        Args:
+            serial_handler: SerialHandler used for the ANIM frames
+            fps: Envelope frames per second
+            latency: Seconds between starting the player and audible output
+            sample_rate: Decode rate; loudness needs no more than 8 kHz
+        """
+        self.serial_handler = serial_handler
+        self.fps = fps
+        self.latency = latency
+        self.sample_rate = sample_rate
+        self.decoder = next(
+            (build for name, build in DECODERS if shutil.which(name)), None
+        )
+        self.enabled = NUMPY_AVAILABLE and self.decoder is not None
+        if NUMPY_AVAILABLE and not self.decoder:
+            logger.warning("No MP3 decoder (ffmpeg/mpg123) found - lip-sync disabled")
+
+        self.frames_total = 0
+        self.frames_skipped = 0
+        self.drifts = []
+        self.stream_time = 0.0
+
+    def envelope(self, audio_path):
+        """Decode an MP3 and return its envelope (blocking)."""
+        start = time.perf_counter()
+        result = subprocess.run(
+            self.decoder(audio_path, self.sample_rate),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False
+        )
+        samples = np.frombuffer(result.stdout, dtype=np.int16)
+        levels = compute_envelope(samples, self.sample_rate, self.fps)
+        logger.debug(f"Envelope of {audio_path}: {len(levels)} frames "
+                     f"in {time.perf_counter() - start:.3f}s")
+        return levels
+
+    async def follow(self, audio_path, started_at):
+        """
+        Send envelope frames in step with a playback that started at `started_at`.
+
+        Frames whose time has already passed (while decoding) are skipped.
+        Each frame's send time is compared with its target time to measure drift.
+
+        Args:
+            audio_path: File being played
+            started_at: time.perf_counter() when the player was started
+        """
+        try:
+            levels = await asyncio.to_thread(self.envelope, audio_path)
+            origin = started_at + self.latency
+            stream_start = time.perf_counter()
+            index = max(0, int((stream_start - origin) * self.fps))
+            self.frames_skipped += min(index, len(levels))
+
+            while index < len(levels):
+                target = origin + index / self.fps
+                delay = target - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.drifts.append(time.perf_counter() - target)
+                self.serial_handler.send_stream(protocol.ANIM, bytes([levels[index]]))
+                self.frames_total += 1
+                index += 1
+            self.stream_time += time.perf_counter() - stream_start
+        except Exception as e:
+            logger.error(f"Lip-sync error: {e}")
+        finally:
+            self.serial_handler.send_stream(protocol.ANIM, bytes([0]))
+
+    def describe(self, baudrate=115200):
+        """Short summary line (bandwidth and drift) for the performance report."""
+        if not self.drifts:
+            return f"{self.frames_total} frames"
+        frame_bytes = protocol.HEADER_SIZE + 1 + protocol.CRC_SIZE
+        bytes_per_second = self.frames_total * frame_bytes / max(self.stream_time, 1e-9)
+        # 8N1: 10 bits on the wire per byte
+        budget = baudrate / 10
+        drifts_ms = sorted(abs(d) * 1000 for d in self.drifts)
+        p95 = drifts_ms[min(len(drifts_ms) - 1, int(len(drifts_ms) * 0.95))]
+        self.drifts = self.drifts[-1000:]
+        return (f"{self.frames_total} frames ({self.frames_skipped} skipped), "
+                f"{bytes_per_second:.0f} B/s ({bytes_per_second / budget:.1%} of UART), "
+                f"drift p95 {p95:.1f}ms max {drifts_ms[-1]:.1f}ms")
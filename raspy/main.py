@@ -8,10 +8,24 @@ from dotenv import load_dotenv
 
 # Import modules (removed bot import)
 from sensor_controller import SensorController
-from image_analyzer import ImageAnalyzer
+from ranging import OK
+from distance_filter import DistanceFilter, TriggerDetector, TraceRecorder
+from image_analyzer import ImageAnalyzer, response_cache, openai_policy
 from serial_handler import SerialHandler
-from audio_handler import AudioHandler
+from audio_handler import AudioHandler, audio_cache, tts_policy
 from archiver import Archiver
+from blocking_detector import BlockingDetector
+import metrics
+import tracing
+from interaction_store import InteractionStore
+from stage_runner import StageRunner
+from speech_pipeline import SpeechPipeline
+from network import NetworkClients
+from thinking_clips import ThinkingClips
+from lip_sync import LipSync
+from audio_output import AudioOutput
+from mood_channel import MoodServer
+import config
 
 # Configure logging
 logging.basicConfig(
@@ -25,7 +39,10 @@ load_dotenv()
 # Global state
 current_mood = "happy"
 mood_lock = threading.Lock()
-mood_file_path = "mood.txt"
+mood_file_path = config.MOOD_FILE
+
+# Fire-and-forget tasks (e.g. opening the serial port) are kept referenced until done
+background_tasks = set()
 
 
 def read_mood_from_file():
@@ -34,7 +51,7 @@ def read_mood_from_file():
         if Path(mood_file_path).exists():
             with open(mood_file_path, "r") as f:
                 mood = f.read().strip()
-                if mood in ["happy", "flirty", "angry", "bored"]:
+                if mood in config.AVAILABLE_MOODS:
                     return mood
     except Exception as e:
         logger.error(f"Error reading mood file: {e}")
@@ -45,13 +62,14 @@ def set_mood(new_mood):
     """Update the current mood and send it over serial."""
     global current_mood
     with mood_lock:
-        if current_mood != new_mood:
-            current_mood = new_mood
-            logger.info(f"Mood changed to: {current_mood}")
-            # Send mood over serial
-            serial_handler.send_mood(current_mood)
-            return True
-        return False
+        if current_mood == new_mood:
+            return False
+        current_mood = new_mood
+    logger.info(f"Mood changed to: {new_mood}")
+    metrics.MOOD_CHANGES.inc(mood=new_mood)
+    # Queue the mood for the serial writer (never blocks; newer moods replace unsent ones)
+    serial_handler.send_mood(new_mood)
+    return True
 
 
 def get_mood():
@@ -68,134 +86,325 @@ def initialize_directories():
         logger.info(f"Directory ensured: {directory}")
 
 
+async def speak_sequential(photo, mood, timestamp, lead_in=None, info=None):
+    """
+    Analyze the photo, then generate and play the full response.
+    
+    The optional lead-in clip starts playing immediately; the response
+    queues up behind it.
+    
+    Returns:
+        (response text, audio path or None, timings dict)
+    """
+    lead_in_task = None
+    if lead_in:
+        lead_in_task = asyncio.ensure_future(speech_pipeline.play(lead_in))
+    
+    # Analyze image with LLM (this is the slowest part - 2-5 seconds)
+    llm_start = datetime.now()
+    logger.info(f"Analyzing image with mood: {mood}...")
+    response_text = await image_analyzer.analyze_image_async(photo, mood, network, info)
+    text_generation_time = (datetime.now() - llm_start).total_seconds()
+    logger.info(f"Response: {response_text}")
+    
+    # Generate audio (also slow - 3-10 seconds via Replicate API)
+    audio_start = datetime.now()
+    if config.AUDIO_STREAMING:
+        # Playback starts with the first downloaded chunks, so this
+        # stage covers generation, download and playback together
+        logger.info(f"Generating and streaming audio...")
+        audio_path = await audio_handler.stream_audio_async(
+            response_text, mood, timestamp, network,
+            chunk_size=config.AUDIO_STREAM_CHUNK_SIZE, wait_for=lead_in_task,
+            output=audio_output
+        )
+        audio_generation_time = (datetime.now() - audio_start).total_seconds()
+    else:
+        logger.info(f"Generating audio...")
+        audio_path = await audio_handler.generate_audio_async(response_text, mood, timestamp, network)
+        audio_generation_time = (datetime.now() - audio_start).total_seconds()
+        if lead_in_task:
+            await lead_in_task
+        if audio_path:
+            play_start = datetime.now()
+            await speech_pipeline.play(audio_path)
+            play_time = (datetime.now() - play_start).total_seconds()
+            logger.debug(f"Audio playback took {play_time:.2f}s")
+    
+    return response_text, audio_path, {"llm": text_generation_time, "tts": audio_generation_time}
+
+
+async def speak_streamed(photo, mood, timestamp, lead_in=None, info=None):
+    """
+    Stream the analysis sentence by sentence into TTS and playback.
+    
+    The optional lead-in clip plays first, ahead of the first sentence.
+    
+    Returns:
+        (response text, audio path or None, timings dict)
+    """
+    logger.info(f"Streaming analysis with mood: {mood}...")
+    sentences = image_analyzer.stream_sentences_async(
+        photo, mood, network, min_chars=config.TTS_MIN_SENTENCE_CHARS, info=info
+    )
+    response_text, audio_path, timings = await speech_pipeline.speak(sentences, mood, timestamp, lead_in)
+    logger.info(f"Response: {response_text}")
+    if timings["first_audio"] is None:
+        timings["first_audio"] = 0.0
+    return response_text, audio_path, timings
+
+
+async def process_trigger(cooldown=True):
+    """
+    Run the full capture -> analysis -> speech pipeline for one trigger.
+    
+    Args:
+        cooldown: Wait a few seconds afterwards to prevent multiple triggers
+    
+    Returns:
+        Stage times in seconds, or None if the trigger failed
+    """
+    try:
+        start_time = datetime.now()
+        logger.info("Sensor covered! Triggering photo capture...")
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        trace = tracing.start_trace(timestamp) if config.TRACE_DIR else None
+        metrics.TRIGGERS.inc()
+        
+        # Warning LED countdown (runs on the LED thread); the API connections
+        # are refreshed meanwhile so the upload starts on a warm connection
+        led_start = datetime.now()
+        with tracing.span("led.warning_sequence"):
+            countdown = sensor_controller.led.play("warning")
+            await asyncio.gather(countdown.wait(), network.warm_up())
+        led_time = (datetime.now() - led_start).total_seconds()
+        logger.debug(f"LED sequence took: {led_time:.2f}s")
+        
+        # Take photo straight into memory
+        photo_start = datetime.now()
+        photo_bytes = await runner.run_hardware(sensor_controller.capture_jpeg)
+        photo_time = (datetime.now() - photo_start).total_seconds()
+        if photo_bytes is None:
+            logger.error("Photo capture failed, skipping this trigger")
+            sensor_controller.led.play("error")
+            sensor_controller.led.chain("idle")
+            return
+        logger.info(f"Photo captured in {photo_time:.2f}s ({len(photo_bytes)} bytes)")
+        sensor_controller.led.play("thinking", loop=True)
+        
+        # Archive the previous photo and save the new one in the background
+        photo_path = archiver.submit(
+            config.CURRENT_PHOTO_FILE, config.PHOTO_ARCHIVE_DIR,
+            data=photo_bytes, name=f"photo_{timestamp}.jpg"
+        )
+        
+        # Get mood once
+        mood = get_mood()
+        
+        # A short "thinking" clip plays right away to mask the API latency
+        lead_in = thinking_clips.pick(mood) if thinking_clips else None
+        if lead_in:
+            logger.info(f"Playing thinking clip: {lead_in}")
+        
+        # Cache hit flags and token usage of the analysis end up in info
+        info = {}
+        audio_hits_before = audio_cache.hits if audio_cache else 0
+        if config.LLM_SENTENCE_STREAMING:
+            response_text, audio_path, timings = await speak_streamed(photo_bytes, mood, timestamp, lead_in, info)
+        else:
+            response_text, audio_path, timings = await speak_sequential(photo_bytes, mood, timestamp, lead_in, info)
+        
+        if audio_path:
+            # Archive the previous audio.mp3 and keep the latest response in its place
+            audio_path = archiver.submit(
+                config.CURRENT_AUDIO_FILE, config.AUDIO_ARCHIVE_DIR,
+                new_file=audio_path, name=f"audio_{timestamp}.mp3"
+            )
+        else:
+            logger.error("Audio generation failed")
+        sensor_controller.led.play("idle")
+        
+        total_time = (datetime.now() - start_time).total_seconds()
+        
+        stage_times = {"led": led_time, "photo": photo_time, "total": total_time}
+        stage_times.update(
+            (stage, value) for stage, value in timings.items()
+            if stage != "segments" and value is not None
+        )
+        for stage, value in stage_times.items():
+            metrics.STAGE_SECONDS.observe(value, stage=stage)
+        
+        # Print detailed timing breakdown
+        logger.info("=" * 60)
+        logger.info("PERFORMANCE REPORT:")
+        if "first_sentence" in timings:
+            logger.info(f"  First Sentence (LLM):    {timings['first_sentence']:6.2f}s")
+            logger.info(f"  First Audio (TTS):       {timings['first_audio']:6.2f}s")
+            logger.info(f"  Text Complete (LLM):     {timings['text_done']:6.2f}s")
+            logger.info(f"  Audio Segments:          {timings['segments']:6d}")
+        else:
+            logger.info(f"  Text Generation (LLM):  {timings['llm']:6.2f}s")
+            logger.info(f"  Audio Generation (TTS): {timings['tts']:6.2f}s")
+            logger.info(f"  ────────────────────────────────")
+            logger.info(f"  API Time (Text + Audio): {timings['llm'] + timings['tts']:6.2f}s")
+        logger.info(f"  Total Process Time:      {total_time:6.2f}s")
+        if response_cache:
+            logger.info(f"  Response Cache: {response_cache.describe()}")
+        if audio_cache:
+            logger.info(f"  Audio Cache:    {audio_cache.describe()}")
+        logger.info(f"  Archive:        {archiver.describe()}")
+        logger.info(f"  Serial Link:    {serial_handler.describe()}")
+        if lip_sync and lip_sync.enabled:
+            logger.info(f"  Lip-Sync:       {lip_sync.describe(config.SERIAL_BAUDRATE)}")
+        if audio_output:
+            logger.info(f"  Audio Output:   {audio_output.describe()}")
+        logger.info(f"  OpenAI Calls:   {openai_policy.describe()}")
+        logger.info(f"  TTS Calls:      {tts_policy.describe()}")
+        logger.info("=" * 60)
+        
+        if trace:
+            trace.add_complete("trigger", trace.origin_ns, trace.origin_ns + int(total_time * 1e9), mood=mood)
+            trace_path = await runner.run_io(trace.save, config.TRACE_DIR, config.TRACE_KEEP)
+            logger.info(f"Trace written to {trace_path} (open in https://ui.perfetto.dev)")
+        
+        if interaction_store:
+            interaction_store.record(
+                trigger_id=timestamp,
+                mood=mood,
+                photo_path=photo_path,
+                audio_path=audio_path,
+                response_text=response_text,
+                photo_time=photo_time,
+                llm_time=timings.get("llm", timings.get("text_done")),
+                tts_time=timings.get("tts"),
+                first_sentence_time=timings.get("first_sentence"),
+                first_audio_time=timings.get("first_audio"),
+                upload_time=info.get("upload"),
+                total_time=total_time,
+                prompt_tokens=info.get("prompt_tokens"),
+                completion_tokens=info.get("completion_tokens"),
+                response_cache_hit=info.get("cache_hit"),
+                audio_cache_hit=audio_cache.hits > audio_hits_before if audio_cache else None,
+                timings={**timings, "led": led_time}
+            )
+        
+        # Prevent multiple triggers
+        if cooldown:
+            await asyncio.sleep(3)
+            await asyncio.sleep(3)
+        return stage_times
+    
+    except Exception as e:
+        logger.error(f"Error processing trigger: {e}", exc_info=True)
+        sensor_controller.led.play("error")
+        sensor_controller.led.chain("idle")
+
+
 async def sensor_loop():
     """Continuously monitor the ultrasound sensor."""
     logger.info("Starting sensor monitoring loop...")
+    trigger_task = None
+    detector = TriggerDetector(
+        arm_threshold=config.DISTANCE_TRIGGER_THRESHOLD,
+        disarm_threshold=config.DISTANCE_RELEASE_THRESHOLD,
+        min_dwell=config.TRIGGER_MIN_DWELL,
+        distance_filter=DistanceFilter(
+            window=config.DISTANCE_FILTER_WINDOW,
+            mode=config.DISTANCE_FILTER_MODE,
+            alpha=config.DISTANCE_FILTER_ALPHA
+        )
+    )
+    recorder = TraceRecorder(config.DISTANCE_TRACE_FILE) if config.DISTANCE_TRACE_FILE else None
     try:
+        # Measurements run in a background thread and arrive through a queue
+        readings = sensor_controller.ranging.start(asyncio.get_running_loop())
         while True:
-            distance = sensor_controller.measure_distance()
-            logger.debug(f"Distance: {distance} cm")
-
-            # Trigger when sensor is covered (< 5 cm)
-            if distance < 5:
-                start_time = datetime.now()
-                logger.info("Sensor covered! Triggering photo capture...")
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                
-                # Warning LED sequence (runs in sync - 5 seconds)
-                led_start = datetime.now()
-                sensor_controller.warning_sequence()
-                led_time = (datetime.now() - led_start).total_seconds()
-                logger.debug(f"LED sequence took: {led_time:.2f}s")
-                
-                # Take photo
-                photo_start = datetime.now()
-                photo_path = sensor_controller.take_photo(timestamp)
-                photo_time = (datetime.now() - photo_start).total_seconds()
-                logger.info(f"Photo captured in {photo_time:.2f}s: {photo_path}")
-                
-                # Archive existing photo if it exists (async file operation)
-                if Path("photo.jpg").exists():
-                    archiver.archive_file("photo.jpg", "photos/archive")
-                
-                # Move captured photo to photo.jpg
-                import shutil
-                shutil.move(photo_path, "photo.jpg")
-                logger.info("Photo saved as photo.jpg")
-                
-                # Get mood once
-                mood = get_mood()
-                
-                # Analyze image with LLM (this is the slowest part - 2-5 seconds)
-                llm_start = datetime.now()
-                logger.info(f"Analyzing image with mood: {mood}...")
-                response_text = image_analyzer.analyze_image("photo.jpg", mood)
-                text_generation_time = (datetime.now() - llm_start).total_seconds()
-                logger.info(f"Response: {response_text}")
-                
-                # Generate audio (also slow - 3-10 seconds via Replicate API)
-                audio_start = datetime.now()
-                logger.info(f"Generating audio...")
-                audio_path = audio_handler.generate_audio(response_text, mood, timestamp)
-                audio_generation_time = (datetime.now() - audio_start).total_seconds()
-                
-                if audio_path:
-                    logger.info(f"Audio generated successfully")
-                    
-                    # Archive existing audio if it exists
-                    if Path("audio.mp3").exists():
-                        archiver.archive_file("audio.mp3", "audio/archive")
-                    
-                    # Move to audio.mp3 and play
-                    shutil.move(audio_path, "audio.mp3")
-                    
-                    play_start = datetime.now()
-                    audio_handler.play_audio("audio.mp3")
-                    play_time = (datetime.now() - play_start).total_seconds()
-                    logger.debug(f"Audio playback took {play_time:.2f}s")
+            reading = await readings.get()
+            metrics.SENSOR_READINGS.inc(status=reading.status)
+            timestamp = reading.timestamp_ns / 1e9
+            if recorder:
+                recorder.record(timestamp, reading.distance, reading.status)
+            if reading.status != OK:
+                logger.debug(f"No distance reading ({reading.status})")
+                continue
+            logger.debug(f"Distance: {reading.distance} cm")
+
+            # Trigger once the filtered distance has stayed below the threshold
+            # long enough. The pipeline runs as its own task so the sensor keeps
+            # getting polled while it is busy.
+            if detector.update(reading.distance, timestamp):
+                logger.info(f"Trigger detected (filtered distance {detector.last_filtered:.1f} cm)")
+                if trigger_task is None or trigger_task.done():
+                    trigger_task = asyncio.create_task(process_trigger())
                 else:
-                    logger.error("Audio generation failed")
-                
-                total_time = (datetime.now() - start_time).total_seconds()
-                
-                # Print detailed timing breakdown
-                logger.info("=" * 60)
-                logger.info("PERFORMANCE REPORT:")
-                logger.info(f"  Text Generation (LLM):  {text_generation_time:6.2f}s")
-                logger.info(f"  Audio Generation (TTS): {audio_generation_time:6.2f}s")
-                logger.info(f"  ────────────────────────────────")
-                logger.info(f"  API Time (Text + Audio): {text_generation_time + audio_generation_time:6.2f}s")
-                logger.info(f"  Total Process Time:      {total_time:6.2f}s")
-                logger.info("=" * 60)
-                
-                # Prevent multiple triggers
-                await asyncio.sleep(3)
-                await asyncio.sleep(3)
-
-            await asyncio.sleep(0.1)  # Faster polling: 100ms instead of 200ms
+                    logger.debug("Trigger ignored - still processing previous one")
 
     except KeyboardInterrupt:
         logger.info("Sensor loop interrupted")
     except Exception as e:
         logger.error(f"Error in sensor loop: {e}", exc_info=True)
     finally:
+        if trigger_task and not trigger_task.done():
+            trigger_task.cancel()
+        if recorder:
+            recorder.close()
         sensor_controller.cleanup()
 
 
-async def mood_watcher_loop():
-    """Watch mood.txt file for changes and update mood."""
-    logger.info("Starting mood file watcher...")
-    last_modified = None
-    
+async def mood_channel_loop():
+    """Receive mood changes from bot.py over the Unix domain socket."""
+    server = MoodServer(config.MOOD_SOCKET_PATH, set_mood, config.AVAILABLE_MOODS)
     try:
-        while True:
-            try:
-                if Path(mood_file_path).exists():
-                    current_modified = Path(mood_file_path).stat().st_mtime
-                    
-                    # Check if file was modified
-                    if last_modified is None or current_modified != last_modified:
-                        last_modified = current_modified
-                        new_mood = read_mood_from_file()
-                        set_mood(new_mood)
-                        
-            except Exception as e:
-                logger.error(f"Error in mood watcher: {e}")
-            
-            await asyncio.sleep(0.2)  # Faster mood checking: 200ms instead of 500ms
-            
+        await server.serve_forever()
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        logger.error(f"Error in mood watcher loop: {e}", exc_info=True)
+        logger.error(f"Error in mood channel loop: {e}", exc_info=True)
+    finally:
+        await server.close()
 
 
 async def main():
     """Main async orchestrator."""
+    global network, speech_pipeline
     logger.info("=" * 50)
     logger.info("ANDI IoT System Starting...")
     logger.info("=" * 50)
     
     # Initialize
     initialize_directories()
+    archiver.start()
+    if interaction_store:
+        interaction_store.start()
+    
+    # Open the serial port and let the device settle while the rest starts up
+    serial_handler.add_handler("", lambda line: logger.info(f"Device: {line}"))
+    serial_task = asyncio.create_task(serial_handler.start())
+    background_tasks.add(serial_task)
+    serial_task.add_done_callback(background_tasks.discard)
+    
+    # Shared keep-alive connection pools, warmed up so the first trigger
+    # does not pay DNS/TCP/TLS setup
+    network = NetworkClients(
+        replicate_url=config.REPLICATE_API_URL,
+        warmup_urls=config.HTTP_WARMUP_URLS,
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY
+    )
+    if audio_output:
+        # Player and decoder are detected once; the output stays open
+        await asyncio.to_thread(audio_output.start)
+    speech_pipeline = SpeechPipeline(
+        runner, audio_handler, network, lip_sync, audio_output,
+        audio_streaming=config.AUDIO_STREAMING, chunk_size=config.AUDIO_STREAM_CHUNK_SIZE
+    )
+    await network.warm_up()
+    
+    # Render missing thinking clips in the background (only on first start)
+    if thinking_clips:
+        prepare_task = asyncio.create_task(thinking_clips.prepare(audio_handler, network))
+        background_tasks.add(prepare_task)
+        prepare_task.add_done_callback(background_tasks.discard)
     
     # Create mood.txt if it doesn't exist
     if not Path(mood_file_path).exists():
@@ -208,14 +417,27 @@ async def main():
     set_mood(initial_mood)
     
     logger.info("System ready. Start bot.py separately to control mood.")
-    logger.info("Watching mood.txt for changes...")
+    logger.info(f"Waiting for mood changes on {config.MOOD_SOCKET_PATH}...")
+    
+    loops = [
+        sensor_loop(),
+        mood_channel_loop(),  # Receive mood changes from bot.py and send over serial
+        network.keep_warm(config.HTTP_KEEPALIVE_INTERVAL)
+    ]
+    if config.METRICS_PORT:
+        if response_cache:
+            metrics.CACHE_HIT_RATIO.set_function(lambda: response_cache.hit_ratio, cache="response")
+        if audio_cache:
+            metrics.CACHE_HIT_RATIO.set_function(lambda: audio_cache.hit_ratio, cache="audio")
+        metrics.ARCHIVE_BYTES.set_function(lambda: archiver.size_bytes)
+        loops.append(metrics.serve(config.METRICS_HOST, config.METRICS_PORT, config.LOOP_LAG_INTERVAL))
+    detector = BlockingDetector(config.BLOCKING_THRESHOLD) if config.BLOCKING_DETECTOR else None
+    if detector:
+        loops.append(detector.run())
     
     # Run async loops
     try:
-        await asyncio.gather(
-            sensor_loop(),
-            mood_watcher_loop()  # Watch mood file and send over serial
-        )
+        await asyncio.gather(*loops)
     except KeyboardInterrupt:
         logger.info("System shutdown requested")
     except Exception as e:
@@ -223,15 +445,55 @@ async def main():
     finally:
         logger.info("ANDI System shutting down...")
         sensor_controller.cleanup()
+        await serial_handler.stop()
+        if audio_output:
+            audio_output.stop()
+        archiver.stop()
+        if response_cache:
+            response_cache.flush()
+        if interaction_store:
+            interaction_store.stop()
+        await network.close()
+        runner.shutdown(wait=False)
+        if detector:
+            logger.info(detector.report())
 
 
 if __name__ == "__main__":
     # Initialize global handlers
     sensor_controller = SensorController()
     image_analyzer = ImageAnalyzer()
-    serial_handler = SerialHandler()
+    serial_handler = SerialHandler(
+        port=config.SERIAL_PORT,
+        baudrate=config.SERIAL_BAUDRATE,
+        timeout=config.SERIAL_TIMEOUT,
+        binary=config.SERIAL_BINARY_PROTOCOL,
+        ack_timeout=config.SERIAL_ACK_TIMEOUT,
+        retries=config.SERIAL_RETRIES,
+        stream_rate=config.SERIAL_STREAM_RATE
+    )
     audio_handler = AudioHandler()
-    archiver = Archiver()
+    archiver = Archiver(
+        archive_dirs=[config.PHOTO_ARCHIVE_DIR, config.AUDIO_ARCHIVE_DIR],
+        max_bytes=config.ARCHIVE_MAX_BYTES,
+        max_age=config.ARCHIVE_MAX_AGE
+    )
+    runner = StageRunner(io_workers=config.IO_WORKERS)
+    interaction_store = InteractionStore(
+        config.INTERACTION_DB,
+        batch_size=config.INTERACTION_BATCH_SIZE,
+        flush_interval=config.INTERACTION_FLUSH_INTERVAL
+    ) if config.INTERACTION_DB else None
+    thinking_clips = ThinkingClips(config.THINKING_CLIP_DIR) if config.THINKING_CLIPS_ENABLED else None
+    lip_sync = LipSync(
+        serial_handler,
+        fps=config.LIP_SYNC_FPS,
+        latency=config.LIP_SYNC_LATENCY
+    ) if config.LIP_SYNC_ENABLED and config.SERIAL_BINARY_PROTOCOL else None
+    audio_output = AudioOutput(
+        config.AUDIO_SAMPLE_RATE,
+        keep_warm=config.AUDIO_OUTPUT_KEEP_WARM
+    ) if config.AUDIO_OUTPUT_PERSISTENT else None
     
     # Run main system
     try:
@@ -0,0 +1,193 @@
+"""
+In-process Prometheus metrics for the trigger pipeline.
+
+Counters, gauges and histograms are plain in-memory values updated from the
+event loop and worker threads. serve() exposes them on /metrics in the text
+exposition format and samples event-loop lag alongside.
+"""
+
+import time
+import asyncio
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers sensor/serial stages (ms) up to full API round trips
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """Base class: a named metric with optional labels."""
+
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Gauge(Metric):
+    """Gauge set directly or read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self.values = {}
+        self.functions = {}
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        """Read the value from function() on every scrape."""
+        self.functions[self._key(labels)] = function
+
+    def render(self):
+        lines = self.header()
+        values = dict(self.values)
+        for key, function in self.functions.items():
+            try:
+                values[key] = function()
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {e}")
+        for key, value in sorted(values.items()):
+            if value is not None:
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., +Inf count, sum]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self):
+        lines = self.header()
+        names = self.label_names + ("le",)
+        # Copy the counts so observe() from other threads cannot change them mid-render
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+TRIGGERS = Counter("andi_triggers_total", "Processed sensor triggers")
+STAGE_SECONDS = Histogram("andi_stage_seconds", "Latency of pipeline stages", labels=("stage",))
+API_ERRORS = Counter("andi_api_errors_total", "Failed API calls", labels=("api",))
+API_HEDGES = Counter("andi_api_hedges_total", "API calls raced by a hedged second request", labels=("api",))
+API_TIMEOUTS = Counter("andi_api_timeouts_total", "API calls that exceeded their latency budget", labels=("api",))
+CACHE_HIT_RATIO = Gauge("andi_cache_hit_ratio", "Cache hit ratio since start", labels=("cache",))
+ARCHIVE_BYTES = Gauge("andi_archive_bytes", "Size of the photo/audio archive")
+SENSOR_READINGS = Counter("andi_sensor_readings_total", "Distance readings", labels=("status",))
+MOOD_CHANGES = Counter("andi_mood_changes_total", "Applied mood changes", labels=("mood",))
+LOOP_LAG = Histogram(
+    "andi_event_loop_lag_seconds", "Event loop scheduling delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+REGISTRY = [TRIGGERS, STAGE_SECONDS, API_ERRORS, API_HEDGES, API_TIMEOUTS, CACHE_HIT_RATIO, ARCHIVE_BYTES,
+            SENSOR_READINGS, MOOD_CHANGES, LOOP_LAG]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def measure_loop_lag(interval=0.5):
+    """Observe how late the event loop wakes up from a sleep of `interval`."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+async def _handle(reader, writer):
+    try:
+        request_line = await reader.readline()
+        # Skip the request headers
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split()[1] if len(request_line.split()) > 1 else b"/"
+        if path == b"/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found - try /metrics\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+
+async def serve(host="127.0.0.1", port=9108, lag_interval=0.5):
+    """Serve /metrics and measure event-loop lag until cancelled."""
+    server = await asyncio.start_server(_handle, host, port)
+    logger.info(f"Metrics on http://{host}:{port}/metrics")
+    async with server:
+        await asyncio.gather(server.serve_forever(), measure_loop_lag(lag_interval))
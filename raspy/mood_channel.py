@@ -0,0 +1,107 @@
+import os
+import asyncio
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def write_mood_file(mood, path="mood.txt"):
+    """Persist the mood atomically (write a temp file, then rename over the old one)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(mood)
+    os.replace(tmp_path, path)
+
+
+class MoodServer:
+    """Unix domain socket server that pushes mood changes from bot.py into the event loop."""
+
+    def __init__(self, socket_path, on_mood, valid_moods):
+        """
+        Args:
+            socket_path: Path of the Unix domain socket
+            on_mood: Callback called with the new mood on the event loop
+            valid_moods: Moods that are accepted
+        """
+        self.socket_path = socket_path
+        self.on_mood = on_mood
+        self.valid_moods = valid_moods
+        self.server = None
+
+    async def start(self):
+        """Start listening, replacing a stale socket file from a previous run."""
+        if Path(self.socket_path).exists():
+            os.remove(self.socket_path)
+        self.server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        logger.info(f"Mood channel listening on {self.socket_path}")
+
+    async def _handle(self, reader, writer):
+        """Handle one client: every "MOOD:<name>" line is applied and acknowledged."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = line.decode("utf-8", errors="ignore").strip()
+                if not message.startswith("MOOD:"):
+                    writer.write(b"ERR:unknown command\n")
+                else:
+                    mood = message[len("MOOD:"):]
+                    if mood in self.valid_moods:
+                        self.on_mood(mood)
+                        writer.write(f"ACK:{mood}\n".encode())
+                    else:
+                        writer.write(f"ERR:unknown mood {mood}\n".encode())
+                await writer.drain()
+        except Exception as e:
+            logger.error(f"Error in mood channel: {e}")
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        """Start the server and serve until cancelled."""
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        if Path(self.socket_path).exists():
+            os.remove(self.socket_path)
+
+
+async def send_mood(mood, socket_path, timeout=2.0):
+    """
+    Push a mood change to the main process and wait for its acknowledgement.
+
+    Args:
+        mood: New mood
+        socket_path: Path of the main process' Unix domain socket
+        timeout: Seconds to wait for connect + acknowledgement
+
+    Returns:
+        True if the main process acknowledged the mood
+    """
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_unix_connection(socket_path), timeout
+        )
+        writer.write(f"MOOD:{mood}\n".encode())
+        await writer.drain()
+        reply = await asyncio.wait_for(reader.readline(), timeout)
+        reply = reply.decode("utf-8", errors="ignore").strip()
+        if reply == f"ACK:{mood}":
+            return True
+        logger.warning(f"Mood not acknowledged: {reply or 'no reply'}")
+    except (FileNotFoundError, ConnectionRefusedError):
+        logger.warning("Main process is not running - mood only saved to file")
+    except Exception as e:
+        logger.error(f"Error sending mood: {e}")
+    finally:
+        if writer:
+            writer.close()
+    return False
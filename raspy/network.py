@@ -0,0 +1,192 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+import tracing
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Per-task upload timing for OpenAI requests. A caller sets a dict here before
+# a request and finds "upload" (seconds spent sending the body) in it afterwards.
+upload_timing = contextvars.ContextVar("upload_timing", default=None)
+
+PREDICTION_DONE = ("succeeded", "failed", "canceled")
+
+# Seconds a prediction request blocks (Prefer: wait=N) before it returns the
+# still running prediction. Once its id is known, a prediction whose caller
+# gave up (lost hedge, budget exceeded) can be cancelled on Replicate.
+PREDICTION_WAIT = 1
+
+
+async def _attach_upload_trace(request):
+    """httpx request hook: time sending the request body via the httpcore trace extension."""
+    timing = upload_timing.get()
+    if timing is None:
+        return
+
+    active_trace = tracing.current_trace.get()
+
+    async def trace(event_name, info):
+        if event_name.endswith("send_request_body.started"):
+            timing["upload_start"] = time.perf_counter()
+            timing["upload_start_ns"] = time.perf_counter_ns()
+        elif event_name.endswith("send_request_body.complete") and "upload_start" in timing:
+            timing["upload"] = time.perf_counter() - timing["upload_start"]
+            if active_trace:
+                active_trace.add_complete("openai.upload", timing["upload_start_ns"], time.perf_counter_ns())
+
+    request.extensions["trace"] = trace
+
+
+class NetworkClients:
+    """Shared keep-alive connection pools for OpenAI, Replicate and file downloads."""
+
+    def __init__(self, replicate_url="https://api.replicate.com/v1", warmup_urls=(),
+                 max_connections=10, keepalive_expiry=120):
+        """
+        Args:
+            replicate_url: Base URL of the Replicate HTTP API
+            warmup_urls: Extra hosts to pre-connect (e.g. the file delivery CDN)
+            max_connections: Connection limit per pool
+            keepalive_expiry: Seconds an idle connection is kept open
+        """
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        timeout = httpx.Timeout(30.0, connect=10.0)
+
+        self.openai = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            # Retries are up to RequestPolicy (hedging within the budget)
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=limits,
+                timeout=timeout,
+                event_hooks={"request": [_attach_upload_trace]},
+            ),
+        )
+        self.replicate = httpx.AsyncClient(
+            base_url=replicate_url,
+            headers={"Authorization": f"Bearer {os.getenv('REPLICATE_API_TOKEN')}"},
+            limits=limits,
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+        # Downloads (Replicate output files) and everything else
+        self.http = httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=True)
+        self.warmup_urls = list(warmup_urls)
+        # Cancel requests for abandoned predictions, sent in the background
+        self.cancels = set()
+        self.predictions_cancelled = 0
+
+    async def _touch(self, name, client, url):
+        """Open a pooled connection (DNS, TCP, TLS) by sending a cheap request."""
+        start = time.perf_counter()
+        try:
+            await client.head(url)
+            logger.info(f"Connection to {name} warm ({time.perf_counter() - start:.2f}s)")
+        except Exception as e:
+            logger.warning(f"Could not warm connection to {name}: {e}")
+
+    async def warm_up(self):
+        """Pre-establish connections to every API host in parallel."""
+        await asyncio.gather(
+            self._touch("OpenAI", self.openai._client, str(self.openai.base_url)),
+            self._touch("Replicate", self.replicate, "/"),
+            *(self._touch(url, self.http, url) for url in self.warmup_urls),
+        )
+
+    async def keep_warm(self, interval):
+        """Re-touch all hosts periodically so idle connections are not dropped."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.warm_up()
+
+    async def create_prediction(self, model, model_input, poll_interval=0.25):
+        """
+        Run a Replicate model and wait for its output.
+
+        If the call is cancelled once the prediction exists, the prediction
+        is cancelled on Replicate as well.
+
+        Args:
+            model: Model name ("owner/name")
+            model_input: Model input dict
+            poll_interval: Seconds between status polls if the prediction is not done yet
+
+        Returns:
+            Prediction output (for TTS models the URL of the generated file)
+        """
+        response = await self.replicate.post(
+            f"/models/{model}/predictions",
+            json={"input": model_input},
+            headers={"Prefer": f"wait={PREDICTION_WAIT}"},
+        )
+        response.raise_for_status()
+        prediction = response.json()
+        cancel_url = prediction.get("urls", {}).get("cancel")
+
+        try:
+            while prediction["status"] not in PREDICTION_DONE:
+                await asyncio.sleep(poll_interval)
+                response = await self.replicate.get(prediction["urls"]["get"])
+                response.raise_for_status()
+                prediction = response.json()
+        except asyncio.CancelledError:
+            # The caller gave up: stop the prediction on Replicate so it is not
+            # billed to completion. Sent in the background so the cancelled
+            # caller (e.g. the winning hedge) does not wait for it.
+            if cancel_url:
+                task = asyncio.ensure_future(self._cancel_prediction(cancel_url))
+                self.cancels.add(task)
+                task.add_done_callback(self.cancels.discard)
+            raise
+
+        if prediction["status"] != "succeeded":
+            raise RuntimeError(f"Prediction {prediction['status']}: {prediction.get('error')}")
+        return prediction["output"]
+
+    async def _cancel_prediction(self, cancel_url):
+        """Best-effort cancel of a running prediction."""
+        try:
+            response = await self.replicate.post(cancel_url)
+            response.raise_for_status()
+            self.predictions_cancelled += 1
+            logger.info(f"Cancelled abandoned prediction: {cancel_url}")
+        except Exception as e:
+            logger.warning(f"Could not cancel prediction {cancel_url}: {e}")
+
+    async def download(self, url):
+        """Download a file into memory over the pooled connection."""
+        response = await self.http.get(url)
+        response.raise_for_status()
+        return response.content
+
+    async def stream(self, url, chunk_size=4096):
+        """
+        Stream a download chunk by chunk over the pooled connection.
+
+        Yields:
+            Byte chunks
+        """
+        async with self.http.stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+
+    async def close(self):
+        """Close all connection pools."""
+        if self.cancels:
+            await asyncio.gather(*self.cancels, return_exceptions=True)
+        await self.openai.close()
+        await self.replicate.aclose()
+        await self.http.aclose()
+        logger.info("Network clients closed")
@@ -0,0 +1,177 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import RPi.GPIO as GPIO
+    GPIO_AVAILABLE = True
+except ImportError:
+    GPIO_AVAILABLE = False
+
+# Reading status values
+OK = "ok"
+NO_ECHO = "no_echo"
+ERROR = "error"
+
+# distance is in cm (None unless status is OK), timestamp_ns is perf_counter_ns
+DistanceReading = namedtuple("DistanceReading", ["distance", "timestamp_ns", "status"])
+
+# Speed of sound: 34300 cm/s, halved for the round trip, per nanosecond
+CM_PER_NS = 34300 / 2 / 1e9
+
+
+class RangingEngine:
+    """Ultrasonic ranging driven by GPIO edge callbacks instead of busy-wait polling."""
+
+    def __init__(self, trig, echo, interval=0.1, echo_timeout=0.03, simulate=not GPIO_AVAILABLE,
+                 simulator=None):
+        """
+        Args:
+            trig: TRIG GPIO pin (BCM)
+            echo: ECHO GPIO pin (BCM)
+            interval: Seconds between measurements in the background thread
+            echo_timeout: Seconds to wait for a complete echo before reporting NO_ECHO
+            simulate: Produce simulated readings instead of touching GPIO
+            simulator: Source of simulated readings (e.g. a HardwareSimulator
+                replaying a trace); random distances if None
+        """
+        self.trig = trig
+        self.echo = echo
+        self.interval = interval
+        self.echo_timeout = echo_timeout
+        self.simulate = simulate
+        self.simulator = simulator
+
+        self.readings_total = 0
+        self.no_echo_total = 0
+
+        self._measure_lock = threading.Lock()
+        self._echo_done = threading.Event()
+        self._armed = False
+        self._rise_ns = None
+        self._fall_ns = None
+
+        self._thread = None
+        self._stop = threading.Event()
+        self._loop = None
+        self._queue = None
+
+    def setup(self):
+        """Register the ECHO edge callback. GPIO pins must already be configured."""
+        if self.simulate:
+            return
+        GPIO.add_event_detect(self.echo, GPIO.BOTH, callback=self._on_edge)
+        logger.info("Ranging edge detection enabled")
+
+    def _on_edge(self, channel):
+        """GPIO callback: the first edge after a trigger is the rise, the second the fall."""
+        now = time.perf_counter_ns()
+        if not self._armed:
+            return
+        if self._rise_ns is None:
+            self._rise_ns = now
+        else:
+            self._fall_ns = now
+            self._armed = False
+            self._echo_done.set()
+
+    def measure_once(self):
+        """
+        Take a single measurement. Blocks for at most echo_timeout without spinning.
+
+        Returns:
+            DistanceReading
+        """
+        with self._measure_lock:
+            if self.simulate and self.simulator:
+                reading = self.simulator.measure_distance(self.echo_timeout)
+            elif self.simulate:
+                reading = DistanceReading(round(random.uniform(1, 100), 2), time.perf_counter_ns(), OK)
+            else:
+                reading = self._measure_hardware()
+
+        self.readings_total += 1
+        if reading.status != OK:
+            self.no_echo_total += 1
+        return reading
+
+    def _measure_hardware(self):
+        try:
+            self._rise_ns = None
+            self._fall_ns = None
+            self._echo_done.clear()
+            self._armed = True
+
+            GPIO.output(self.trig, True)
+            time.sleep(0.00001)
+            GPIO.output(self.trig, False)
+
+            if not self._echo_done.wait(self.echo_timeout):
+                self._armed = False
+                return DistanceReading(None, time.perf_counter_ns(), NO_ECHO)
+
+            distance = (self._fall_ns - self._rise_ns) * CM_PER_NS
+            return DistanceReading(round(distance, 2), self._fall_ns, OK)
+        except Exception as e:
+            self._armed = False
+            logger.error(f"Error measuring distance: {e}")
+            return DistanceReading(None, time.perf_counter_ns(), ERROR)
+
+    def start(self, loop, maxsize=10):
+        """
+        Start the background measurement thread.
+
+        Args:
+            loop: Event loop the readings are published to
+            maxsize: Queue size; the oldest reading is dropped when the consumer falls behind
+
+        Returns:
+            asyncio.Queue of DistanceReading
+        """
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ranging", daemon=True)
+        self._thread.start()
+        logger.info(f"Ranging started ({1 / self.interval:.0f} Hz)")
+        return self._queue
+
+    def _run(self):
+        next_time = time.monotonic()
+        while not self._stop.is_set():
+            reading = self.measure_once()
+            try:
+                self._loop.call_soon_threadsafe(self._publish, reading)
+            except RuntimeError:
+                # Event loop closed
+                break
+            next_time += self.interval
+            now = time.monotonic()
+            if next_time < now:
+                # Fell behind (e.g. a stalled echo or a paused process):
+                # re-anchor instead of firing a burst of catch-up measurements
+                next_time = now + self.interval
+            self._stop.wait(max(0.0, next_time - now))
+
+    def _publish(self, reading):
+        """Runs on the event loop: enqueue a reading, dropping the oldest if full."""
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(reading)
+
+    def stop(self):
+        """Stop the background thread and remove the edge callback."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+        if not self.simulate:
+            try:
+                GPIO.remove_event_detect(self.echo)
+            except Exception:
+                pass
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded distance trace through the trigger filter.
+
+Record a trace by setting DISTANCE_TRACE_FILE in config.py, then run:
+    python replay_distances.py distance_trace.csv [--mode median --window 5 ...]
+
+If the trace has a "present" column (1 = someone is really covering the
+sensor), triggers are scored against it and the false-positive rate is
+reported. The filter is compared against the old single-sample trigger.
+"""
+
+import argparse
+
+import config
+from distance_filter import DistanceFilter, TriggerDetector, load_trace
+
+# The old sensor_loop slept 6 seconds after every trigger
+NAIVE_DEBOUNCE = 6.0
+
+
+def replay_filtered(rows, args):
+    """Return trigger times produced by the filtered hysteresis detector."""
+    detector = TriggerDetector(
+        arm_threshold=args.arm,
+        disarm_threshold=args.disarm,
+        min_dwell=args.dwell,
+        distance_filter=DistanceFilter(window=args.window, mode=args.mode, alpha=args.alpha),
+    )
+    return [row for row in rows if detector.update(row["distance"], row["time"])]
+
+
+def replay_naive(rows, args):
+    """Return trigger times of the old `distance < threshold` check (-1 on no echo)."""
+    triggers = []
+    blocked_until = float("-inf")
+    for row in rows:
+        distance = row["distance"] if row["distance"] is not None else -1
+        if distance < args.arm and row["time"] >= blocked_until:
+            triggers.append(row)
+            blocked_until = row["time"] + NAIVE_DEBOUNCE
+    return triggers
+
+
+def presence_episodes(rows):
+    """Split labeled rows into (start, end) intervals where present == 1."""
+    episodes = []
+    start = None
+    for row in rows:
+        if row["present"] == 1 and start is None:
+            start = row["time"]
+        elif row["present"] != 1 and start is not None:
+            episodes.append((start, row["time"]))
+            start = None
+    if start is not None:
+        episodes.append((start, rows[-1]["time"]))
+    return episodes
+
+
+def score(name, triggers, rows):
+    """Print trigger statistics, scored against ground truth if available."""
+    duration_h = max(rows[-1]["time"] - rows[0]["time"], 1e-9) / 3600
+    print(f"{name}:")
+    print(f"  Triggers:            {len(triggers)}")
+
+    if all(row["present"] is None for row in rows):
+        print(f"  Triggers per hour:   {len(triggers) / duration_h:.1f}")
+        print("  (no 'present' column - cannot score false positives)")
+        return
+
+    false_positives = [t for t in triggers if t["present"] != 1]
+    episodes = presence_episodes(rows)
+    detected = sum(
+        1 for start, end in episodes
+        if any(start <= t["time"] <= end for t in triggers)
+    )
+    fp_rate = len(false_positives) / len(triggers) if triggers else 0.0
+    print(f"  False positives:     {len(false_positives)} ({fp_rate:.1%} of triggers, "
+          f"{len(false_positives) / duration_h:.1f}/h)")
+    print(f"  Approaches detected: {detected}/{len(episodes)}")
+    latencies = []
+    for start, end in episodes:
+        hits = [t["time"] - start for t in triggers if start <= t["time"] <= end]
+        if hits:
+            latencies.append(hits[0])
+    if latencies:
+        print(f"  Mean trigger delay:  {sum(latencies) / len(latencies):.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a distance trace through the trigger filter")
+    parser.add_argument("trace", help="CSV trace (time, distance[, status][, present])")
+    parser.add_argument("--mode", choices=["median", "ewma"], default=config.DISTANCE_FILTER_MODE)
+    parser.add_argument("--window", type=int, default=config.DISTANCE_FILTER_WINDOW)
+    parser.add_argument("--alpha", type=float, default=config.DISTANCE_FILTER_ALPHA)
+    parser.add_argument("--arm", type=float, default=config.DISTANCE_TRIGGER_THRESHOLD)
+    parser.add_argument("--disarm", type=float, default=config.DISTANCE_RELEASE_THRESHOLD)
+    parser.add_argument("--dwell", type=float, default=config.TRIGGER_MIN_DWELL)
+    args = parser.parse_args()
+
+    rows = load_trace(args.trace)
+    if not rows:
+        print("Trace is empty")
+        return 1
+
+    no_echo = sum(1 for row in rows if row["distance"] is None)
+    print(f"Trace: {len(rows)} readings over {rows[-1]['time'] - rows[0]['time']:.1f}s "
+          f"({no_echo} without echo)")
+    print(f"Filter: {args.mode} window={args.window} arm<{args.arm}cm "
+          f"disarm>{args.disarm}cm dwell={args.dwell}s")
+    print()
+    score("Filtered hysteresis trigger", replay_filtered(rows, args), rows)
+    print()
+    score("Single-sample trigger (old)", replay_naive(rows, args), rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
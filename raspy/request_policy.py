@@ -0,0 +1,155 @@
+import time
+import asyncio
+import logging
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RequestPolicy:
+    """
+    Latency budget and hedging for one API.
+
+    A call gets a deadline. If the first attempt has not answered by the
+    observed latency quantile (p90 by default), a second attempt is started,
+    optionally against a different model; whichever succeeds first is used
+    and the other one is cancelled. An attempt that fails early triggers the
+    hedge right away.
+    """
+
+    def __init__(self, name, budget=None, hedge_after=None, hedge_model=None,
+                 quantile=0.9, min_samples=10, window=200, hedging=True):
+        """
+        Args:
+            name: API name for logs and metrics ("openai", "replicate")
+            budget: Seconds a call may take in total (None = unbounded)
+            hedge_after: Hedge delay until min_samples latencies have been
+                observed (None = no hedging until then)
+            hedge_model: Model for the hedged attempt (None = same model)
+            quantile: Latency quantile after which a call is hedged
+            min_samples: Observations needed before the quantile is used
+            window: Number of recent latencies the quantile is computed from
+            hedging: False to only enforce the budget
+        """
+        self.name = name
+        self.budget = budget
+        self.hedge_after = hedge_after
+        self.hedge_model = hedge_model
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.hedging = hedging
+
+        self.calls_total = 0
+        self.hedged_total = 0
+        self.hedge_wins = 0
+        self.timeouts_total = 0
+        self.failures_total = 0
+
+    @property
+    def hedge_delay(self):
+        """Seconds after which the current call is hedged (None = not at all)."""
+        if not self.hedging:
+            return None
+        if len(self.latencies) < self.min_samples:
+            return self.hedge_after
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))]
+
+    async def run(self, attempt, model, discard=None):
+        """
+        Run attempt(model) within the budget, hedged if it is slow.
+
+        Args:
+            attempt: Coroutine function taking the model name; one call is one attempt
+            model: Model of the first attempt
+            discard: Optional coroutine function called with the result of an
+                attempt that finished but lost (e.g. to close a stream)
+
+        Returns:
+            Result of the first successful attempt
+
+        Raises:
+            asyncio.TimeoutError: No attempt succeeded within the budget
+            Exception: The last error if every attempt failed
+        """
+        self.calls_total += 1
+        start = time.perf_counter()
+        deadline = start + self.budget if self.budget else None
+        started = {asyncio.ensure_future(attempt(model)): (model, start, False)}
+        pending = set(started)
+        hedge_delay = self.hedge_delay
+        error = None
+        winner = None
+        try:
+            while pending:
+                can_hedge = len(started) == 1 and hedge_delay is not None
+                timeout = None
+                if can_hedge:
+                    timeout = max(0.0, start + hedge_delay - time.perf_counter())
+                if deadline is not None:
+                    remaining = max(0.0, deadline - time.perf_counter())
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    error = task.exception()
+                    logger.warning(f"{self.name} attempt ({started[task][0]}) failed: {error}")
+                if winner:
+                    break
+
+                if deadline is not None and time.perf_counter() >= deadline:
+                    self.record_timeout()
+                    raise asyncio.TimeoutError(f"{self.name} exceeded its {self.budget:.1f}s budget")
+
+                # Slow or failed first attempt: start the hedge
+                if can_hedge and (done or time.perf_counter() >= start + hedge_delay):
+                    hedge_model = self.hedge_model or model
+                    self.hedged_total += 1
+                    metrics.API_HEDGES.inc(api=self.name)
+                    logger.info(f"Hedging {self.name} request with {hedge_model} after "
+                                f"{time.perf_counter() - start:.2f}s")
+                    task = asyncio.ensure_future(attempt(hedge_model))
+                    started[task] = (hedge_model, time.perf_counter(), True)
+                    pending.add(task)
+
+            if winner is None:
+                self.failures_total += 1
+                raise error
+
+            _, attempt_start, hedged = started[winner]
+            self.latencies.append(time.perf_counter() - attempt_start)
+            if hedged:
+                self.hedge_wins += 1
+            return winner.result()
+        finally:
+            for task in started:
+                if task is not winner and not task.done():
+                    task.cancel()
+            losers = [task for task in started if task is not winner]
+            if losers:
+                await asyncio.gather(*losers, return_exceptions=True)
+                if discard:
+                    for task in losers:
+                        if not task.cancelled() and task.exception() is None:
+                            await discard(task.result())
+
+    def record_timeout(self):
+        """Count a call that ran over its budget after run() returned (e.g. a stream)."""
+        self.timeouts_total += 1
+        metrics.API_TIMEOUTS.inc(api=self.name)
+
+    def describe(self):
+        """Short summary line for the performance report."""
+        if not self.calls_total:
+            return "no calls"
+        delay = self.hedge_delay
+        hedge = f"hedge after {delay:.2f}s" if delay is not None else "no hedging"
+        return (f"{self.calls_total} calls, {self.hedged_total / self.calls_total:.0%} hedged "
+                f"({self.hedge_wins} won by the hedge), {self.timeouts_total} over budget, "
+                f"{self.failures_total} failed, {hedge}")
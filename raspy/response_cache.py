@@ -0,0 +1,182 @@
+import io
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    logger.warning("Pillow not available - response cache disabled")
+    PIL_AVAILABLE = False
+
+
+class ResponseCache:
+    """On-disk cache of LLM responses keyed by a perceptual hash of the photo and the mood."""
+
+    def __init__(self, cache_file="cache/responses.json", max_distance=5, ttl=600, max_entries=100):
+        """
+        Args:
+            cache_file: JSON file the cache is persisted to
+            max_distance: Maximum Hamming distance between hashes to count as a hit
+            ttl: Seconds an entry stays valid
+            max_entries: Maximum number of entries before the least recently used is evicted
+        """
+        self.cache_file = cache_file
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.entries = []
+        self.lock = threading.Lock()
+        # Hits only update last_used; that is written with the next store() or flush()
+        self.dirty = False
+        self._load()
+
+    @staticmethod
+    def image_hash(image):
+        """
+        Compute a 64-bit difference hash (dHash) of an image.
+
+        The JPEG is decoded in draft mode at reduced scale, so hashing a
+        full-resolution still takes only a few milliseconds.
+
+        Args:
+            image: Path to the image file or JPEG bytes
+
+        Returns:
+            Hash as int, or None if the image cannot be read
+        """
+        if not PIL_AVAILABLE:
+            return None
+        try:
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                image = io.BytesIO(image)
+            with Image.open(image) as img:
+                img.draft("L", (64, 64))
+                pixels = list(img.convert("L").resize((9, 8)).getdata())
+        except Exception as e:
+            logger.debug(f"Could not hash image: {e}")
+            return None
+
+        value = 0
+        for row in range(8):
+            for col in range(8):
+                left = pixels[row * 9 + col]
+                right = pixels[row * 9 + col + 1]
+                value = (value << 1) | (left > right)
+        return value
+
+    def _load(self):
+        """Load persisted entries from disk."""
+        try:
+            if Path(self.cache_file).exists():
+                with open(self.cache_file, "r") as f:
+                    self.entries = json.load(f)
+                logger.info(f"Response cache loaded: {len(self.entries)} entries")
+        except Exception as e:
+            logger.error(f"Error loading response cache: {e}")
+            self.entries = []
+
+    def _save(self):
+        """Persist entries to disk (atomic rename)."""
+        try:
+            Path(self.cache_file).parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = f"{self.cache_file}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.cache_file)
+            self.dirty = False
+        except Exception as e:
+            logger.error(f"Error saving response cache: {e}")
+
+    def _expire(self, now):
+        """Drop entries older than the TTL."""
+        self.entries = [e for e in self.entries if now - e["created"] < self.ttl]
+
+    def lookup(self, image_hash, mood):
+        """
+        Find a cached response for a similar image in the same mood.
+
+        Args:
+            image_hash: Hash from image_hash()
+            mood: Current mood
+
+        Returns:
+            Cached response text or None
+        """
+        if image_hash is None:
+            return None
+
+        with self.lock:
+            now = time.time()
+            self._expire(now)
+
+            best = None
+            best_distance = self.max_distance + 1
+            for entry in self.entries:
+                if entry["mood"] != mood:
+                    continue
+                distance = bin(entry["hash"] ^ image_hash).count("1")
+                if distance < best_distance:
+                    best, best_distance = entry, distance
+
+            if best is None:
+                self.misses += 1
+                logger.info(f"Response cache miss ({self.describe()})")
+                return None
+
+            self.hits += 1
+            best["last_used"] = now
+            self.dirty = True
+            logger.info(f"Response cache hit at distance {best_distance} ({self.describe()})")
+            return best["text"]
+
+    def store(self, image_hash, mood, text):
+        """
+        Add a response to the cache, evicting the least recently used entry if full.
+
+        Args:
+            image_hash: Hash from image_hash()
+            mood: Mood the response was generated for
+            text: Response text
+        """
+        if image_hash is None:
+            return
+
+        with self.lock:
+            now = time.time()
+            self._expire(now)
+            self.entries.append({
+                "hash": image_hash,
+                "mood": mood,
+                "text": text,
+                "created": now,
+                "last_used": now,
+            })
+            if len(self.entries) > self.max_entries:
+                self.entries.sort(key=lambda e: e["last_used"])
+                self.entries = self.entries[-self.max_entries:]
+            self._save()
+
+    def flush(self):
+        """Persist last_used updates from hits since the last save."""
+        with self.lock:
+            if self.dirty:
+                self._save()
+
+    @property
+    def hit_ratio(self):
+        """Fraction of lookups that were hits."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def describe(self):
+        """Short human-readable summary of the cache statistics."""
+        return f"hits={self.hits} misses={self.misses} ratio={self.hit_ratio:.0%}"
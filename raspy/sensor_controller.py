@@ -1,9 +1,15 @@
+import io
 import os
-import time
 import logging
 from datetime import datetime
 from pathlib import Path
 
+import config
+import tracing
+from ranging import RangingEngine, OK
+from simulator import HardwareSimulator, scripted_trace
+from led_animator import LedAnimator
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -26,10 +32,40 @@ class SensorController:
         self.BLUE = 22
         
         self.camera = None
+        self.led = LedAnimator(self.set_color, config.LED_COLORS, config.LED_ANIMATIONS)
+        self.simulator = None if RASPBERRY_PI else self._create_simulator()
+        
+        self.ranging = RangingEngine(
+            self.TRIG, self.ECHO,
+            interval=config.SENSOR_POLL_INTERVAL,
+            echo_timeout=config.ULTRASONIC_ECHO_TIMEOUT,
+            simulate=not RASPBERRY_PI,
+            simulator=self.simulator
+        )
         
         if RASPBERRY_PI:
             self._init_hardware()
     
+    @staticmethod
+    def _create_simulator():
+        """Simulated sensor and camera as configured by the SIM_* settings."""
+        trace = config.SIM_DISTANCE_TRACE
+        if trace is None and config.SIM_DISTANCE_SCRIPT:
+            trace = scripted_trace(
+                config.SIM_DISTANCE_SCRIPT,
+                interval=config.SENSOR_POLL_INTERVAL,
+                noise=config.SIM_DISTANCE_NOISE,
+                seed=config.SIM_SEED
+            )
+        return HardwareSimulator(
+            trace=trace,
+            loop=config.SIM_LOOP,
+            photo_dir=config.SIM_PHOTO_DIR,
+            capture_latency=config.SIM_CAPTURE_LATENCY,
+            capture_jitter=config.SIM_CAPTURE_JITTER,
+            seed=config.SIM_SEED
+        )
+    
     def _init_hardware(self):
         """Initialize GPIO and camera."""
         try:
@@ -54,6 +90,9 @@ class SensorController:
             
             GPIO.output(self.TRIG, False)
             
+            # Echo edges are timestamped in a GPIO callback
+            self.ranging.setup()
+            
             # Camera
             self.camera = Picamera2()
             self.camera.configure(self.camera.create_still_configuration())
@@ -64,7 +103,7 @@ class SensorController:
             logger.error(f"Error initializing hardware: {e}")
     
     def set_color(self, r, g, b):
-        """Set RGB LED color (0=off, 1=on)."""
+        """Set RGB LED color (inverted: 0=on, 1=off, see config.LED_COLORS)."""
         if not RASPBERRY_PI:
             return
         
@@ -78,74 +117,26 @@ class SensorController:
     def measure_distance(self):
         """
         Measure distance using ultrasonic sensor.
-        Returns distance in cm.
-        """
-        if not RASPBERRY_PI:
-            # Simulation mode - random distance
-            import random
-            return random.uniform(1, 100)
+        Returns distance in cm, or -1 if there was no echo.
         
-        try:
-            GPIO.output(self.TRIG, True)
-            time.sleep(0.00001)
-            GPIO.output(self.TRIG, False)
-            
-            # Wait for ECHO to go high (reduced timeout for faster response)
-            timeout = time.time() + 0.05  # 50ms instead of 100ms
-            pulse_start = time.time()
-            while GPIO.input(self.ECHO) == 0 and time.time() < timeout:
-                pulse_start = time.time()
-            
-            # Wait for ECHO to go low (reduced timeout)
-            timeout = time.time() + 0.05  # 50ms instead of 100ms
-            pulse_end = time.time()
-            while GPIO.input(self.ECHO) == 1 and time.time() < timeout:
-                pulse_end = time.time()
-            
-            pulse_duration = pulse_end - pulse_start
-            distance = pulse_duration * 17150
-            return round(distance, 2)
-        except Exception as e:
-            logger.error(f"Error measuring distance: {e}")
+        For continuous monitoring use self.ranging.start(), which measures
+        in a background thread and reports missing echoes explicitly.
+        """
+        reading = self.ranging.measure_once()
+        if reading.status != OK:
             return -1
+        return reading.distance
     
     def warning_sequence(self):
-        """LED warning sequence with increasing speed, ending in red."""
+        """
+        Play the LED warning sequence and block until it ends.
+        
+        The pipeline uses self.led.play("warning") instead, which does not block;
+        the keyframes are in config.LED_ANIMATIONS.
+        """
         logger.info("LED warning sequence started")
-        try:
-            # First cycle - normal speed
-            for _ in range(2):
-                self.set_color(0, 1, 0)   # Green
-                time.sleep(0.2)
-                self.set_color(1, 1, 0)   # Yellow
-                time.sleep(0.2)
-                self.set_color(1, 0, 0)   # Red
-                time.sleep(0.2)
-            
-            # Second cycle - faster
-            for _ in range(2):
-                self.set_color(0, 1, 0)   # Green
-                time.sleep(0.1)
-                self.set_color(1, 1, 0)   # Yellow
-                time.sleep(0.1)
-                self.set_color(1, 0, 0)   # Red
-                time.sleep(0.1)
-            
-            # Third cycle - very fast
-            for _ in range(3):
-                self.set_color(0, 1, 0)   # Green
-                time.sleep(0.05)
-                self.set_color(1, 1, 0)   # Yellow
-                time.sleep(0.05)
-                self.set_color(0, 1, 0)   # Red
-                time.sleep(0.05)
-            
-            # End with red for 1 second
-            self.set_color(0, 0, 1)   # Red
-            time.sleep(0.5)
-            self.set_color(1, 1, 1)   # Off
-        except Exception as e:
-            logger.error(f"Error in warning sequence: {e}")
+        with tracing.span("led.warning_sequence"):
+            self.led.play("warning").join()
     
     def take_photo(self, timestamp=None):
         """
@@ -156,30 +147,60 @@ class SensorController:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         if not RASPBERRY_PI:
-            logger.info(f"Simulation: Photo would be saved as photo_{timestamp}.jpg")
-            # Create a dummy file for testing
-            dummy_path = f"photo_{timestamp}.jpg"
-            Path(dummy_path).touch()
-            return dummy_path
+            Path("photos").mkdir(parents=True, exist_ok=True)
+            filename = f"photos/photo_{timestamp}.jpg"
+            Path(filename).write_bytes(self.capture_jpeg())
+            logger.info(f"Simulation: Photo saved: {filename}")
+            return filename
         
         try:
             Path("photos").mkdir(parents=True, exist_ok=True)
             filename = f"photos/photo_{timestamp}.jpg"
             self.camera.capture_file(filename)
             logger.info(f"Photo saved: {filename}")
-            # Turn LED white after photo is taken
-            self.set_color(0, 0, 0)   # White (R=on, G=on, B=on)
+            # Turn LED white after photo is taken (through the animator,
+            # which owns the LED pins)
+            self.led.play([("white", 0)])
             return filename
         except Exception as e:
             logger.error(f"Error taking photo: {e}")
             return None
     
+    def capture_jpeg(self) -> bytes:
+        """
+        Capture a still straight into memory.
+        
+        Returns:
+            JPEG encoded bytes, or None on error
+        """
+        if not RASPBERRY_PI:
+            with tracing.span("camera.capture", simulated=True):
+                photo = self.simulator.capture_jpeg()
+            logger.info(f"Simulation: Photo captured to memory ({len(photo)} bytes)")
+            return photo
+        
+        try:
+            buffer = io.BytesIO()
+            with tracing.span("camera.capture"):
+                self.camera.capture_file(buffer, format="jpeg")
+            logger.info(f"Photo captured to memory ({buffer.tell()} bytes)")
+            # Turn LED white after photo is taken (through the animator,
+            # which owns the LED pins)
+            self.led.play([("white", 0)])
+            return buffer.getvalue()
+        except Exception as e:
+            logger.error(f"Error capturing photo: {e}")
+            return None
+    
     def cleanup(self):
         """Clean up hardware resources."""
         logger.info("Cleaning up hardware resources")
         try:
+            self.ranging.stop()
+            self.led.stop()
             if RASPBERRY_PI:
-                self.set_color(1, 1, 1)
+                # The animator thread has ended, so the pins are free
+                self.set_color(*config.LED_COLORS["off"])
                 if self.camera:
                     self.camera.stop()
                     self.camera.close()
@@ -1,5 +1,11 @@
-import logging
 import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+import serial_protocol as protocol
+import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -13,93 +19,358 @@ except ImportError:
 
 class SerialHandler:
     """Handle serial communication with device."""
-    
-    def __init__(self, port='/dev/serial0', baudrate=115200, timeout=1):
+
+    def __init__(self, port='/dev/serial0', baudrate=115200, timeout=1, settle_time=2.0,
+                 binary=False, ack_timeout=0.2, retries=2, stream_rate=30):
+        """
+        Args:
+            port: Serial device
+            baudrate: Baud rate
+            timeout: Write timeout in seconds
+            settle_time: Seconds to wait after opening before the first write
+                (the ESP32 resets when the port is opened)
+            binary: Send moods as acknowledged binary frames (serial_protocol.py)
+                instead of MOOD:<name> lines
+            ack_timeout: Seconds to wait for an ACK before retransmitting
+            retries: Retransmissions before a frame counts as lost
+            stream_rate: Maximum frames per second per type for send_stream()
+        """
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
+        self.settle_time = settle_time
+        self.binary = binary
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.stream_interval = 1.0 / stream_rate
         self.ser = None
-        
-        if SERIAL_AVAILABLE:
-            self._init_serial()
-    
-    def _init_serial(self):
-        """Initialize serial connection."""
+
+        # Outbound messages by key, in send order. A message with the key of
+        # one that is still waiting replaces it (e.g. only the newest MOOD is sent).
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.handlers = []
+        self.loop = None
+        self.wakeup = None
+        self.writer_task = None
+        self.decoder = protocol.FrameDecoder()
+        self.sent_total = 0
+        self.coalesced_total = 0
+
+        # Binary frames waiting for an ACK, by sequence number
+        self.seq = 0
+        self.inflight = {}
+        self.rtts = deque(maxlen=200)
+        self.acked_total = 0
+        self.retransmits_total = 0
+        self.lost_total = 0
+
+        # send_stream() state per frame type: next allowed send time and the
+        # newest payload held back until then
+        self.stream_next = {}
+        self.stream_held = {}
+        self.stream_dropped = 0
+        self.bytes_sent = 0
+
+    def _open(self):
+        """Open the serial port (blocking)."""
         try:
-            self.ser = serial.Serial(
+            ser = serial.Serial(
                 port=self.port,
                 baudrate=self.baudrate,
-                timeout=self.timeout
+                timeout=0,
+                write_timeout=self.timeout
             )
-            time.sleep(2)  # Wait for connection to stabilize
             logger.info(f"Serial connection established on {self.port}")
+            return ser
         except Exception as e:
             logger.error(f"Error initializing serial connection: {e}")
-            self.ser = None
-    
+            return None
+
+    async def start(self):
+        """
+        Open the port, let it settle and start the writer and reader.
+
+        Runs concurrently with the rest of startup; messages sent before the
+        port is ready stay queued and are written once it is.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+
+        if SERIAL_AVAILABLE:
+            self.ser = await asyncio.to_thread(self._open)
+            if self.ser:
+                await asyncio.sleep(self.settle_time)  # Wait for connection to stabilize
+                self.loop.add_reader(self.ser.fileno(), self._on_readable)
+
+        self.writer_task = asyncio.create_task(self._writer())
+        if self.pending:
+            self.wakeup.set()
+
+    def add_handler(self, prefix, callback):
+        """
+        Register a callback for incoming lines.
+
+        Args:
+            prefix: Lines starting with this prefix are dispatched ("" for all)
+            callback: Called on the event loop with the decoded line
+        """
+        self.handlers.append((prefix, callback))
+
+    def send(self, message: str, key=None):
+        """
+        Queue a line for sending without blocking.
+
+        Args:
+            message: Message to send
+            key: Messages with the same key replace each other while queued
+        """
+        if not message.endswith('\n'):
+            message += '\n'
+        self._enqueue(message.encode(), key)
+
+    def _enqueue(self, data, key=None, seq=None):
+        """Queue raw bytes; seq marks a frame that expects an ACK."""
+        with self.pending_lock:
+            if key is None:
+                key = object()
+            elif key in self.pending:
+                self.coalesced_total += 1
+                replaced_seq = self.pending[key][1]
+                if replaced_seq is not None and replaced_seq != seq:
+                    self._finish(replaced_seq, None)
+            self.pending[key] = (data, seq, tracing.current_trace.get())
+        if self.wakeup is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
     def send_mood(self, mood: str):
         """
-        Send mood command to device over serial.
-        
+        Queue a mood command; a newer mood replaces one not yet sent.
+
         Args:
             mood: Mood string (happy, flirty, angry, bored)
         """
-        if not self.ser:
-            logger.debug(f"[SIMULATION] Would send mood: {mood}")
-            return
-        
-        try:
-            message = f"MOOD:{mood}\n".encode()
-            self.ser.write(message)
-            logger.info(f"Mood sent over serial: {mood}")
-        except Exception as e:
-            logger.error(f"Error sending mood over serial: {e}")
-    
+        if self.binary:
+            self.send_frame(protocol.MOOD, protocol.mood_payload(mood), key="MOOD")
+        else:
+            self.send(f"MOOD:{mood}", key="MOOD")
+
     def send_message(self, message: str):
         """
-        Send a message over serial.
-        
+        Queue a message for sending.
+
         Args:
             message: Message to send
         """
+        self.send(message)
+
+    def send_frame(self, frame_type, payload=b"", key=None):
+        """
+        Queue a binary frame.
+
+        Frames of protocol.ACKED_TYPES are retransmitted until the device
+        acknowledges them (at most `retries` times).
+
+        Args:
+            frame_type: Frame type from serial_protocol
+            payload: Payload bytes
+            key: Frames with the same key replace each other while queued
+
+        Returns:
+            Future resolving to the round-trip time in ms (None if lost), or
+            None for frames without ACK or before start()
+        """
+        self.seq = (self.seq + 1) & 0xFF
+        seq = self.seq
+        data = protocol.encode_frame(frame_type, seq, payload)
+        future = None
+        if frame_type in protocol.ACKED_TYPES:
+            if key is not None:
+                # A newer frame supersedes unacknowledged ones with the same key:
+                # they must not be retransmitted after it
+                for old_seq in [s for s, entry in self.inflight.items() if entry["key"] == key]:
+                    self._finish(old_seq, None)
+            if self.loop:
+                future = self.loop.create_future()
+            self.inflight[seq] = {"data": data, "key": key, "sent": None,
+                                  "attempts": 0, "future": future}
+            self._enqueue(data, key, seq)
+        else:
+            self._enqueue(data, key)
+        return future
+
+    async def ping(self):
+        """
+        Measure one round trip to the device.
+
+        Returns:
+            Round-trip time in ms, or None if no ACK arrived
+        """
+        future = self.send_frame(protocol.PING)
+        return await future if future else None
+
+    def send_stream(self, frame_type, payload):
+        """
+        Send a high-rate frame (e.g. animation parameters) without flooding the link.
+
+        At most `stream_rate` frames per second are sent per type; frames in
+        between are dropped except the newest, which goes out at the next slot.
+        Never acknowledged.
+
+        Args:
+            frame_type: Frame type from serial_protocol
+            payload: Payload bytes
+        """
+        now = time.monotonic()
+        next_slot = self.stream_next.get(frame_type, 0.0)
+        if now >= next_slot or self.loop is None:
+            self.stream_next[frame_type] = now + self.stream_interval
+            self.send_frame(frame_type, payload, key=("stream", frame_type))
+            return
+        if frame_type in self.stream_held:
+            self.stream_dropped += 1
+        else:
+            self.loop.call_later(next_slot - now, self._release_stream, frame_type)
+        self.stream_held[frame_type] = payload
+
+    def _release_stream(self, frame_type):
+        payload = self.stream_held.pop(frame_type, None)
+        if payload is not None:
+            self.stream_next[frame_type] = time.monotonic() + self.stream_interval
+            self.send_frame(frame_type, payload, key=("stream", frame_type))
+
+    async def _writer(self):
+        """Write queued messages in order."""
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while True:
+                with self.pending_lock:
+                    if not self.pending:
+                        break
+                    key = next(iter(self.pending))
+                    data, seq, trace = self.pending.pop(key)
+                await self._write(data, seq, trace)
+
+    async def _write(self, data, seq=None, trace=None):
         if not self.ser:
-            logger.debug(f"[SIMULATION] Would send message: {message}")
+            logger.debug(f"[SIMULATION] Would send: {data!r}")
+            if seq is not None:
+                self._finish(seq, None)
             return
-        
+
+        if seq is not None and seq in self.inflight:
+            entry = self.inflight[seq]
+            entry["sent"] = time.perf_counter_ns()
+            entry["attempts"] += 1
+            self.loop.call_later(self.ack_timeout, self._check_ack, seq, entry["attempts"])
+
         try:
-            if not message.endswith('\n'):
-                message += '\n'
-            self.ser.write(message.encode())
-            logger.info(f"Message sent over serial: {message.strip()}")
+            start = time.perf_counter_ns()
+            await asyncio.to_thread(self.ser.write, data)
+            if trace:
+                trace.add_complete("serial.write", start, time.perf_counter_ns(), bytes=len(data))
+            self.sent_total += 1
+            self.bytes_sent += len(data)
+            if data[0] != protocol.SYNC:
+                logger.info(f"Message sent over serial: {data.decode().strip()}")
         except Exception as e:
             logger.error(f"Error sending message over serial: {e}")
-    
-    def read_message(self) -> str:
-        """
-        Read a message from serial.
-        
-        Returns:
-            Message string or None
-        """
-        if not self.ser:
+
+    def _check_ack(self, seq, attempt):
+        """Retransmit a frame whose ACK did not arrive in time."""
+        entry = self.inflight.get(seq)
+        if not entry or entry["attempts"] != attempt:
+            return
+        if entry["attempts"] > self.retries:
+            self.lost_total += 1
+            logger.warning(f"No ACK for serial frame {seq} after {entry['attempts']} attempts")
+            self._finish(seq, None)
+            return
+        self.retransmits_total += 1
+        self._enqueue(entry["data"], entry["key"], seq)
+
+    def _finish(self, seq, rtt):
+        entry = self.inflight.pop(seq, None)
+        if entry and entry["future"] and not entry["future"].done():
+            entry["future"].set_result(rtt)
+
+    def _on_frame(self, frame):
+        """Handle a frame from the device (runs on the event loop)."""
+        if frame.type != protocol.ACK or len(frame.payload) < 2:
+            logger.debug(f"Unhandled serial frame type {frame.type:#04x}")
+            return
+        seq, status = frame.payload[0], frame.payload[1]
+        entry = self.inflight.get(seq)
+        if not entry or entry["sent"] is None:
+            return
+        rtt = (time.perf_counter_ns() - entry["sent"]) / 1e6
+        if status != protocol.STATUS_OK:
+            logger.warning(f"Device rejected serial frame {seq} (status {status})")
+        self.acked_total += 1
+        self.rtts.append(rtt)
+        self._finish(seq, rtt)
+
+    def rtt_stats(self):
+        """Return round-trip statistics (ms) over the recent ACKs, or None."""
+        if not self.rtts:
             return None
-        
+        ordered = sorted(self.rtts)
+        return {
+            "count": len(ordered),
+            "mean": sum(ordered) / len(ordered),
+            "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1],
+        }
+
+    def describe(self):
+        """Short summary line for the performance report."""
+        summary = (f"{self.sent_total} writes, {self.bytes_sent} bytes, "
+                   f"{self.coalesced_total} coalesced, {self.stream_dropped} stream frames dropped")
+        if self.binary:
+            summary += (f", {self.acked_total} acked, {self.retransmits_total} retransmits, "
+                        f"{self.lost_total} lost, {self.decoder.crc_errors} CRC errors")
+            stats = self.rtt_stats()
+            if stats:
+                summary += f", RTT p50 {stats['p50']:.1f}ms p95 {stats['p95']:.1f}ms"
+        return summary
+
+    def _on_readable(self):
+        """Read what is available and dispatch complete lines (runs on the event loop)."""
         try:
-            if self.ser.in_waiting:
-                # Use 'ignore' or 'replace' to handle non-UTF-8 bytes gracefully
-                raw_data = self.ser.readline()
-                message = raw_data.decode('utf-8', errors='ignore').strip()
-                if message:
-                    logger.debug(f"Received from serial: {message}")
-                    return message
-        except UnicodeDecodeError as e:
-            # This should not happen anymore with errors='ignore', but just in case
-            logger.debug(f"Non-UTF-8 data received from serial, ignoring: {e}")
+            data = self.ser.read(self.ser.in_waiting or 1)
         except Exception as e:
             logger.error(f"Error reading from serial: {e}")
-        
-        return None
-    
+            return
+
+        for event in self.decoder.feed(data):
+            if isinstance(event, protocol.Frame):
+                self._on_frame(event)
+            else:
+                self._dispatch(event)
+
+    def _dispatch(self, line):
+        logger.debug(f"Received from serial: {line}")
+        for prefix, callback in self.handlers:
+            if line.startswith(prefix):
+                try:
+                    callback(line)
+                except Exception as e:
+                    logger.error(f"Error in serial handler for '{prefix}': {e}")
+
+    async def stop(self):
+        """Stop the writer and reader and close the port."""
+        if self.writer_task:
+            self.writer_task.cancel()
+            try:
+                await self.writer_task
+            except asyncio.CancelledError:
+                pass
+        if self.ser and self.loop:
+            self.loop.remove_reader(self.ser.fileno())
+        self.close()
+
     def close(self):
         """Close serial connection."""
         if self.ser:
@@ -108,3 +379,4 @@ class SerialHandler:
                 logger.info("Serial connection closed")
             except Exception as e:
                 logger.error(f"Error closing serial connection: {e}")
+            self.ser = None
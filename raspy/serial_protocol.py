@@ -0,0 +1,142 @@
+"""
+Binary frame protocol between the Pi and the ESP32 display.
+
+Frames share the UART with the ASCII lines (`MOOD:<name>\\n`). A frame starts
+with a sync byte that never occurs in ASCII text:
+
+    0xA5 | type | seq | len | payload (len bytes) | CRC-16 (big endian)
+
+The CRC is CRC-16/CCITT-FALSE over type, seq, len and payload. The device
+answers ACKED_TYPES with an ACK frame whose payload is (acked seq, status).
+This module is the reference implementation; Arduino/src/main.cpp mirrors it.
+"""
+
+import binascii
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+SYNC = 0xA5
+HEADER_SIZE = 4
+CRC_SIZE = 2
+MAX_PAYLOAD = 255
+
+# Frame types
+MOOD = 0x01  # payload: mood index (MOODS)
+ANIM = 0x02  # payload: animation parameters, high rate, never acknowledged
+PING = 0x03  # empty payload, acknowledged (round-trip measurement)
+ACK = 0x80   # payload: acked seq, status
+
+ACKED_TYPES = (MOOD, PING)
+
+# ACK status codes
+STATUS_OK = 0
+STATUS_BAD_PAYLOAD = 1
+STATUS_UNKNOWN_TYPE = 2
+
+MOODS = ["neutral", "happy", "flirty", "angry", "bored"]
+
+Frame = namedtuple("Frame", ["type", "seq", "payload"])
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF)."""
+    return binascii.crc_hqx(bytes(data), 0xFFFF)
+
+
+def encode_frame(frame_type, seq, payload=b""):
+    """
+    Build a frame.
+
+    Args:
+        frame_type: Frame type byte
+        seq: Sequence number (0-255)
+        payload: Payload bytes (at most MAX_PAYLOAD)
+
+    Returns:
+        Encoded frame bytes
+    """
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"Payload too long: {len(payload)} bytes")
+    body = bytes([frame_type, seq & 0xFF, len(payload)]) + bytes(payload)
+    return bytes([SYNC]) + body + crc16(body).to_bytes(CRC_SIZE, "big")
+
+
+def mood_payload(mood):
+    return bytes([MOODS.index(mood)])
+
+
+def ack_payload(seq, status=STATUS_OK):
+    return bytes([seq & 0xFF, status])
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for a byte stream mixing frames and text lines.
+
+    Bytes can be fed in arbitrary chunks. Frames with a bad CRC are counted
+    and skipped; decoding resynchronizes on the next sync byte.
+    """
+
+    def __init__(self, max_line=1024):
+        """
+        Args:
+            max_line: Text lines longer than this are truncated
+        """
+        self.buffer = bytearray()
+        self.text = bytearray()
+        self.max_line = max_line
+        self.frames_total = 0
+        self.crc_errors = 0
+
+    def feed(self, data):
+        """
+        Decode as much of the buffered stream as possible.
+
+        Args:
+            data: Newly received bytes
+
+        Returns:
+            List of Frame tuples and str lines in arrival order
+        """
+        self.buffer += data
+        events = []
+        while self.buffer:
+            if self.buffer[0] == SYNC:
+                if len(self.buffer) < HEADER_SIZE:
+                    break
+                total = HEADER_SIZE + self.buffer[3] + CRC_SIZE
+                if len(self.buffer) < total:
+                    break
+                body = bytes(self.buffer[1:total - CRC_SIZE])
+                received_crc = int.from_bytes(self.buffer[total - CRC_SIZE:total], "big")
+                if crc16(body) == received_crc:
+                    events.append(Frame(body[0], body[1], body[3:]))
+                    self.frames_total += 1
+                    del self.buffer[:total]
+                else:
+                    # Not a valid frame: drop the sync byte and rescan
+                    self.crc_errors += 1
+                    logger.debug("Serial frame with bad CRC dropped")
+                    del self.buffer[:1]
+                continue
+
+            newline = self.buffer.find(b"\n")
+            sync = self.buffer.find(bytes([SYNC]))
+            if sync != -1 and (newline == -1 or sync < newline):
+                # A frame interrupts a text line; keep the partial line
+                self.text += self.buffer[:sync]
+                del self.buffer[:sync]
+            elif newline != -1:
+                self.text += self.buffer[:newline]
+                del self.buffer[:newline + 1]
+                line = self.text.decode("utf-8", errors="ignore").strip()
+                self.text = bytearray()
+                if line:
+                    events.append(line)
+            else:
+                self.text += self.buffer
+                self.buffer.clear()
+            del self.text[self.max_line:]
+        return events
@@ -0,0 +1,157 @@
+import io
+import time
+import random
+import logging
+import threading
+from bisect import bisect_right
+from pathlib import Path
+
+from ranging import DistanceReading, OK, NO_ECHO, CM_PER_NS
+from distance_filter import load_trace
+
+logger = logging.getLogger(__name__)
+
+# Still resolution of the Pi camera module's default still configuration
+FIXTURE_SIZE = (1640, 1232)
+
+
+def scripted_trace(segments, interval=0.1, noise=0.0, dropout=0.0, seed=0):
+    """
+    Build a distance trace from (distance, seconds) segments.
+
+    Args:
+        segments: e.g. [(150, 10), (3, 2), (150, 10)]; a distance of None
+            means no echo for that segment
+        interval: Seconds between rows
+        noise: Standard deviation (cm) added to every distance
+        dropout: Fraction of rows without an echo
+        seed: Seed for noise and dropouts
+
+    Returns:
+        List of dicts with time and distance, like load_trace()
+    """
+    rng = random.Random(seed)
+    rows = []
+    start = 0.0
+    for distance, seconds in segments:
+        for step in range(max(1, round(seconds / interval))):
+            value = None
+            if distance is not None and rng.random() >= dropout:
+                # The HC-SR04 does not report less than 2 cm
+                value = round(max(2.0, distance + rng.gauss(0, noise)), 2) if noise else float(distance)
+            rows.append({"time": round(start + step * interval, 4), "distance": value})
+        start += seconds
+    return rows
+
+
+def synthetic_jpeg(seed=0, size=FIXTURE_SIZE, quality=90):
+    """
+    A deterministic full-resolution JPEG with enough detail to be a realistic
+    upload (a flat image would compress to a few kB).
+    """
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, (rng.randrange(30, 90), rng.randrange(30, 90), rng.randrange(60, 120)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(400):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        w, h = rng.randrange(10, 200), rng.randrange(10, 200)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        draw.rectangle([x, y, x + w, y + h], fill=color)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class HardwareSimulator:
+    """
+    Deterministic stand-in for the ultrasonic sensor and the camera.
+
+    Distances are replayed from a trace with its original timing: a
+    measurement returns the row that is current at the time elapsed since
+    the first measurement. Captures cycle through JPEG fixtures and take as
+    long as the camera would.
+    """
+
+    def __init__(self, trace=None, loop=True, photo_dir=None,
+                 capture_latency=0.35, capture_jitter=0.05, seed=0):
+        """
+        Args:
+            trace: Rows from load_trace()/scripted_trace(), a CSV path, or
+                None for random distances (the old simulation behaviour)
+            loop: Start the trace over when it ends (else the last row repeats)
+            photo_dir: Directory of *.jpg fixtures (None or empty = synthetic photo)
+            capture_latency: Mean seconds a still capture takes
+            capture_jitter: Standard deviation of the capture time
+            seed: Seed for random distances and capture jitter
+        """
+        if isinstance(trace, (str, Path)):
+            trace = load_trace(trace)
+        self.rows = sorted(trace, key=lambda row: row["time"]) if trace else None
+        if self.rows:
+            # Recorded traces carry perf_counter timestamps
+            origin = self.rows[0]["time"]
+            self.times = [row["time"] - origin for row in self.rows]
+            spacing = self.times[-1] / (len(self.times) - 1) if len(self.times) > 1 else 1.0
+            self.duration = self.times[-1] + spacing
+        self.loop = loop
+        self.capture_latency = capture_latency
+        self.capture_jitter = capture_jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.started = None
+
+        self.photos = sorted(Path(photo_dir).glob("*.jpg")) if photo_dir and Path(photo_dir).is_dir() else []
+        self.photo_index = 0
+        self.synthetic = None
+        self.captures_total = 0
+        if photo_dir and not self.photos:
+            logger.warning(f"No JPEG fixtures in {photo_dir}, using a synthetic photo")
+
+    def distance_at(self, elapsed):
+        """Trace distance (cm or None) at `elapsed` seconds into the replay."""
+        if self.loop:
+            elapsed %= self.duration
+        index = max(0, bisect_right(self.times, elapsed) - 1)
+        return self.rows[index]["distance"]
+
+    def measure_distance(self, echo_timeout=0.03):
+        """
+        One simulated measurement, taking as long as the real echo would.
+
+        Returns:
+            DistanceReading
+        """
+        if self.rows is None:
+            with self.lock:
+                distance = round(self.random.uniform(1, 100), 2)
+        else:
+            now = time.perf_counter()
+            if self.started is None:
+                self.started = now
+            distance = self.distance_at(now - self.started)
+
+        if distance is None:
+            time.sleep(echo_timeout)
+            return DistanceReading(None, time.perf_counter_ns(), NO_ECHO)
+        time.sleep(distance / CM_PER_NS / 1e9)
+        return DistanceReading(distance, time.perf_counter_ns(), OK)
+
+    def capture_jpeg(self):
+        """Return the next fixture after the modelled capture latency."""
+        with self.lock:
+            delay = max(0.0, self.random.gauss(self.capture_latency, self.capture_jitter)
+                        if self.capture_jitter else self.capture_latency)
+            if self.photos:
+                path = self.photos[self.photo_index % len(self.photos)]
+                self.photo_index += 1
+            else:
+                path = None
+            self.captures_total += 1
+        time.sleep(delay)
+        if path:
+            return path.read_bytes()
+        if self.synthetic is None:
+            self.synthetic = synthetic_jpeg()
+        return self.synthetic
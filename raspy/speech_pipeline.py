@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class SpeechPipeline:
+    """Turn a stream of sentences into audio segments that play in order."""
+
+    def __init__(self, runner, audio_handler, network, lip_sync=None, audio_output=None,
+                 audio_streaming=False, chunk_size=4096):
+        """
+        Args:
+            runner: StageRunner used for blocking stages (playback, combining segments)
+            audio_handler: AudioHandler used to generate and play segments
+            network: NetworkClients; TTS runs on the shared async pools
+            lip_sync: Optional LipSync that streams the loudness envelope during playback
+            audio_output: Optional started AudioOutput; clips are queued on it
+                instead of spawning a player per clip
+            audio_streaming: Play the first segment while it downloads
+                (AudioHandler.stream_audio_async); later segments are generated
+                in full while it plays
+            chunk_size: Download chunk size of the streamed segment in bytes
+        """
+        self.runner = runner
+        self.audio_handler = audio_handler
+        self.network = network
+        self.lip_sync = lip_sync
+        self.audio_output = audio_output
+        self.audio_streaming = audio_streaming
+        self.chunk_size = chunk_size
+
+    @property
+    def queued_output(self):
+        """True if clips go to the persistent output queue."""
+        return bool(self.audio_output and self.audio_output.available)
+
+    @staticmethod
+    async def _drain_async(sentences, queue):
+        """Consume an async sentence generator into the queue."""
+        try:
+            async for sentence in sentences:
+                queue.put_nowait(sentence)
+        finally:
+            queue.put_nowait(None)
+
+    def _generate(self, sentence, mood, segment_name):
+        """Start TTS for one segment and return the pending future."""
+        return asyncio.ensure_future(self.audio_handler.generate_audio_async(
+            sentence, mood, segment_name, self.network
+        )), None
+
+    def _stream(self, sentence, mood, segment_name, wait_for):
+        """
+        Start TTS for a segment that plays while it downloads.
+
+        Returns:
+            (task resolving to the audio path once played, future resolved
+            when the clip is queued on the output or has started)
+        """
+        queued = asyncio.get_running_loop().create_future()
+
+        def on_queued(*_):
+            if not queued.done():
+                queued.set_result(None)
+
+        task = asyncio.ensure_future(self.audio_handler.stream_audio_async(
+            sentence, mood, segment_name, self.network, chunk_size=self.chunk_size,
+            wait_for=wait_for, output=self.audio_output, on_queued=on_queued
+        ))
+        task.add_done_callback(on_queued)
+        return task, queued
+
+    async def play(self, audio_path):
+        """Play a file, with the lip-sync envelope streamed alongside if enabled."""
+        if self.queued_output:
+            clip = self.audio_output.enqueue(audio_path)
+            playing, started = clip.wait(), clip.started
+        else:
+            playing = self.runner.run_io(self.audio_handler.play_audio, audio_path, stage="playback")
+            started = None
+        if not (self.lip_sync and self.lip_sync.enabled):
+            return await playing
+        follower = asyncio.create_task(self._follow(audio_path, started))
+        try:
+            return await playing
+        finally:
+            follower.cancel()
+            await asyncio.gather(follower, return_exceptions=True)
+
+    async def _follow(self, audio_path, started=None):
+        """Stream the envelope from the moment the clip reaches the output."""
+        started_at = await started if started is not None else time.perf_counter()
+        if started_at is not None:
+            await self.lip_sync.follow(audio_path, started_at)
+
+    async def _play_in_order(self, segments, stats, start, lead_in=None, lead_in_done=None):
+        """Play the optional lead-in clip, then generated segments in the order their sentences arrived."""
+        # With the persistent output every clip is queued as soon as it is
+        # ready, so segments play back to back without gaps
+        playing = []
+        if lead_in:
+            if self.queued_output:
+                playing.append(asyncio.ensure_future(self.play(lead_in)))
+            else:
+                await self.play(lead_in)
+        if lead_in_done is not None:
+            lead_in_done.set_result(None)
+        audio_paths = []
+        while True:
+            segment = await segments.get()
+            if segment is None:
+                break
+            task, queued = segment
+            if queued is not None:
+                # Streamed segment: it plays itself while downloading; the next
+                # clip may be queued as soon as this one holds its place
+                with tracing.span("segment.wait", streamed=True):
+                    await queued
+                if stats["first_audio"] is None and not task.done():
+                    stats["first_audio"] = time.perf_counter() - start
+                    logger.info(f"First audio segment streaming after {stats['first_audio']:.2f}s")
+                if self.queued_output:
+                    # Its path is known once it has played
+                    playing.append(task)
+                    audio_paths.append(task)
+                    continue
+            with tracing.span("segment.wait"):
+                audio_path = await task
+            if not audio_path:
+                logger.error("Segment audio generation failed, skipping segment")
+                continue
+            audio_paths.append(audio_path)
+            if queued is not None:
+                continue
+            if stats["first_audio"] is None:
+                stats["first_audio"] = time.perf_counter() - start
+                logger.info(f"First audio segment ready after {stats['first_audio']:.2f}s")
+            if self.queued_output:
+                playing.append(asyncio.ensure_future(self.play(audio_path)))
+            else:
+                await self.play(audio_path)
+        await asyncio.gather(*playing)
+        audio_paths = [path.result() if isinstance(path, asyncio.Future) else path for path in audio_paths]
+        return [path for path in audio_paths if path]
+
+    async def speak(self, sentences, mood, timestamp, lead_in=None):
+        """
+        Generate and play speech for sentences while they are still arriving.
+
+        Each sentence is sent to TTS as soon as it is available. Segments
+        are played strictly in order, while later segments are still being
+        generated. With audio_streaming the first segment starts playing
+        with its first downloaded chunks.
+
+        Args:
+            sentences: Async iterable of sentences (ImageAnalyzer.stream_sentences_async)
+            mood: Mood to use for voice generation
+            timestamp: Timestamp used for naming the audio files
+            lead_in: Optional clip played immediately, ahead of the first segment
+
+        Returns:
+            (full response text, path to the combined audio file or None, stats dict)
+        """
+        start = time.perf_counter()
+        stats = {"first_sentence": None, "first_audio": None, "text_done": None, "segments": 0}
+
+        sentence_queue = asyncio.Queue()
+        segments = asyncio.Queue()
+        lead_in_done = asyncio.get_running_loop().create_future()
+        producer = asyncio.ensure_future(self._drain_async(sentences, sentence_queue))
+        player = asyncio.create_task(self._play_in_order(segments, stats, start, lead_in, lead_in_done))
+
+        texts = []
+        try:
+            while True:
+                sentence = await sentence_queue.get()
+                if sentence is None:
+                    break
+                tracing.mark("sentence.ready", index=len(texts) + 1)
+                if stats["first_sentence"] is None:
+                    stats["first_sentence"] = time.perf_counter() - start
+                    logger.info(f"First sentence after {stats['first_sentence']:.2f}s")
+                texts.append(sentence)
+                segment_name = f"{timestamp}_{len(texts):02d}"
+                if self.audio_streaming and len(texts) == 1:
+                    segments.put_nowait(self._stream(sentence, mood, segment_name, lead_in_done))
+                else:
+                    segments.put_nowait(self._generate(sentence, mood, segment_name))
+            stats["text_done"] = time.perf_counter() - start
+            await producer
+        finally:
+            segments.put_nowait(None)
+            audio_paths = await player
+
+        stats["segments"] = len(audio_paths)
+        audio_path = None
+        if audio_paths:
+            audio_path = await self.runner.run_io(self.combine_segments, audio_paths, timestamp)
+        return " ".join(texts), audio_path, stats
+
+    @staticmethod
+    def combine_segments(audio_paths, timestamp):
+        """
+        Concatenate MP3 segments into one file and remove the segments.
+
+        MP3 is a stream of self-contained frames, so byte concatenation
+        yields a playable file.
+
+        Args:
+            audio_paths: Segment files in playback order
+            timestamp: Timestamp used for naming the combined file
+
+        Returns:
+            Path to the combined audio file
+        """
+        combined_path = f"audio/audio_{timestamp}.mp3"
+        Path(combined_path).parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(combined_path, "wb") as out:
+                for path in audio_paths:
+                    with open(path, "rb") as f:
+                        out.write(f.read())
+            for path in audio_paths:
+                os.remove(path)
+            return combined_path
+        except Exception as e:
+            logger.error(f"Error combining audio segments: {e}")
+            return audio_paths[-1]
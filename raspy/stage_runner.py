@@ -0,0 +1,75 @@
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+
+class StageRunner:
+    """Run blocking pipeline stages in executors so the event loop stays responsive."""
+
+    def __init__(self, io_workers=4):
+        """
+        Args:
+            io_workers: Maximum number of concurrent I/O stages (API calls, file operations)
+        """
+        self.io_executor = ThreadPoolExecutor(
+            max_workers=io_workers,
+            thread_name_prefix="io-stage"
+        )
+        # The camera is not thread-safe, so captures are serialized on a
+        # single dedicated thread. GPIO pins have one owner thread each: the
+        # RangingEngine thread drives TRIG/ECHO and the LedAnimator thread the
+        # RGB pins, so neither waits behind a capture
+        self.hardware_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="hardware"
+        )
+
+    async def _run(self, executor, stage, func, *args, **kwargs):
+        """Run func in the given executor and log how long the stage took."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        # Run with the caller's context (like asyncio.to_thread) so the
+        # active trace reaches the worker thread
+        context = contextvars.copy_context()
+        try:
+            return await loop.run_in_executor(executor, partial(context.run, func, *args, **kwargs))
+        finally:
+            if stage:
+                logger.debug(f"Stage '{stage}' took {time.perf_counter() - start:.2f}s")
+
+    async def run_io(self, func, *args, stage=None, **kwargs):
+        """
+        Run a blocking I/O stage in the bounded thread pool.
+
+        Args:
+            func: Blocking callable
+            stage: Optional stage name for timing logs
+
+        Returns:
+            Return value of func
+        """
+        return await self._run(self.io_executor, stage, func, *args, **kwargs)
+
+    async def run_hardware(self, func, *args, stage=None, **kwargs):
+        """
+        Run a blocking camera stage on the dedicated hardware thread.
+
+        Args:
+            func: Blocking callable
+            stage: Optional stage name for timing logs
+
+        Returns:
+            Return value of func
+        """
+        return await self._run(self.hardware_executor, stage, func, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """Stop both executors."""
+        self.io_executor.shutdown(wait=wait, cancel_futures=True)
+        self.hardware_executor.shutdown(wait=wait, cancel_futures=True)
+        logger.info("Stage runner shut down")
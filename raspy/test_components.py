@@ -130,6 +130,76 @@ def test_sensor_controller():
         return False
 
 
+def test_distance_filter():
+    """Test that noisy readings and no-echo values do not cause false triggers."""
+    logger.info("Testing DistanceFilter / TriggerDetector...")
+    
+    try:
+        from distance_filter import DistanceFilter, TriggerDetector
+        detector = TriggerDetector(
+            arm_threshold=5, disarm_threshold=10, min_dwell=0.3,
+            distance_filter=DistanceFilter(window=5, mode="median")
+        )
+        
+        # Nobody there: far readings with single outliers and missing echoes
+        idle = [80, 3, 82, -1, None, 79, 2, 81, 80, 78]
+        # Someone covers the sensor, then leaves
+        covered = [3, 2, 3, 2, 3, 2, 3, 2, 3, 2]
+        left = [60, 70, 80, 80, 80]
+        
+        triggers = 0
+        for i, distance in enumerate(idle + covered + left + covered):
+            if detector.update(distance, i * 0.1):
+                triggers += 1
+        
+        if triggers != 2:
+            logger.error(f"  ❌ Expected 2 triggers, got {triggers}")
+            return False
+        logger.info(f"  ✓ Outliers and no-echo readings ignored")
+        logger.info(f"  ✓ One trigger per approach (hysteresis)")
+        return True
+    except Exception as e:
+        logger.error(f"  ❌ {e}")
+        return False
+
+
+def test_simulator():
+    """Test that a scripted trace replays deterministically and captures are JPEGs."""
+    logger.info("Testing HardwareSimulator...")
+    
+    try:
+        from distance_filter import DistanceFilter, TriggerDetector
+        from simulator import HardwareSimulator, scripted_trace
+        segments = [(80, 1.0), (3, 1.0), (None, 0.5), (80, 1.0), (3, 1.0)]
+        trace = scripted_trace(segments, interval=0.1, noise=1.0, seed=7)
+        if trace != scripted_trace(segments, interval=0.1, noise=1.0, seed=7):
+            logger.error("  ❌ Scripted trace is not deterministic")
+            return False
+        
+        simulator = HardwareSimulator(trace, loop=False, capture_latency=0, capture_jitter=0)
+        detector = TriggerDetector(
+            arm_threshold=5, disarm_threshold=10, min_dwell=0.3,
+            distance_filter=DistanceFilter(window=5, mode="median")
+        )
+        triggers = sum(
+            detector.update(simulator.distance_at(i * 0.1), i * 0.1) for i in range(len(trace))
+        )
+        if triggers != 2:
+            logger.error(f"  ❌ Expected 2 triggers, got {triggers}")
+            return False
+        logger.info(f"  ✓ Scripted trace replays to {triggers} triggers")
+        
+        photo = simulator.capture_jpeg()
+        if not photo.startswith(b"\xff\xd8"):
+            logger.error("  ❌ Capture is not a JPEG")
+            return False
+        logger.info(f"  ✓ Simulated capture: {len(photo)} bytes")
+        return True
+    except Exception as e:
+        logger.error(f"  ❌ {e}")
+        return False
+
+
 def test_image_analyzer():
     """Test that image analyzer can be instantiated."""
     logger.info("Testing ImageAnalyzer...")
@@ -177,6 +247,33 @@ def test_serial_handler():
         return False
 
 
+def test_serial_protocol():
+    """Test that frames survive chunking, mixed text and corrupted bytes."""
+    logger.info("Testing serial frame protocol...")
+    
+    try:
+        import serial_protocol as protocol
+        frame = protocol.encode_frame(protocol.MOOD, 7, protocol.mood_payload("bored"))
+        corrupted = bytearray(frame)
+        corrupted[4] ^= 0x01
+        stream = b"boot\n" + bytes(corrupted) + frame + b"ok\n"
+        
+        decoder = protocol.FrameDecoder()
+        events = []
+        for i in range(len(stream)):
+            events += decoder.feed(stream[i:i + 1])
+        
+        frames = [e for e in events if isinstance(e, protocol.Frame)]
+        if frames != [protocol.Frame(protocol.MOOD, 7, b"\x04")] or decoder.crc_errors != 1:
+            logger.error(f"  ❌ Unexpected decode result: {events}")
+            return False
+        logger.info(f"  ✓ Frame decoded byte by byte, corrupted frame rejected")
+        return True
+    except Exception as e:
+        logger.error(f"  ❌ {e}")
+        return False
+
+
 def main():
     """Run all tests."""
     logger.info("=" * 60)
@@ -189,9 +286,12 @@ def main():
         ("Custom Modules", test_custom_modules),
         ("Directories", test_directories),
         ("SensorController", test_sensor_controller),
+        ("DistanceFilter", test_distance_filter),
+        ("HardwareSimulator", test_simulator),
         ("ImageAnalyzer", test_image_analyzer),
         ("AudioHandler", test_audio_handler),
         ("SerialHandler", test_serial_handler),
+        ("Serial Protocol", test_serial_protocol),
     ]
     
     results = []
@@ -0,0 +1,94 @@
+import os
+import random
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Short filler phrases played while the photo is being analyzed
+THINKING_PHRASES = {
+    "happy": [
+        "Oh, lass mich mal sehen…",
+        "Hmm, einen Moment, das schaue ich mir genauer an…",
+        "Oh, wie schön! Moment…",
+    ],
+    "flirty": [
+        "Oh là là, lass mich genauer hinschauen…",
+        "Hmm, wen haben wir denn da…",
+        "Moment, da muss ich zweimal hinsehen…",
+    ],
+    "angry": [
+        "Na, was haben wir denn da…",
+        "Ugh. Moment mal…",
+        "Oh nein. Lass mich das erst verarbeiten…",
+    ],
+    "bored": [
+        "Hmm… na gut, ich schau mal.",
+        "Jaja, Moment…",
+        "Muss das sein? Na schön…",
+    ],
+}
+
+
+class ThinkingClips:
+    """Pre-rendered mood-specific filler clips that mask API latency."""
+
+    def __init__(self, clip_dir="audio/thinking"):
+        """
+        Args:
+            clip_dir: Directory the rendered clips are kept in
+        """
+        self.clip_dir = Path(clip_dir)
+        self.last_clip = {}
+
+    def clip_path(self, mood, index):
+        return self.clip_dir / f"{mood}_{index}.mp3"
+
+    async def prepare(self, audio_handler, network):
+        """
+        Render missing clips once through the regular TTS path.
+
+        Existing clips are kept, so this only costs API calls on the first
+        start (or after phrases were added).
+
+        Args:
+            audio_handler: AudioHandler used for generation
+            network: NetworkClients instance
+        """
+        self.clip_dir.mkdir(parents=True, exist_ok=True)
+        rendered = 0
+        for mood, phrases in THINKING_PHRASES.items():
+            for index, phrase in enumerate(phrases):
+                path = self.clip_path(mood, index)
+                if path.exists():
+                    continue
+                # Not hedged: startup renders would skew the runtime latency stats
+                audio_path = await audio_handler.generate_audio_async(
+                    phrase, mood, f"thinking_{mood}_{index}", network, hedged=False
+                )
+                if audio_path:
+                    os.replace(audio_path, path)
+                    rendered += 1
+                else:
+                    logger.warning(f"Could not render thinking clip: {mood}/{index}")
+        logger.info(f"Thinking clips ready ({rendered} newly rendered)")
+
+    def pick(self, mood):
+        """
+        Choose a clip for the mood, avoiding the one played last time.
+
+        Returns:
+            Path to the clip or None if none is available
+        """
+        clips = [
+            str(self.clip_path(mood, index))
+            for index in range(len(THINKING_PHRASES.get(mood, [])))
+            if self.clip_path(mood, index).exists()
+        ]
+        if not clips:
+            return None
+        if len(clips) > 1 and self.last_clip.get(mood) in clips:
+            clips.remove(self.last_clip[mood])
+        clip = random.choice(clips)
+        self.last_clip[mood] = clip
+        return clip
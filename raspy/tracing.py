@@ -0,0 +1,122 @@
+"""
+Per-trigger span tracing.
+
+start_trace() begins a trace for the current task; span() and mark() record
+into it from any task or stage started from there, and are no-ops without
+an active trace. main.py writes one Chrome trace-event JSON per trigger to
+TRACE_DIR; open it in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Trace of the trigger being processed. Tasks inherit it, StageRunner stages
+# and asyncio.to_thread run with a copy of it; without an active trace every
+# span is a no-op.
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Spans of one trigger, exported as Chrome trace-event JSON."""
+
+    def __init__(self, name):
+        self.name = name
+        self.origin_ns = time.perf_counter_ns()
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def _thread_id(self):
+        """Track id for the caller: its thread, or its task on the event loop."""
+        thread = threading.current_thread()
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        # Concurrent tasks get their own tracks so their spans do not overlap
+        track, name = (id(task), f"{thread.name}/{task.get_name()}") if task else (thread.ident, thread.name)
+        with self.lock:
+            if track not in self.threads:
+                self.threads[track] = name
+        return track
+
+    def add_complete(self, name, start_ns, end_ns, **args):
+        """Add a span that started and ended at the given perf_counter_ns values."""
+        event = {
+            "name": name, "ph": "X", "pid": os.getpid(), "tid": self._thread_id(),
+            "ts": (start_ns - self.origin_ns) / 1000, "dur": (end_ns - start_ns) / 1000,
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def add_instant(self, name, **args):
+        """Add a point-in-time event (e.g. first token)."""
+        event = {
+            "name": name, "ph": "i", "s": "t", "pid": os.getpid(), "tid": self._thread_id(),
+            "ts": (time.perf_counter_ns() - self.origin_ns) / 1000,
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def to_json(self):
+        """Chrome trace-event format (chrome://tracing, Perfetto)."""
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+            for tid, name in self.threads.items()
+        ]
+        return {"traceEvents": metadata + sorted(self.events, key=lambda e: e["ts"]),
+                "displayTimeUnit": "ms", "otherData": {"trigger": self.name}}
+
+    def save(self, trace_dir, keep=50):
+        """
+        Write the trace to <trace_dir>/trace_<name>.json and keep only the newest files.
+
+        Returns:
+            Path of the written file
+        """
+        Path(trace_dir).mkdir(parents=True, exist_ok=True)
+        path = Path(trace_dir) / f"trace_{self.name}.json"
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f)
+        for old in sorted(Path(trace_dir).glob("trace_*.json"))[:-keep]:
+            old.unlink()
+        return str(path)
+
+
+def start_trace(name):
+    """Begin a trace for the current task and everything it starts."""
+    trace = Trace(name)
+    current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def span(name, **args):
+    """Time the enclosed block as a span of the active trace."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        trace.add_complete(name, start, time.perf_counter_ns(), **args)
+
+
+def mark(name, **args):
+    """Record an instant event in the active trace."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_instant(name, **args)